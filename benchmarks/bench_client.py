@@ -0,0 +1,190 @@
+"""
+Client-side benchmark suite run against the local stand-in Cape server from the tests.
+
+Measures answer throughput and latency at several concurrency levels, the cost of paging through documents, upload
+throughput and peak client memory, and the client CPU time spent per call. The server runs in-process with a
+configurable latency added to every request, and the size and number of the documents served are configurable.
+Uploads are sent to the discarding sink server from bench_upload_memory.py instead, so only the client's memory is
+measured.
+
+Every result is printed as a JSON line (and optionally appended to a file) for regression tracking, starting with a
+record describing the environment.
+
+Usage: python benchmarks/bench_client.py [--latency 0.005] [--concurrency 1,4,16,64] [--only answer,pagination]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_upload_memory import SinkHandler, SinkServer  # noqa: E402
+from cape.client import CapeClient, RetryPolicy  # noqa: E402
+from cape.client.utils import JSON_BACKEND  # noqa: E402
+from tests.local_server import LocalCapeServer, USERNAME, PASSWORD  # noqa: E402
+
+# time.thread_time() needs Python 3.7, before that the CPU time of the in-process server's threads is included.
+CPU_CLOCK = 'thread_time' if hasattr(time, 'thread_time') else 'process_time'
+cpu_time = getattr(time, CPU_CLOCK)
+SENTENCE = 'The Cape API answers questions about your documents quickly and accurately. '
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def seed_documents(server, count, size):
+    text = (SENTENCE * (size // len(SENTENCE) + 1))[:size]
+    for i in range(count):
+        server.state.add_document({'title': 'document%d.txt' % i, 'text': text, 'documentId': 'document%d' % i},
+                                  None)
+
+
+def start_server(latency, documents=0, document_size=0):
+    server = LocalCapeServer(latency=latency).start()
+    seed_documents(server, documents, document_size)
+    client = CapeClient(server.api_base, retry_policy=RetryPolicy(max_attempts=1))
+    client.login(USERNAME, PASSWORD)
+    return server, client
+
+
+def bench_answer(args, emit):
+    server, client = start_server(args.latency, args.answer_documents, args.document_size)
+    try:
+        for concurrency in args.concurrency:
+            requests = max(args.requests, concurrency * 4)
+            latencies = []
+            lock = threading.Lock()
+
+            def answer(_):
+                started = time.perf_counter()
+                client.answer('How quickly does the Cape API answer questions?')
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(answer, range(requests)))
+            elapsed = time.perf_counter() - started
+            emit({'benchmark': 'answer_throughput', 'concurrency': concurrency, 'requests': requests,
+                  'seconds': elapsed, 'requests_per_second': requests / elapsed,
+                  'latency_p50': percentile(latencies, 0.5), 'latency_p95': percentile(latencies, 0.95),
+                  'latency_p99': percentile(latencies, 0.99)})
+    finally:
+        server.stop()
+
+
+def bench_pagination(args, emit):
+    server, client = start_server(args.latency, args.documents, args.document_size)
+    try:
+        for name, fetch in (('iter_documents', lambda: list(client.iter_documents(page_size=args.page_size,
+                                                                                  prefetch=1))),
+                            ('fetch_all_documents', lambda: client.fetch_all_documents(page_size=args.page_size,
+                                                                                       max_concurrency=8))):
+            calls = len(server.state.calls)
+            started = time.perf_counter()
+            cpu_started = cpu_time()
+            items = fetch()
+            cpu = cpu_time() - cpu_started
+            elapsed = time.perf_counter() - started
+            assert len(items) == args.documents
+            emit({'benchmark': 'pagination', 'method': name, 'items': len(items), 'page_size': args.page_size,
+                  'document_size': args.document_size, 'pages': len(server.state.calls) - calls,
+                  'seconds': elapsed, 'items_per_second': len(items) / elapsed, 'caller_cpu_seconds': cpu})
+    finally:
+        server.stop()
+
+
+def bench_upload(args, emit):
+    # Uploads go to a sink which discards the body as it arrives, so the peak memory measured is the client's own.
+    sink = SinkServer(('127.0.0.1', 0), SinkHandler)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    client = CapeClient('http://127.0.0.1:%d/api' % sink.server_address[1], admin_token='benchmark')
+    try:
+        size = args.upload_mb * 1024 * 1024
+        data = (SENTENCE.encode('utf-8') * (size // len(SENTENCE) + 1))[:size]
+        for source, text in (('bytes', data), ('text', data.decode('utf-8'))):
+            tracemalloc.start()
+            started = time.perf_counter()
+            client.add_document('Upload', text)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            emit({'benchmark': 'upload', 'source': source, 'document_bytes': size, 'seconds': elapsed,
+                  'throughput_mb_s': args.upload_mb / elapsed, 'peak_client_bytes': peak})
+    finally:
+        sink.shutdown()
+        sink.server_close()
+
+
+def bench_cpu(args, emit):
+    server, client = start_server(0.0, args.answer_documents, args.document_size)
+    try:
+        for name, call in (('get_profile', client.get_profile),
+                           ('get_documents', lambda: client.get_documents(number_of_items=args.page_size)),
+                           ('answer', lambda: client.answer('How quickly does the Cape API answer questions?'))):
+            call()
+            samples = []
+            for _ in range(args.cpu_calls):
+                started = cpu_time()
+                call()
+                samples.append(cpu_time() - started)
+            emit({'benchmark': 'client_cpu', 'method': name, 'calls': args.cpu_calls,
+                  'cpu_seconds_mean': statistics.mean(samples), 'cpu_seconds_p95': percentile(samples, 0.95)})
+    finally:
+        server.stop()
+
+
+BENCHMARKS = {'answer': bench_answer, 'pagination': bench_pagination, 'upload': bench_upload, 'cpu': bench_cpu}
+
+
+def integers(value):
+    return [int(part) for part in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='Comma separated benchmarks to run.')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds added to every request.')
+    parser.add_argument('--concurrency', type=integers, default=[1, 4, 16, 64], help='Answer concurrency levels.')
+    parser.add_argument('--requests', type=int, default=200, help='Answer requests per concurrency level.')
+    parser.add_argument('--answer-documents', type=int, default=5, help='Documents searched by each answer.')
+    parser.add_argument('--documents', type=int, default=2000, help='Documents to page through.')
+    parser.add_argument('--document-size', type=int, default=2000, help='Characters per document.')
+    parser.add_argument('--page-size', type=int, default=100, help='Documents per page.')
+    parser.add_argument('--upload-mb', type=int, default=20, help='Size of the uploaded document.')
+    parser.add_argument('--cpu-calls', type=int, default=200, help='Calls measured per method for client CPU.')
+    parser.add_argument('--output', help='A file to append the JSON lines to.')
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'a') if args.output else None
+
+    def emit(result):
+        line = json.dumps({name: round(value, 6) if isinstance(value, float) else value
+                           for name, value in result.items()})
+        print(line)
+        if output is not None:
+            output.write(line + '\n')
+
+    try:
+        emit({'benchmark': 'environment', 'timestamp': int(time.time()), 'python': platform.python_version(),
+              'platform': platform.platform(), 'json_backend': JSON_BACKEND, 'latency': args.latency,
+              'cpu_clock': CPU_CLOCK})
+        for name in args.only.split(','):
+            BENCHMARKS[name](args, emit)
+    finally:
+        if output is not None:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark of the CPU spent decoding API responses.
+
+Compares decoding a get_documents() style response twice with the standard library (what every call used to do) with
+decoding it once using the backend selected by cape.client.utils.json_loads.
+
+Usage: python benchmarks/bench_json_decode.py [number_of_items] [document_size]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cape.client.utils import json_loads, JSON_BACKEND  # noqa: E402
+
+
+def documents_response(number_of_items, document_size):
+    items = [{'id': '%064x' % i,
+              'title': 'document%d.txt' % i,
+              'origin': 'document%d.txt' % i,
+              'text': 'x' * document_size,
+              'created': 1508169352 + i} for i in range(number_of_items)]
+    return json.dumps({'success': True, 'result': {'totalItems': number_of_items, 'items': items}}).encode('utf-8')
+
+
+def main(number_of_items=30, document_size=10000, repeat=5):
+    body = documents_response(number_of_items, document_size)
+    number = max(1, int(2e7 // len(body)))
+
+    def decode_twice():
+        json.loads(body)['success']
+        json.loads(body)['result']
+
+    def decode_once():
+        json_loads(body)['result']
+
+    twice = min(timeit.repeat(decode_twice, number=number, repeat=repeat)) / number
+    once = min(timeit.repeat(decode_once, number=number, repeat=repeat)) / number
+    print(json.dumps({'benchmark': 'json_decode',
+                      'backend': JSON_BACKEND,
+                      'body_bytes': len(body),
+                      'decode_twice_us': round(twice * 1e6, 2),
+                      'decode_once_us': round(once * 1e6, 2),
+                      'saved_us_per_call': round((twice - once) * 1e6, 2)}))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
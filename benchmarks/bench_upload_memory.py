@@ -0,0 +1,103 @@
+"""
+Memory benchmark for document uploads.
+
+Uploads a generated document to a local sink server, which discards the request body, and reports the peak memory
+allocated by the client while doing so. The document is uploaded from a file path, a binary file object, bytes and a
+string.
+
+Usage: python benchmarks/bench_upload_memory.py [size_in_mb]
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cape.client import CapeClient  # noqa: E402
+
+SINK_RESPONSE = json.dumps({'success': True, 'result': {'documentId': 'benchmark'}}).encode('utf-8')
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _discard_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                self.rfile.read(size + 2)
+                if size == 0:
+                    break
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining:
+                remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+
+    def do_POST(self):
+        self._discard_body()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(SINK_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(SINK_RESPONSE)
+
+
+class SinkServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer needs Python 3.7
+    daemon_threads = True
+
+
+def measure(upload):
+    tracemalloc.start()
+    start = time.time()
+    upload()
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main(size_in_mb=100):
+    server = SinkServer(('127.0.0.1', 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cc = CapeClient('http://127.0.0.1:%d/api' % server.server_address[1], admin_token='benchmark')
+    size = size_in_mb * 1024 * 1024
+    fd, file_path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            line = b'Hello! This is a large example file!\n'
+            for _ in range(size // len(line)):
+                fh.write(line)
+        with open(file_path, 'rb') as fh:
+            data = fh.read()
+        text = data.decode('utf-8')
+
+        def upload_file_object():
+            with open(file_path, 'rb') as fh:
+                cc.add_document('Benchmark', fh)
+
+        uploads = [('file_path', lambda: cc.add_document('Benchmark', file_path=file_path)),
+                   ('file_object', upload_file_object),
+                   ('bytes', lambda: cc.add_document('Benchmark', data)),
+                   ('text', lambda: cc.add_document('Benchmark', text))]
+        for name, upload in uploads:
+            peak, elapsed = measure(upload)
+            print(json.dumps({'benchmark': 'upload_memory', 'source': name, 'document_bytes': len(data),
+                              'peak_client_bytes': peak, 'seconds': round(elapsed, 3),
+                              'throughput_mb_s': round(size_in_mb / elapsed, 1)}))
+    finally:
+        os.remove(file_path)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -4,4 +4,17 @@ Cape API client module.
 This module provides a python interface to the Cape API: http://thecape.ai
 """
 from .client import CapeClient
-from .exceptions import CapeException
+from .async_client import AsyncCapeClient
+from .cache import AnswerCache
+from .disk_cache import DiskAnswerCache
+from .exceptions import CapeException, CapeTransportError, CircuitOpenError
+from .retry import RetryPolicy, CircuitBreaker
+from .hedging import HedgePolicy
+from .metrics import MetricsSink, InMemoryMetrics, PrometheusMetrics, StatsdMetrics
+from .tracing import Tracer, OpenTelemetryTracer
+from .recording import TrafficRecorder, TrafficReplayer
+from .replica import LocalReplica
+from .coalescing import SingleFlight
+from .throttling import RateLimiter, AIMDLimiter
+from .scheduling import PriorityScheduler
+from .routing import EndpointRouter
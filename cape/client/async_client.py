@@ -0,0 +1,631 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import time
+from .client import API_VERSION, prepare_request, transport_response, answer_parameters, answer_many_arguments, \
+    inbox_parameters, saved_replies_parameters, documents_parameters, add_annotation_parameters, annotations_parameters
+from .exceptions import CapeException, CapeTransportError, CircuitOpenError
+from .hedging import ahedged_call
+from .instrumentation import observe_call
+from .pagination import aiterate_pages, afetch_all_pages
+from .retry import RetryPolicy
+from .sharding import merge_answer_items, shard_document_ids
+from .streaming import MultipartStream
+from .tracing import aiohttp_trace_config
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+async def _stream_body(stream):
+    # Producing a chunk may read from a file, so it's done in the default executor instead of blocking the event loop.
+    loop = asyncio.get_event_loop()
+    chunks = iter(stream)
+    while True:
+        if stream.len is not None and stream.bytes_read >= stream.len:
+            # Only the end of the stream is left, which reads nothing, and finishing it at once keeps its timings.
+            chunk = next(chunks, None)
+        else:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            break
+        yield chunk
+
+
+class AsyncCapeClient:
+    """
+        The AsyncCapeClient provides awaitable access to all methods of the Cape API.
+
+        All requests share a single pooled aiohttp session which is created on first use and released by
+        :meth:`close` (or by using the client as an asynchronous context manager).
+    """
+
+    def __init__(self, api_base, admin_token=None, connection_limit=100, retry_policy=None, circuit_breaker=None,
+                 hedge_policy=None, metrics=None, tracer=None, recorder=None, replayer=None, rate_limiter=None,
+                 concurrency_limiter=None):
+        """
+
+        :param api_base: The URL to send API requests to.
+        :param admin_token: An admin token to authenticate with.
+        :param connection_limit: The maximum number of simultaneous connections to keep open.
+        :param retry_policy: A RetryPolicy deciding which calls are retried after transient failures (Default: reads and answer() are attempted up to 3 times).
+        :param circuit_breaker: A CircuitBreaker to fail calls fast while the API is unavailable (Default: no breaker).
+        :param hedge_policy: A HedgePolicy for sending duplicate answer() requests when the first is slow (Default: no hedging).
+        :param metrics: A MetricsSink to report the latency, size and outcome of every API call to (Default: no metrics).
+        :param tracer: A Tracer to call as every API call starts and finishes (Default: no tracing).
+        :param recorder: A TrafficRecorder to record every API call and its response to.
+        :param replayer: A TrafficReplayer to serve recorded responses from instead of calling the API.
+        :param rate_limiter: A RateLimiter pacing the calls made to each API method (Default: no rate limit).
+        :param concurrency_limiter: An AIMDLimiter adapting the number of calls in progress to the API's load (Default: no limit).
+        """
+        if aiohttp is None:
+            raise CapeException("The AsyncCapeClient requires the 'aiohttp' package to be installed.")
+        self.api_base = "%s/%s" % (api_base, API_VERSION)
+        self.connection_limit = connection_limit
+        self.session = None
+        self.session_cookie = False
+        self.admin_token = admin_token
+        self.user_token = None
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.hedge_policy = hedge_policy
+        self.metrics = metrics
+        self.tracer = tracer
+        self.recorder = recorder
+        self.replayer = replayer
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the underlying HTTP session and any pooled connections.
+
+        :return:
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            # Cookies are passed explicitly with each request, exactly as CapeClient does.
+            trace_configs = [aiohttp_trace_config()] if self.tracer is not None else None
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connection_limit),
+                                                 cookie_jar=aiohttp.DummyCookieJar(), trace_configs=trace_configs)
+        return self.session
+
+    async def _raw_api_call(self, method, parameters=None, monitor_callback=None):
+        url, parameters = prepare_request(self.api_base, self.admin_token, method, parameters)
+        retry = self.retry_policy.can_retry(method, parameters)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._limited_send(method, url, parameters, monitor_callback)
+            except CapeTransportError as e:
+                delay = None
+                if retry and self.retry_policy.is_transient(e):
+                    delay = self.retry_policy.next_delay(attempt, started, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def _limited_send(self, method, url, parameters, monitor_callback):
+        """
+        Make a single attempt at an API call once the rate and concurrency limiters allow it.
+        """
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.reserve(method)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if self.concurrency_limiter is None:
+            return await self._send(method, url, parameters, monitor_callback)
+        await self.concurrency_limiter.aacquire()
+        started = time.monotonic()
+        latency = error = None
+        try:
+            response = await self._send(method, url, parameters, monitor_callback)
+        except CircuitOpenError:
+            raise
+        except CapeTransportError as e:
+            latency, error = time.monotonic() - started, e
+            raise
+        except CapeException:
+            # An error returned by the API still shows how quickly it's responding.
+            latency = time.monotonic() - started
+            raise
+        else:
+            latency = time.monotonic() - started
+            return response
+        finally:
+            self.concurrency_limiter.release(method, latency, error)
+
+    async def _send(self, method, url, parameters, monitor_callback):
+        with observe_call(self.metrics, self.tracer, method, url, parameters) as call:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                if self.replayer is not None:
+                    entry, delay = self.replayer.next_response(method, parameters)
+                    await asyncio.sleep(delay)
+                    status_code, content, retry_after, cookies = self.replayer.response(entry)
+                else:
+                    status_code, content, retry_after, cookies = await self._exchange(call, method, url, parameters,
+                                                                                      monitor_callback)
+                call.status_code = status_code
+                call.response_bytes = len(content)
+                decode_started = time.perf_counter()
+                response = transport_response(status_code, content, retry_after, cookies, self.retry_policy)
+                call.add_phase('decode', time.perf_counter() - decode_started)
+            except CapeTransportError:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                raise
+            except BaseException:
+                # Anything else (including cancellation) says nothing about the API, but mustn't leave a probe pending.
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_abandoned()
+                raise
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            return response.raise_for_failure()
+
+    async def _exchange(self, call, method, url, parameters, monitor_callback):
+        session = self._get_session()
+        cookies = {'session': self.session_cookie} if self.session_cookie else None
+        headers = dict(call.headers)
+        trace_request_ctx = call if self.tracer is not None else None
+        try:
+            if parameters:
+                # The transport may hold on to chunks after they're written, so file contents can't share a buffer.
+                m = call.body = MultipartStream(parameters, callback=monitor_callback, reuse_buffer=False)
+                headers['Content-Type'] = m.content_type
+                if m.len is not None:
+                    headers['Content-Length'] = str(m.len)
+                request = session.post(url, data=_stream_body(m), cookies=cookies, headers=headers,
+                                       trace_request_ctx=trace_request_ctx)
+            else:
+                request = session.get(url, cookies=cookies, headers=headers, trace_request_ctx=trace_request_ctx)
+            async with request as r:
+                headers_at = time.perf_counter()
+                content = await r.read()
+            call.record_exchange(headers_at, time.perf_counter())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if self.recorder is not None:
+                self.recorder.record(method, parameters, time.perf_counter() - call.started, error=str(e))
+            raise CapeTransportError('Unable to reach the Cape API: %s' % e,
+                                     connect_failed=isinstance(e, aiohttp.ClientConnectorError)) from e
+        exchange = (r.status, content, r.headers.get('Retry-After'),
+                    {name: morsel.value for name, morsel in r.cookies.items()})
+        if self.recorder is not None:
+            self.recorder.record(method, parameters, time.perf_counter() - call.started, *exchange)
+        return exchange
+
+    async def login(self, login, password):
+        """
+        Log in to the Cape API as an AI builder, see :meth:`CapeClient.login`.
+        """
+        r = await self._raw_api_call('user/login', {'login': login, 'password': password})
+        self.session_cookie = r.cookies['session']
+
+    def logged_in(self):
+        """
+        Reports whether we're currently logged in.
+
+        :return: Whether we're logged in or not.
+        """
+        return self.session_cookie != False or self.admin_token != None
+
+    async def logout(self):
+        """
+        Log out and clear the current session cookie, see :meth:`CapeClient.logout`.
+        """
+        await self._raw_api_call('user/logout')
+        self.session_cookie = False
+        self.user_token = None
+
+    async def get_admin_token(self):
+        """
+        Retrieve the admin token for the currently logged in user, see :meth:`CapeClient.get_admin_token`.
+        """
+        r = await self._raw_api_call('user/get-admin-token')
+        return r.result['adminToken']
+
+    async def get_user_token(self):
+        """
+        Retrieve a user token suitable for making 'answer' requests, see :meth:`CapeClient.get_user_token`.
+        """
+        r = await self._raw_api_call('user/get-user-token')
+        return r.result['userToken']
+
+    async def get_profile(self):
+        """
+        Retrieve the current user's profile, see :meth:`CapeClient.get_profile`.
+        """
+        r = await self._raw_api_call('user/get-profile')
+        return r.result
+
+    async def get_default_threshold(self):
+        """
+        Retrieve the default threshold, see :meth:`CapeClient.get_default_threshold`.
+        """
+        r = await self._raw_api_call('user/get-default-threshold')
+        return r.result['threshold']
+
+    async def set_default_threshold(self, threshold):
+        """
+        Set the default threshold, see :meth:`CapeClient.set_default_threshold`.
+        """
+        r = await self._raw_api_call('user/set-default-threshold', {'threshold': threshold})
+        return r.result['threshold']
+
+    async def set_forward_email(self, email):
+        """
+        Set the forward email address, see :meth:`CapeClient.set_forward_email`.
+        """
+        r = await self._raw_api_call('user/set-forward-email', {'email': email})
+        return r.result['forwardEmail']
+
+    async def answer(self, question, user_token=None, threshold=None, document_ids=None,
+                     source_type='all', speed_or_accuracy='balanced', number_of_items=1, offset=0,
+                     text=None, shard_size=None, max_concurrency=8):
+        """
+        Provide a list of answers to a given question, see :meth:`CapeClient.answer`.
+        """
+        params = answer_parameters(question, user_token, threshold, document_ids, source_type, speed_or_accuracy,
+                                   number_of_items, offset, text, self.logged_in())
+        if shard_size is not None and document_ids is not None and len(document_ids) > shard_size:
+            shards = shard_document_ids(document_ids, shard_size)
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def answer_shard(index):
+                async with semaphore:
+                    return await self.answer(question, user_token, threshold, shards[index], source_type,
+                                             speed_or_accuracy, int(offset) + int(number_of_items), 0,
+                                             text if index == len(shards) - 1 else None)
+
+            item_lists = await asyncio.gather(*[answer_shard(index) for index in range(len(shards))])
+            return merge_answer_items(item_lists, number_of_items, offset)
+        if self.hedge_policy is None:
+            r = await self._raw_api_call('answer', params)
+        else:
+            r = await ahedged_call(self.hedge_policy, lambda: self._raw_api_call('answer', dict(params)))
+        return r.result['items']
+
+    async def answer_many(self, questions, user_token=None, threshold=None, document_ids=None, source_type='all',
+                          speed_or_accuracy='balanced', number_of_items=1, offset=0, text=None, max_concurrency=8):
+        """
+        Answer a batch of questions concurrently, see :meth:`CapeClient.answer_many`.
+        """
+        arguments = answer_many_arguments(questions, user_token=user_token, threshold=threshold,
+                                          document_ids=document_ids, source_type=source_type,
+                                          speed_or_accuracy=speed_or_accuracy, number_of_items=number_of_items,
+                                          offset=offset, text=text)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def answer_one(kwargs):
+            async with semaphore:
+                try:
+                    return {'question': kwargs['question'], 'answers': await self.answer(**kwargs), 'error': None}
+                except Exception as e:
+                    return {'question': kwargs['question'], 'answers': None, 'error': e}
+
+        return await asyncio.gather(*[answer_one(kwargs) for kwargs in arguments])
+
+    async def get_inbox(self, read='both', answered='both', search_term='', number_of_items=30, offset=0):
+        """
+        Retrieve the items in the current user's inbox, see :meth:`CapeClient.get_inbox`.
+        """
+        r = await self._raw_api_call('inbox/get-inbox',
+                                     inbox_parameters(read, answered, search_term, number_of_items, offset))
+        return r.result
+
+    def iter_inbox(self, read='both', answered='both', search_term='', page_size=30, prefetch=1):
+        """
+        Asynchronously iterate over all of the items in the inbox, see :meth:`CapeClient.iter_inbox`.
+        """
+        return aiterate_pages(lambda number_of_items, offset: self.get_inbox(read, answered, search_term,
+                                                                             number_of_items, offset),
+                              page_size, prefetch)
+
+    async def fetch_all_inbox(self, read='both', answered='both', search_term='', page_size=100, max_concurrency=8):
+        """
+        Retrieve the current user's inbox items concurrently, see :meth:`CapeClient.fetch_all_inbox`.
+        """
+        return await afetch_all_pages(lambda number_of_items, offset: self.get_inbox(read, answered, search_term,
+                                                                                     number_of_items, offset),
+                                      page_size, max_concurrency)
+
+    async def mark_inbox_read(self, inbox_id):
+        """
+        Mark an inbox item as having been read, see :meth:`CapeClient.mark_inbox_read`.
+        """
+        r = await self._raw_api_call('inbox/mark-inbox-read', {'inboxId': str(inbox_id)})
+        return r.result['inboxId']
+
+    async def archive_inbox(self, inbox_id):
+        """
+        Archive an inbox item, see :meth:`CapeClient.archive_inbox`.
+        """
+        r = await self._raw_api_call('inbox/archive-inbox', {'inboxId': str(inbox_id)})
+        return r.result['inboxId']
+
+    async def get_saved_replies(self, search_term='', saved_reply_ids=None, number_of_items=30, offset=0):
+        """
+        Retrieve a list of saved replies, see :meth:`CapeClient.get_saved_replies`.
+        """
+        params = saved_replies_parameters(search_term, saved_reply_ids, number_of_items, offset)
+        r = await self._raw_api_call('saved-replies/get-saved-replies', params)
+        return r.result
+
+    def iter_saved_replies(self, search_term='', saved_reply_ids=None, page_size=30, prefetch=1):
+        """
+        Asynchronously iterate over all saved replies, see :meth:`CapeClient.iter_saved_replies`.
+        """
+        return aiterate_pages(lambda number_of_items, offset: self.get_saved_replies(search_term, saved_reply_ids,
+                                                                                     number_of_items, offset),
+                              page_size, prefetch)
+
+    async def fetch_all_saved_replies(self, search_term='', saved_reply_ids=None, page_size=100, max_concurrency=8):
+        """
+        Retrieve all saved replies concurrently, see :meth:`CapeClient.fetch_all_saved_replies`.
+        """
+        return await afetch_all_pages(lambda number_of_items, offset: self.get_saved_replies(search_term,
+                                                                                             saved_reply_ids,
+                                                                                             number_of_items, offset),
+                                      page_size, max_concurrency)
+
+    async def create_saved_reply(self, question, answer):
+        return await self.add_saved_reply(question, answer)
+
+    async def add_saved_reply(self, question, answer, replace=False):
+        """
+        Create a new saved reply, see :meth:`CapeClient.add_saved_reply`.
+        """
+        r = await self._raw_api_call('saved-replies/add-saved-reply', {'question': question,
+                                                                       'answer': answer,
+                                                                       'replace': str(replace)})
+        return r.result
+
+    async def delete_saved_reply(self, reply_id):
+        """
+        Delete a saved reply, see :meth:`CapeClient.delete_saved_reply`.
+        """
+        r = await self._raw_api_call('saved-replies/delete-saved-reply', {'replyId': str(reply_id)})
+        return r.result['replyId']
+
+    async def add_paraphrase_question(self, reply_id, question):
+        """
+        Add a new paraphrase question to an existing saved reply, see :meth:`CapeClient.add_paraphrase_question`.
+        """
+        r = await self._raw_api_call('saved-replies/add-paraphrase-question',
+                                     {'replyId': str(reply_id), 'question': question})
+        return r.result['questionId']
+
+    async def edit_paraphrase_question(self, question_id, question):
+        """
+        Modify an existing paraphrase question, see :meth:`CapeClient.edit_paraphrase_question`.
+        """
+        r = await self._raw_api_call('saved-replies/edit-paraphrase-question',
+                                     {'questionId': str(question_id), 'question': question})
+        return r.result['questionId']
+
+    async def edit_canonical_question(self, reply_id, question):
+        """
+        Modify the canonical question of a saved reply, see :meth:`CapeClient.edit_canonical_question`.
+        """
+        r = await self._raw_api_call('saved-replies/edit-canonical-question',
+                                     {'replyId': str(reply_id), 'question': question})
+        return r.result['replyId']
+
+    async def delete_paraphrase_question(self, question_id):
+        """
+        Delete a paraphrase question, see :meth:`CapeClient.delete_paraphrase_question`.
+        """
+        r = await self._raw_api_call('saved-replies/delete-paraphrase-question', {'questionId': str(question_id)})
+        return r.result['questionId']
+
+    async def add_answer(self, reply_id, answer):
+        """
+        Add a new answer to an existing saved reply, see :meth:`CapeClient.add_answer`.
+        """
+        r = await self._raw_api_call('saved-replies/add-answer', {'replyId': str(reply_id), 'answer': answer})
+        return r.result['answerId']
+
+    async def edit_answer(self, answer_id, answer):
+        """
+        Modify an existing answer, see :meth:`CapeClient.edit_answer`.
+        """
+        r = await self._raw_api_call('saved-replies/edit-answer', {'answerId': str(answer_id), 'answer': answer})
+        return r.result['answerId']
+
+    async def delete_answer(self, answer_id):
+        """
+        Delete an existing answer, see :meth:`CapeClient.delete_answer`.
+        """
+        r = await self._raw_api_call('saved-replies/delete-answer', {'answerId': str(answer_id)})
+        return r.result['answerId']
+
+    async def get_documents(self, document_ids=None, number_of_items=30, offset=0):
+        """
+        Retrieve this user's documents, see :meth:`CapeClient.get_documents`.
+        """
+        params = documents_parameters(document_ids, number_of_items, offset)
+        r = await self._raw_api_call('documents/get-documents', params)
+        return r.result
+
+    def iter_documents(self, document_ids=None, page_size=30, prefetch=1):
+        """
+        Asynchronously iterate over all documents, see :meth:`CapeClient.iter_documents`.
+        """
+        return aiterate_pages(lambda number_of_items, offset: self.get_documents(document_ids, number_of_items,
+                                                                                 offset),
+                              page_size, prefetch)
+
+    async def fetch_all_documents(self, document_ids=None, page_size=100, max_concurrency=8):
+        """
+        Retrieve all of this user's documents concurrently, see :meth:`CapeClient.fetch_all_documents`.
+        """
+        return await afetch_all_pages(lambda number_of_items, offset: self.get_documents(document_ids, number_of_items,
+                                                                                         offset),
+                                      page_size, max_concurrency)
+
+    async def upload_document(self, title, text=None, file_path=None, document_id='', origin='', replace=False,
+                              document_type=None, monitor_callback=None):
+        return await self.add_document(title, text, file_path, document_id, origin, replace, document_type,
+                                       monitor_callback)
+
+    async def add_document(self, title, text=None, file_path=None, document_id='', origin='', replace=False,
+                           document_type=None, monitor_callback=None):
+        """
+        Create a new document or replace an existing document, see :meth:`CapeClient.add_document`.
+        """
+        if text is not None:
+            r = await self._raw_api_call('documents/add-document', {'title': title,
+                                                                    'text': text,
+                                                                    'documentId': document_id,
+                                                                    'origin': origin,
+                                                                    'replace': str(replace)},
+                                         monitor_callback=monitor_callback)
+        elif file_path is not None:
+            with open(file_path, 'rb') as fh:
+                r = await self._raw_api_call('documents/add-document', {'title': title,
+                                                                        'text': fh,
+                                                                        'documentId': document_id,
+                                                                        'origin': origin,
+                                                                        'replace': str(replace)},
+                                             monitor_callback=monitor_callback)
+        else:
+            raise CapeException("Either the 'text' or the 'file_path' parameter are required for document uploads.")
+        return r.result['documentId']
+
+    async def delete_document(self, document_id):
+        """
+        Delete a document, see :meth:`CapeClient.delete_document`.
+        """
+        r = await self._raw_api_call('documents/delete-document', {'documentId': document_id})
+        return r.result['documentId']
+
+    async def add_annotation(self, question, answer, document_id, start_offset=None, end_offset=None, metadata=None):
+        """
+        Create a new annotation for a specified document, see :meth:`CapeClient.add_annotation`.
+        """
+        params = add_annotation_parameters(question, answer, document_id, start_offset, end_offset, metadata)
+        r = await self._raw_api_call('annotations/add-annotation', params)
+        return r.result
+
+    async def get_annotations(self, search_term='', annotation_ids=None, document_ids=None, pages=None,
+                              number_of_items=30, offset=0):
+        """
+        Retrieve a list of annotations, see :meth:`CapeClient.get_annotations`.
+        """
+        params = annotations_parameters(search_term, annotation_ids, document_ids, pages, number_of_items, offset)
+        r = await self._raw_api_call('annotations/get-annotations', params)
+        return r.result
+
+    def iter_annotations(self, search_term='', annotation_ids=None, document_ids=None, pages=None, page_size=30,
+                         prefetch=1):
+        """
+        Asynchronously iterate over all annotations, see :meth:`CapeClient.iter_annotations`.
+        """
+        return aiterate_pages(lambda number_of_items, offset: self.get_annotations(search_term, annotation_ids,
+                                                                                   document_ids, pages,
+                                                                                   number_of_items, offset),
+                              page_size, prefetch)
+
+    async def fetch_all_annotations(self, search_term='', annotation_ids=None, document_ids=None,
+                                    pages=None, page_size=100, max_concurrency=8):
+        """
+        Retrieve all annotations concurrently, see :meth:`CapeClient.fetch_all_annotations`.
+        """
+        return await afetch_all_pages(lambda number_of_items, offset: self.get_annotations(search_term, annotation_ids,
+                                                                                           document_ids, pages,
+                                                                                           number_of_items, offset),
+                                      page_size, max_concurrency)
+
+    async def delete_annotation(self, annotation_id):
+        """
+        Delete an annotation, see :meth:`CapeClient.delete_annotation`.
+        """
+        r = await self._raw_api_call('annotations/delete-annotation', {'annotationId': annotation_id})
+        return r.result['annotationId']
+
+    async def edit_annotation_canonical_question(self, annotation_id, question):
+        """
+        Edit the canonical question of an annotation, see :meth:`CapeClient.edit_annotation_canonical_question`.
+        """
+        r = await self._raw_api_call('annotations/edit-canonical-question', {'annotationId': annotation_id,
+                                                                             'question': question})
+        return r.result['annotationId']
+
+    async def add_annotation_paraphrase_question(self, annotation_id, question):
+        """
+        Add a paraphrase question to an annotation, see :meth:`CapeClient.add_annotation_paraphrase_question`.
+        """
+        r = await self._raw_api_call('annotations/add-paraphrase-question', {'annotationId': annotation_id,
+                                                                             'question': question})
+        return r.result['questionId']
+
+    async def edit_annotation_paraphrase_question(self, question_id, question):
+        """
+        Modify an annotation's paraphrase question, see :meth:`CapeClient.edit_annotation_paraphrase_question`.
+        """
+        r = await self._raw_api_call('annotations/edit-paraphrase-question', {'questionId': question_id,
+                                                                              'question': question})
+        return r.result['questionId']
+
+    async def delete_annotation_paraphrase_question(self, question_id):
+        """
+        Delete an annotation's paraphrase question, see :meth:`CapeClient.delete_annotation_paraphrase_question`.
+        """
+        r = await self._raw_api_call('annotations/delete-paraphrase-question', {'questionId': question_id})
+        return r.result['questionId']
+
+    async def add_annotation_answer(self, annotation_id, answer):
+        """
+        Add a new answer to an existing annotation, see :meth:`CapeClient.add_annotation_answer`.
+        """
+        r = await self._raw_api_call('annotations/add-answer', {'annotationId': annotation_id, 'answer': answer})
+        return r.result['answerId']
+
+    async def edit_annotation_answer(self, answer_id, answer):
+        """
+        Edit an annotation's answer, see :meth:`CapeClient.edit_annotation_answer`.
+        """
+        r = await self._raw_api_call('annotations/edit-answer', {'answerId': answer_id, 'answer': answer})
+        return r.result['answerId']
+
+    async def delete_annotation_answer(self, answer_id):
+        """
+        Delete an answer from an annotation, see :meth:`CapeClient.delete_annotation_answer`.
+        """
+        r = await self._raw_api_call('annotations/delete-answer', {'answerId': answer_id})
+        return r.result['answerId']
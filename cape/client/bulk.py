@@ -0,0 +1,170 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import hashlib
+import json
+import os
+import threading
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = '.cape-manifest.json'
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Calculate the ID Cape gives a document uploaded from a file without supplying a document ID.
+
+    :param path: The file to hash.
+    :return: The SHA256 hash of the file's contents as a hex string.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def collect_paths(paths):
+    """
+    Expand a directory, a file or an iterable of files and directories into a list of files.
+
+    :param paths: A path or an iterable of paths, directories are searched recursively.
+    :return: A sorted list of file paths for each directory and the given order for everything else.
+    """
+    if isinstance(paths, (str, bytes, os.PathLike)):
+        paths = [paths]
+    files = []
+    for path in paths:
+        path = os.fspath(path)
+        if os.path.isdir(path):
+            for directory, directories, file_names in os.walk(path):
+                directories.sort()
+                files.extend(os.path.join(directory, file_name) for file_name in sorted(file_names))
+        else:
+            files.append(path)
+    return files
+
+
+def read_json_file(path):
+    """
+    :return: The JSON object stored at path, or an empty dictionary if the file doesn't exist.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def write_json_file(path, data):
+    """
+    Atomically replace the JSON file at path so an interrupted write never leaves a truncated file behind.
+    """
+    temporary_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporary_path, 'w', encoding='utf-8') as fh:
+        json.dump(data, fh, indent=1, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def load_manifest(path):
+    """
+    Read a manifest written by sync_documents().
+
+    :param path: The manifest file, which needn't exist yet.
+    :return: A dictionary with 'files', mapping each relative path to its 'mtime', 'size', 'sha256' and 'document_id',
+        and 'orphans', a list of document IDs which still need deleting.
+    """
+    manifest = read_json_file(path)
+    manifest.setdefault('files', {})
+    manifest.setdefault('orphans', [])
+    return manifest
+
+
+def scan_file(path, previous=None, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Describe a file for the sync manifest, only re-hashing it when its size or modification time has changed.
+
+    :param path: The file to describe.
+    :param previous: The file's entry from the previous manifest, if any.
+    :return: A dictionary containing the 'mtime' (in nanoseconds), 'size' and 'sha256' of the file.
+    """
+    stat = os.stat(path)
+    if previous is not None and previous.get('mtime') == stat.st_mtime_ns and previous.get('size') == stat.st_size:
+        sha256 = previous['sha256']
+    else:
+        sha256 = hash_file(path, chunk_size)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+
+
+def batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+class BulkProgress:
+    """
+        Aggregated progress of a multi-file upload, passed to the monitor_callback of add_documents().
+
+        :ivar bytes_read: The number of bytes sent so far across all uploads.
+        :ivar len: The total size of all the request bodies being uploaded.
+        :ivar files_done: The number of files which have finished uploading (successfully or not).
+        :ivar files_total: The number of files being uploaded.
+    """
+
+    def __init__(self, file_sizes, callback=None):
+        """
+
+        :param file_sizes: A dictionary mapping each file to be uploaded to its size, used to estimate len until the
+            upload of that file starts.
+        :param callback: A function to call with this object whenever progress is made.
+        """
+        self.bytes_read = 0
+        self.len = sum(file_sizes.values())
+        self.files_done = 0
+        self.files_total = len(file_sizes)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._uploads = {path: (0, size) for path, size in file_sizes.items()}
+
+    def monitor(self, path):
+        """
+        Create a monitor_callback for an individual upload which feeds into this aggregate.
+
+        :param path: The file being uploaded.
+        :return: A function suitable for add_document's monitor_callback parameter.
+        """
+        def update(monitor):
+            with self._lock:
+                previous_read, previous_len = self._uploads[path]
+                self.bytes_read += monitor.bytes_read - previous_read
+                self.len += monitor.len - previous_len
+                self._uploads[path] = (monitor.bytes_read, monitor.len)
+            self._notify()
+        return update
+
+    def file_done(self):
+        with self._lock:
+            self.files_done += 1
+        self._notify()
+
+    def _notify(self):
+        if self.callback is not None:
+            self.callback(self)
@@ -0,0 +1,157 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+#: API methods which change the data answers are produced from, calling any of these invalidates cached answers.
+CORPUS_MUTATIONS = frozenset([
+    'user/set-default-threshold',
+    'saved-replies/add-saved-reply',
+    'saved-replies/delete-saved-reply',
+    'saved-replies/add-paraphrase-question',
+    'saved-replies/edit-paraphrase-question',
+    'saved-replies/edit-canonical-question',
+    'saved-replies/delete-paraphrase-question',
+    'saved-replies/add-answer',
+    'saved-replies/edit-answer',
+    'saved-replies/delete-answer',
+    'documents/add-document',
+    'documents/delete-document',
+    'annotations/add-annotation',
+    'annotations/delete-annotation',
+    'annotations/edit-canonical-question',
+    'annotations/add-paraphrase-question',
+    'annotations/edit-paraphrase-question',
+    'annotations/delete-paraphrase-question',
+    'annotations/add-answer',
+    'annotations/edit-answer',
+    'annotations/delete-answer',
+])
+
+
+def normalize_question(question):
+    return ' '.join(question.split()).casefold()
+
+
+def answer_cache_key(question, account, threshold, document_ids, source_type, speed_or_accuracy, number_of_items,
+                     offset, text):
+    """
+    Build the key an answer is cached under.
+
+    Questions differing only in case or whitespace share a key, as do requests listing the same documents in a
+    different order. Inline text is represented by its SHA256 hash.
+
+    :param account: The user token, admin token or login name the answer was requested with.
+    :return: A string identifying the answer request.
+    """
+    text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest() if text is not None else None
+    return json.dumps([normalize_question(question), account, threshold, sorted(document_ids or []),
+                       str(source_type), speed_or_accuracy, int(number_of_items), int(offset), text_hash])
+
+
+class AnswerCache:
+    """
+        A thread safe, size bounded LRU cache of answers with a time to live.
+
+        Pass an instance to CapeClient to enable answer caching, the client clears it whenever it modifies documents,
+        saved replies, annotations or the default threshold.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        """
+
+        :param max_size: The maximum number of answers to keep.
+        :param ttl: The number of seconds an answer remains valid for (None to never expire answers).
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Retrieve a cached answer.
+
+        :param key: A key created by answer_cache_key().
+        :return: A copy of the cached answer, or None if there isn't a valid one.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, generation=None):
+        """
+        Store an answer.
+
+        :param key: A key created by answer_cache_key().
+        :param value: The answer to store.
+        :param generation: The value of self.generation when the answer was requested, the answer is discarded if the
+            cache has been cleared since.
+        :return:
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (expires, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all cached answers.
+
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        """
+        Report the cache's counters.
+
+        :return: A dictionary containing the number of hits, misses, evictions and currently cached answers.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._entries)}
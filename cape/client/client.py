@@ -21,61 +21,510 @@
 
 import os.path
 import json
-from requests import Session
-from requests_toolbelt.multipart import encoder
-from .exceptions import CapeException
-from .utils import check_list
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from requests import RequestException, Session
+from requests.exceptions import ConnectTimeout
+from urllib3.exceptions import ConnectTimeoutError
+from .bulk import MANIFEST_NAME, BulkProgress, batches, collect_paths, hash_file, load_manifest, read_json_file, \
+    scan_file, write_json_file
+from .cache import CORPUS_MUTATIONS, answer_cache_key
+from .coalescing import flight_key
+from .exceptions import CapeException, CapeTransportError, CircuitOpenError
+from .hedging import hedged_call
+from .instrumentation import observe_call, track_connections
+from .pagination import iterate_pages, fetch_all_pages
+from .response import ApiResponse
+from .retry import RetryPolicy, parse_retry_after
+from .routing import FAILOVER_METHODS, EndpointRouter
+from .scheduling import BULK, check_priority
+from .sharding import merge_answer_items, shard_document_ids
+from .streaming import MultipartStream
+from .tracing import TimingHTTPAdapter
+from .transfer import annotation_record, check_annotation_span, read_records, record_writer, saved_reply_record
+from .utils import check_list, json_loads
 import string
 
 API_VERSION = 0.1
 
 
+def prepare_request(api_base, admin_token, method, parameters=None):
+    """
+    Build the URL and form fields for an API call.
+
+    :param api_base: The versioned URL to send API requests to.
+    :param admin_token: An admin token to authenticate with (if any).
+    :param method: The API method to call (e.g. 'documents/get-documents').
+    :param parameters: A dictionary of parameters for the call, 'token' is moved into the query string.
+    :return: A tuple of the URL and the remaining parameters.
+    """
+    if parameters is None:
+        parameters = {}
+    url = "%s/%s" % (api_base, method)
+    if 'token' in parameters:
+        token = parameters.pop('token')
+        url += "?token=%s" % token
+    elif admin_token:
+        url += "?adminToken=%s" % admin_token
+    if 'documentIds' in parameters and not isinstance(parameters['documentIds'], str):
+        parameters['documentIds'] = json.dumps(parameters['documentIds'])
+    return url, parameters
+
+
+def answer_parameters(question, user_token, threshold, document_ids, source_type, speed_or_accuracy,
+                      number_of_items, offset, text, logged_in):
+    """
+    Validate the arguments of an answer request and build its parameters.
+
+    :return: A dictionary of parameters for the 'answer' API call.
+    """
+    document_ids = check_list(document_ids, 'document IDs')
+    if not question.strip():
+        raise CapeException('Expecting question parameter to not be empty string')
+    invalidChars = set(string.punctuation.replace("_", ""))
+    if all(ch in invalidChars for ch in question.strip().replace(" ", "")):
+        raise CapeException(
+            'All characters in question parameter are punctuation. At least one alpha-numeric character required.')
+    params = {'token': user_token,
+              'question': question,
+              'threshold': threshold,
+              'documentIds': json.dumps(document_ids),
+              'sourceType': str(source_type),
+              'speedOrAccuracy': speed_or_accuracy,
+              'numberOfItems': str(number_of_items),
+              'offset': str(offset),
+              'text': text}
+    if user_token is None:
+        params.pop('token')
+        if not logged_in:
+            raise CapeException("A user token must be supplied if the client isn't logged in.")
+    if len(document_ids) == 0:
+        params.pop('documentIds')
+    if threshold is None:
+        params.pop('threshold')
+    if text is None:
+        params.pop('text')
+    return params
+
+
+ANSWER_OVERRIDES = ('question', 'threshold', 'document_ids', 'text')
+
+
+def answer_many_arguments(questions, **defaults):
+    """
+    Expand the questions given to answer_many() into keyword arguments for individual answer() calls.
+
+    :param questions: A list of questions, each either a string or a dictionary containing a 'question' and optionally
+        'threshold', 'document_ids' and 'text' overrides.
+    :param defaults: Keyword arguments for answer() shared by every question.
+    :return: A list of keyword argument dictionaries, one per question.
+    """
+    arguments = []
+    for question in questions:
+        kwargs = dict(defaults)
+        if isinstance(question, dict):
+            unknown = set(question) - set(ANSWER_OVERRIDES)
+            if unknown:
+                raise TypeError('Unexpected answer_many() overrides: %s' % ', '.join(sorted(unknown)))
+            kwargs.update(question)
+        else:
+            kwargs['question'] = question
+        arguments.append(kwargs)
+    return arguments
+
+
+def inbox_parameters(read, answered, search_term, number_of_items, offset):
+    return {'read': str(read),
+            'answered': str(answered),
+            'searchTerm': search_term,
+            'numberOfItems': str(number_of_items),
+            'offset': str(offset)}
+
+
+def saved_replies_parameters(search_term, saved_reply_ids, number_of_items, offset):
+    saved_reply_ids = check_list(saved_reply_ids, 'saved reply IDs')
+    params = {'searchTerm': search_term,
+              'savedReplyIds': json.dumps(saved_reply_ids),
+              'numberOfItems': str(number_of_items),
+              'offset': str(offset)}
+    if len(saved_reply_ids) == 0:
+        params.pop('savedReplyIds')
+    return params
+
+
+def documents_parameters(document_ids, number_of_items, offset):
+    document_ids = check_list(document_ids, 'document IDs')
+    params = {'documentIds': json.dumps(document_ids),
+              'numberOfItems': str(number_of_items),
+              'offset': str(offset)}
+    if len(document_ids) == 0:
+        params.pop('documentIds')
+    return params
+
+
+def add_annotation_parameters(question, answer, document_id, start_offset, end_offset, metadata):
+    params = {
+        'question': question,
+        'answer': answer,
+        'documentId': document_id,
+        'startOffset': str(start_offset),
+        'endOffset': str(end_offset),
+        'metadata': json.dumps(metadata)
+    }
+
+    if start_offset is None:
+        params.pop('startOffset')
+    if end_offset is None:
+        params.pop('endOffset')
+    if metadata is None:
+        params.pop('metadata')
+    return params
+
+
+def annotations_parameters(search_term, annotation_ids, document_ids, pages, number_of_items, offset):
+    annotation_ids = check_list(annotation_ids, 'annotation IDs')
+    document_ids = check_list(document_ids, 'document IDs')
+    pages = check_list(pages, 'pages')
+
+    params = {'searchTerm': search_term,
+              'annotationIds': json.dumps(annotation_ids),
+              'documentIds': json.dumps(document_ids),
+              'pages': json.dumps(pages),
+              'numberOfItems': str(number_of_items),
+              'offset': str(offset)}
+    if len(annotation_ids) == 0:
+        params.pop('annotationIds')
+    if len(document_ids) == 0:
+        params.pop('documentIds')
+    if len(pages) == 0:
+        params.pop('pages')
+    return params
+
+
+def transport_response(status_code, content, retry_after, cookies, retry_policy):
+    """
+    Decode the body of an HTTP response from the API.
+
+    :return: An ApiResponse.
+    :raises CapeTransportError: If the status code is one of the retry policy's transient statuses or the body isn't
+        an API response (e.g. an error page from a proxy).
+    """
+    if status_code in retry_policy.statuses:
+        raise CapeTransportError('The Cape API is unavailable (HTTP %d)' % status_code, status_code,
+                                 parse_retry_after(retry_after))
+    try:
+        body = json_loads(content)
+    except ValueError as e:
+        raise CapeTransportError('Unexpected response from the Cape API (HTTP %d)' % status_code, status_code) from e
+    return ApiResponse(status_code, body, cookies)
+
+
 class CapeClient:
     """
         The CapeClient provides access to all methods of the Cape API.
     """
 
-    def __init__(self, api_base, admin_token=None):
+    def __init__(self, api_base, admin_token=None, answer_cache=None, retry_policy=None, circuit_breaker=None,
+                 hedge_policy=None, metrics=None, tracer=None, recorder=None, replayer=None, single_flight=None,
+                 rate_limiter=None, concurrency_limiter=None, scheduler=None, hedge_workers=64):
         """
 
-        :param api_base: The URL to send API requests to.
+        :param api_base: The URL to send API requests to, a list of URLs to route each request to the fastest healthy one of, or an EndpointRouter configured with their versioned URLs.
         :param admin_token: An admin token to authenticate with.
-        """
-        self.api_base = "%s/%s" % (api_base, API_VERSION)
+        :param answer_cache: An AnswerCache or DiskAnswerCache to store the results of answer() calls in (Default: no caching).
+        :param retry_policy: A RetryPolicy deciding which calls are retried after transient failures (Default: reads and answer() are attempted up to 3 times).
+        :param circuit_breaker: A CircuitBreaker to fail calls fast while the API is unavailable (Default: no breaker).
+        :param hedge_policy: A HedgePolicy for sending duplicate answer() requests when the first is slow (Default: no hedging).
+        :param metrics: A MetricsSink to report the latency, size and outcome of every API call to (Default: no metrics).
+        :param tracer: A Tracer to call as every API call starts and finishes (Default: no tracing).
+        :param recorder: A TrafficRecorder to record every API call and its response to.
+        :param replayer: A TrafficReplayer to serve recorded responses from instead of calling the API.
+        :param single_flight: A SingleFlight to share one request between concurrent identical calls to answer(), get_documents(), get_saved_replies() and get_profile() (Default: every call makes its own request).
+        :param rate_limiter: A RateLimiter pacing the calls made to each API method (Default: no rate limit).
+        :param concurrency_limiter: An AIMDLimiter adapting the number of calls in progress to the API's load (Default: no limit).
+        :param scheduler: A PriorityScheduler deciding which calls are sent first when many are waiting (Default: calls are sent as they're made).
+        :param hedge_workers: The number of threads hedged answer() requests are sent from, each hedged call uses one, or two once a hedge is sent.
+        """
+        self.router = None
+        if isinstance(api_base, EndpointRouter):
+            self.router = api_base
+            self.api_base = self.router.endpoints[0].api_base
+        else:
+            api_bases = [api_base] if isinstance(api_base, str) else list(api_base)
+            self.api_base = "%s/%s" % (api_bases[0], API_VERSION)
+            if len(api_bases) > 1:
+                self.router = EndpointRouter(["%s/%s" % (base, API_VERSION) for base in api_bases])
         self.session = Session()
+        if tracer is not None:
+            # Connection setup is only timed when tracing, otherwise requests' default transport is used.
+            self.session.mount('http://', TimingHTTPAdapter())
+            self.session.mount('https://', TimingHTTPAdapter())
         self.session_cookie = False
         self.admin_token = admin_token
         self.user_token = None
+        self.login_name = None
+        # Only kept when routing, to log in to each endpoint the first time a call is sent to it.
+        self._password = None
+        self.answer_cache = answer_cache
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.hedge_policy = hedge_policy
+        self.metrics = metrics
+        self.tracer = tracer
+        self.recorder = recorder
+        self.replayer = replayer
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.scheduler = scheduler
+        self._priority = threading.local()
+        self.single_flight = single_flight
+        #: Callables taking the method, parameters and result of every successful call which modifies the corpus.
+        self.corpus_listeners = []
+        #: A LocalReplica to answer questions matching a saved reply from, see LocalReplica's answer_locally.
+        self.local_answers = None
+        self.hedge_workers = hedge_workers
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+        # Set on a hedging worker thread to be called when its request is sent, see hedged_call().
+        self._sending = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop probing the endpoints of the client's EndpointRouter and close any pooled connections.
 
-    def _raw_api_call(self, method, parameters=None, monitor_callback=None):
-        if parameters is None:
-            parameters={}
-        url = "%s/%s" % (self.api_base, method)
-        if 'token' in parameters:
-            token = parameters.pop('token')
-            url += "?token=%s" % token
-        elif self.admin_token:
-            url += "?adminToken=%s" % self.admin_token
-        if 'documentIds' in parameters and not isinstance(parameters['documentIds'], str):
-            parameters['documentIds'] = json.dumps(parameters['documentIds'])
-        if parameters:
-            m = encoder.MultipartEncoderMonitor.from_fields(fields=parameters, encoding='utf-8',
-                                                            callback=monitor_callback)
-            if self.session_cookie:
-                r = self.session.post(url, data=m, cookies={'session': self.session_cookie},
-                                      headers={'Content-Type': m.content_type})
-            else:
-                r = self.session.post(url, data=m, headers={'Content-Type': m.content_type})
-        else:
-            if self.session_cookie:
-                r = self.session.get(url, cookies={'session': self.session_cookie})
-            else:
-                r = self.session.get(url)
+        :return:
+        """
+        if self.router is not None:
+            self.router.close()
+        with self._hedge_lock:
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
+        self.session.close()
+
+    def _corpus_changed(self, method, parameters, result):
+        """
+        Called after a successful API call which modifies the data answers are produced from.
+
+        :param method: The API method that was called.
+        :param parameters: The parameters it was called with.
+        :param result: The result of the call.
+        """
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+        for listener in self.corpus_listeners:
+            listener(method, parameters, result)
 
-        if r.status_code == 200 and r.json()['success']:
-            return r
+    @contextmanager
+    def priority(self, priority):
+        """
+        Give the API calls made in this thread within the block a priority class, for the client's PriorityScheduler.
+
+        Calls made by worker threads of the client's own methods (e.g. fetch_all_documents()) inherit the priority.
+        Without one, calls made by the bulk methods (add_documents(), sync_documents(), import_saved_replies() and
+        import_annotations()) are 'bulk' and others are given the scheduler's priority for their API method.
+
+        :param priority: 'interactive', 'normal' or 'bulk'.
+        """
+        check_priority(priority)
+        previous = getattr(self._priority, 'value', None)
+        self._priority.value = priority
+        try:
+            yield
+        finally:
+            self._priority.value = previous
+
+    def _inherit_priority(self, function, default=None):
+        """
+        Wrap function so calls it makes in another thread have the current thread's priority (or default).
+        """
+        priority = getattr(self._priority, 'value', None) or default
+        if priority is None:
+            return function
+
+        def call(*args, **kwargs):
+            with self.priority(priority):
+                return function(*args, **kwargs)
+        return call
+
+    def _coalesced(self, method, parameters, call):
+        """
+        Return call(), sharing its result with any identical calls made while it's in progress if the client has a
+        SingleFlight.
+        """
+        if self.single_flight is None:
+            return call()
+        key = flight_key(method, self.admin_token or self.login_name, parameters)
+        return self.single_flight.call(method, key, call)
+
+    def _raw_api_call(self, method, parameters=None, monitor_callback=None):
+        url, parameters = prepare_request(self.api_base, self.admin_token, method, parameters)
+        path = url[len(self.api_base):]
+        retry = self.retry_policy.can_retry(method, parameters)
+        started = time.monotonic()
+        attempt = 0
+        tried = []
+        while True:
+            attempt += 1
+            if self.router is not None:
+                endpoint = self.router.choose(tried)
+                url = endpoint.api_base + path
+            try:
+                if self.router is not None:
+                    self._ensure_session(endpoint, method)
+                response = self._limited_send(method, url, parameters, monitor_callback)
+                break
+            except CapeTransportError as e:
+                delay = None
+                unavailable = self.router is not None and (e.status_code is None or e.status_code >= 500)
+                if unavailable:
+                    self.router.record_failure(endpoint)
+                    tried.append(endpoint)
+                if retry and self.retry_policy.is_transient(e):
+                    delay = self.retry_policy.next_delay(attempt, started, e)
+                if unavailable and len(tried) < len(self.router.endpoints) and \
+                        (delay is not None or e.connect_failed or method in FAILOVER_METHODS):
+                    # Another endpoint is tried straight away, whatever the method if the request was never sent.
+                    delay = 0
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        if self.router is not None:
+            self.router.record_success(endpoint)
+
+        if method in CORPUS_MUTATIONS:
+            self._corpus_changed(method, parameters, response.result)
+        return response
+
+    def _ensure_session(self, endpoint, method):
+        """
+        Log in to an endpoint which hasn't been sent a call since the client logged in.
+        """
+        if self._password is None or endpoint.session_cookie is not None or method == 'user/login':
+            return
+        self._send('user/login', '%s/user/login' % endpoint.api_base,
+                   {'login': self.login_name, 'password': self._password}, None)
+
+    def _limited_send(self, method, url, parameters, monitor_callback):
+        """
+        Make a single attempt at an API call once the rate limiter and scheduler allow it.
+        """
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.reserve(method)
+            if delay > 0:
+                time.sleep(delay)
+        if self.scheduler is None:
+            return self._adaptive_send(method, url, parameters, monitor_callback)
+        self.scheduler.acquire(self.scheduler.priority(method, getattr(self._priority, 'value', None)))
+        try:
+            return self._adaptive_send(method, url, parameters, monitor_callback)
+        finally:
+            self.scheduler.release()
+
+    def _adaptive_send(self, method, url, parameters, monitor_callback):
+        """
+        Make a single attempt at an API call once the concurrency limiter allows it, adapting its limit to the outcome.
+        """
+        if self.concurrency_limiter is None:
+            return self._send(method, url, parameters, monitor_callback)
+        self.concurrency_limiter.acquire()
+        started = time.monotonic()
+        latency = error = None
+        try:
+            response = self._send(method, url, parameters, monitor_callback)
+        except CircuitOpenError:
+            raise
+        except CapeTransportError as e:
+            latency, error = time.monotonic() - started, e
+            raise
+        except CapeException:
+            # An error returned by the API still shows how quickly it's responding.
+            latency = time.monotonic() - started
+            raise
         else:
-            raise CapeException(r.json()['result']['message'])
+            latency = time.monotonic() - started
+            return response
+        finally:
+            self.concurrency_limiter.release(method, latency, error)
+
+    def _send(self, method, url, parameters, monitor_callback):
+        """
+        Make a single attempt at an API call, raising CapeTransportError if the API couldn't handle it.
+        """
+        with observe_call(self.metrics, self.tracer, method, url, parameters) as call:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            sent = getattr(self._sending, 'callback', None)
+            if sent is not None:
+                sent()
+            try:
+                if self.replayer is not None:
+                    entry, delay = self.replayer.next_response(method, parameters)
+                    time.sleep(delay)
+                    status_code, content, retry_after, cookies = self.replayer.response(entry)
+                else:
+                    status_code, content, retry_after, cookies = self._exchange(call, method, url, parameters,
+                                                                                monitor_callback)
+                call.status_code = status_code
+                call.response_bytes = len(content)
+                if self.router is not None and 'session' in cookies:
+                    self.router.endpoint_for(url).session_cookie = cookies['session']
+                decode_started = time.perf_counter()
+                response = transport_response(status_code, content, retry_after, cookies, self.retry_policy)
+                call.add_phase('decode', time.perf_counter() - decode_started)
+            except CapeTransportError:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                raise
+            except BaseException:
+                # Anything else (including cancellation) says nothing about the API, but mustn't leave a probe pending.
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_abandoned()
+                raise
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            return response.raise_for_failure()
+
+    def _exchange(self, call, method, url, parameters, monitor_callback):
+        """
+        Send an API request over HTTP, recording it if a recorder is set.
+
+        :return: A tuple of the status code, body, Retry-After header and cookies of the response.
+        """
+        session_cookie = self.session_cookie if self.router is None else self.router.endpoint_for(url).session_cookie
+        cookies = {'session': session_cookie} if session_cookie else None
+        headers = dict(call.headers)
+        try:
+            with track_connections(call):
+                if parameters:
+                    m = call.body = MultipartStream(parameters, callback=monitor_callback)
+                    headers['Content-Type'] = m.content_type
+                    r = self.session.post(url, data=m, cookies=cookies, headers=headers, stream=True)
+                else:
+                    r = self.session.get(url, cookies=cookies, headers=headers, stream=True)
+                headers_at = time.perf_counter()
+                content = r.content
+                call.record_exchange(headers_at, time.perf_counter())
+        except RequestException as e:
+            if self.recorder is not None:
+                self.recorder.record(method, parameters, time.perf_counter() - call.started, error=str(e))
+            # urllib3 wraps failures to open a connection (refused, unresolvable, timed out) in ConnectTimeoutError.
+            reason = getattr(e.args[0], 'reason', None) if e.args else None
+            connect_failed = isinstance(e, ConnectTimeout) or isinstance(reason, ConnectTimeoutError)
+            raise CapeTransportError('Unable to reach the Cape API: %s' % e, connect_failed=connect_failed) from e
+        exchange = r.status_code, content, r.headers.get('Retry-After'), r.cookies.get_dict()
+        if self.recorder is not None:
+            self.recorder.record(method, parameters, time.perf_counter() - call.started, *exchange)
+        return exchange
 
     def login(self, login, password):
         """
@@ -85,8 +534,13 @@ class CapeClient:
         :param password: The password to log in with.
         :return:
         """
+        if self.router is not None:
+            self.router.clear_sessions()
         r = self._raw_api_call('user/login', {'login': login, 'password': password})
         self.session_cookie = r.cookies['session']
+        self.login_name = login
+        if self.router is not None:
+            self._password = password
 
     def logged_in(self):
         """
@@ -102,9 +556,21 @@ class CapeClient:
 
         :return:
         """
-        self._raw_api_call('user/logout')
+        if self.router is None:
+            self._raw_api_call('user/logout')
+        else:
+            for endpoint in self.router.endpoints:
+                if endpoint.session_cookie is not None:
+                    try:
+                        self._send('user/logout', '%s/user/logout' % endpoint.api_base, {}, None)
+                    except CapeTransportError:
+                        # The session can't be used while the endpoint is unreachable and will expire there.
+                        pass
+            self.router.clear_sessions()
+            self._password = None
         self.session_cookie = False
         self.user_token = None
+        self.login_name = None
 
     def get_admin_token(self):
         """
@@ -113,7 +579,7 @@ class CapeClient:
         :return: An admin token.
         """
         r = self._raw_api_call('user/get-admin-token')
-        return r.json()['result']['adminToken']
+        return r.result['adminToken']
 
     def get_user_token(self):
         """
@@ -122,7 +588,7 @@ class CapeClient:
         :return: A user token.
         """
         r = self._raw_api_call('user/get-user-token')
-        return r.json()['result']['userToken']
+        return r.result['userToken']
 
     def get_profile(self):
         """
@@ -130,8 +596,7 @@ class CapeClient:
 
         :return: A dictionary containing the user's profile.
         """
-        r = self._raw_api_call('user/get-profile')
-        return r.json()['result']
+        return self._coalesced('user/get-profile', {}, lambda: self._raw_api_call('user/get-profile').result)
 
     def get_default_threshold(self):
         """
@@ -140,7 +605,7 @@ class CapeClient:
         :return: The current default threshold (either 'verylow', 'low', 'medium', 'high' or 'veryhigh').
         """
         r = self._raw_api_call('user/get-default-threshold')
-        return r.json()['result']['threshold']
+        return r.result['threshold']
 
     def set_default_threshold(self, threshold):
         """
@@ -150,7 +615,7 @@ class CapeClient:
         :return: The new default threshold that's just been set.
         """
         r = self._raw_api_call('user/set-default-threshold', {'threshold': threshold})
-        return r.json()['result']['threshold']
+        return r.result['threshold']
 
     def set_forward_email(self, email):
         """
@@ -160,11 +625,11 @@ class CapeClient:
         :return: The new forward email address that's just been set.
         """
         r = self._raw_api_call('user/set-forward-email', {'email': email})
-        return r.json()['result']['forwardEmail']
+        return r.result['forwardEmail']
 
     def answer(self, question, user_token=None, threshold=None, document_ids=None,
                source_type='all', speed_or_accuracy='balanced', number_of_items=1, offset=0,
-               text=None):
+               text=None, shard_size=None, max_concurrency=8):
         """
         Provide a list of answers to a given question.
 
@@ -177,36 +642,109 @@ class CapeClient:
         :param number_of_items: The number of answers to return.
         :param offset: The starting point in the list of answers, used in conjunction with number_of_items to retrieve multiple batches of answers.
         :param text: An inline text to be treated as a document with id "Inline Text".
+        :param shard_size: If given, document_ids longer than this are split into shards of this many documents which are answered concurrently, and the best answers of all of them returned (Default: a single request).
+        :param max_concurrency: The maximum number of shards to answer at the same time.
         :return: A list of answers.
         """
-        document_ids = check_list(document_ids, 'document IDs')
-        if not question.strip():
-            raise CapeException('Expecting question parameter to not be empty string')
-        invalidChars = set(string.punctuation.replace("_", ""))
-        if all(ch in invalidChars for ch in question.strip().replace(" ", "")):
-            raise CapeException(
-                'All characters in question parameter are punctuation. At least one alpha-numeric character required.')
-        params = {'token': user_token,
-                  'question': question,
-                  'threshold': threshold,
-                  'documentIds': json.dumps(document_ids),
-                  'sourceType': str(source_type),
-                  'speedOrAccuracy': speed_or_accuracy,
-                  'numberOfItems': str(number_of_items),
-                  'offset': str(offset),
-                  'text': text}
-        if user_token is None:
-            params.pop('token')
-            if not self.logged_in():
-                raise CapeException("A user token must be supplied if the client isn't logged in.")
-        if len(document_ids) == 0:
-            params.pop('documentIds')
-        if threshold is None:
-            params.pop('threshold')
-        if text is None:
-            params.pop('text')
-        r = self._raw_api_call('answer', params)
-        return r.json()['result']['items']
+        params = answer_parameters(question, user_token, threshold, document_ids, source_type, speed_or_accuracy,
+                                   number_of_items, offset, text, self.logged_in())
+        # An exact saved reply match has the highest confidence possible, so only the first answer can be given locally.
+        if self.local_answers is not None and user_token is None and source_type in ('all', 'saved_reply') and \
+                int(number_of_items) == 1 and int(offset) == 0:
+            items = self.local_answers.answer(question)
+            if items is not None:
+                return items
+        if shard_size is not None and document_ids is not None and len(document_ids) > shard_size:
+            def fetch():
+                return self._sharded_answer_items(question, user_token, threshold, document_ids, source_type,
+                                                  speed_or_accuracy, number_of_items, offset, text, shard_size,
+                                                  max_concurrency)
+        else:
+            def fetch():
+                return self._answer_items(params)
+        if self.answer_cache is None:
+            return fetch()
+        # Answers are keyed by account so a shared cache never serves one account the answers of another.
+        key = answer_cache_key(question, user_token or self.admin_token or self.login_name, threshold, document_ids,
+                               source_type, speed_or_accuracy, number_of_items, offset, text)
+        items = self.answer_cache.get(key)
+        if items is None:
+            generation = self.answer_cache.generation
+            items = fetch()
+            self.answer_cache.set(key, items, generation)
+        return items
+
+    def _sharded_answer_items(self, question, user_token, threshold, document_ids, source_type, speed_or_accuracy,
+                              number_of_items, offset, text, shard_size, max_concurrency):
+        shards = shard_document_ids(document_ids, shard_size)
+        # Any of a shard's best offset + number_of_items answers could be in the window of the merged answers.
+        window = int(offset) + int(number_of_items)
+
+        def answer_shard(index):
+            # Inline text is only searched once, with the last shard, as its answers follow those from documents.
+            params = answer_parameters(question, user_token, threshold, shards[index], source_type, speed_or_accuracy,
+                                       window, 0, text if index == len(shards) - 1 else None, self.logged_in())
+            return self._answer_items(params)
+
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(shards))) as executor:
+            item_lists = list(executor.map(self._inherit_priority(answer_shard), range(len(shards))))
+        return merge_answer_items(item_lists, number_of_items, offset)
+
+    def _answer_items(self, params):
+        # Identical answers are coalesced before hedging so a hedge is never mistaken for an identical call.
+        return self._coalesced('answer', params, lambda: self._request_answer_items(params))
+
+    def _request_answer_items(self, params):
+        if self.hedge_policy is None:
+            return self._raw_api_call('answer', params).result['items']
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.hedge_workers)
+
+        def request(sent):
+            self._sending.callback = sent
+            try:
+                # prepare_request() removes the token from the parameters it's given, so each request gets its own copy.
+                return self._raw_api_call('answer', dict(params))
+            finally:
+                self._sending.callback = None
+        return hedged_call(self._hedge_executor, self.hedge_policy, self._inherit_priority(request)).result['items']
+
+    def answer_many(self, questions, user_token=None, threshold=None, document_ids=None, source_type='all',
+                    speed_or_accuracy='balanced', number_of_items=1, offset=0, text=None, max_concurrency=8):
+        """
+        Answer a batch of questions concurrently.
+
+        Each question may be a string or a dictionary with a 'question' key and optional 'threshold', 'document_ids' and
+        'text' keys overriding the values given for the whole batch. A failure to answer one question does not abort the
+        rest of the batch.
+
+        :param questions: A list of questions to answer.
+        :param user_token: A token retrieved from get_user_token (Default: the token for the currently authenticated user).
+        :param threshold: The minimum confidence of answers to return ('verylow'/'low'/'medium'/'medium'/'veryhigh').
+        :param document_ids: A list of documents to search for answers (Default: all documents).
+        :param source_type: Whether to search documents, saved replies or all ('document'/'saved_reply'/'all').
+        :param speed_or_accuracy: Prioritise speed or accuracy in answers ('speed'/'accuracy'/'balanced').
+        :param number_of_items: The number of answers to return for each question.
+        :param offset: The starting point in the list of answers for each question.
+        :param text: An inline text to be treated as a document with id "Inline Text".
+        :param max_concurrency: The maximum number of answer requests to run at the same time.
+        :return: A list in the same order as questions of dictionaries containing the 'question', its 'answers' and
+            the 'error' raised while answering it (either 'answers' or 'error' will be None).
+        """
+        arguments = answer_many_arguments(questions, user_token=user_token, threshold=threshold,
+                                          document_ids=document_ids, source_type=source_type,
+                                          speed_or_accuracy=speed_or_accuracy, number_of_items=number_of_items,
+                                          offset=offset, text=text)
+
+        def answer_one(kwargs):
+            try:
+                return {'question': kwargs['question'], 'answers': self.answer(**kwargs), 'error': None}
+            except Exception as e:
+                return {'question': kwargs['question'], 'answers': None, 'error': e}
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(self._inherit_priority(answer_one), arguments))
 
     def get_inbox(self, read='both', answered='both', search_term='', number_of_items=30, offset=0):
         """
@@ -219,12 +757,41 @@ class CapeClient:
         :param offset: The starting point in the list of inbox items, used in conjunction with number_of_tems to retrieve multiple batches of inbox items.
         :return: A list of inbox items in reverse chronological order (newest first).
         """
-        r = self._raw_api_call('inbox/get-inbox', {'read': str(read),
-                                                   'answered': str(answered),
-                                                   'searchTerm': search_term,
-                                                   'numberOfItems': str(number_of_items),
-                                                   'offset': str(offset)})
-        return r.json()['result']
+        r = self._raw_api_call('inbox/get-inbox',
+                               inbox_parameters(read, answered, search_term, number_of_items, offset))
+        return r.result
+
+    def iter_inbox(self, read='both', answered='both', search_term='', page_size=30, prefetch=1):
+        """
+        Iterate over all of the items in the current user's inbox, fetching pages in the background.
+
+        :param read: Filter messages based on whether they have been read.
+        :param answered: Filter messages based on whether they have been answered.
+        :param search_term: Filter messages based on whether they contain the search term.
+        :param page_size: The number of inbox items to request at a time.
+        :param prefetch: The number of pages to fetch ahead of the items currently being consumed.
+        :return: A generator of inbox items in reverse chronological order (newest first).
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_inbox(read, answered, search_term, number_of_items, offset)
+
+        return iterate_pages(self._inherit_priority(fetch_page), page_size, prefetch)
+
+    def fetch_all_inbox(self, read='both', answered='both', search_term='', page_size=100, max_concurrency=8):
+        """
+        Retrieve the current user's inbox items, fetching batches concurrently once the total number is known.
+
+        :param read: Filter messages based on whether they have been read.
+        :param answered: Filter messages based on whether they have been answered.
+        :param search_term: Filter messages based on whether they contain the search term.
+        :param page_size: The number of inbox items to request at a time.
+        :param max_concurrency: The maximum number of batches to fetch at the same time.
+        :return: A list of all inbox items in reverse chronological order (newest first).
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_inbox(read, answered, search_term, number_of_items, offset)
+
+        return fetch_all_pages(self._inherit_priority(fetch_page), page_size, max_concurrency)
 
     def mark_inbox_read(self, inbox_id):
         """
@@ -234,7 +801,7 @@ class CapeClient:
         :return: The ID of the inbox item that was marked as read.
         """
         r = self._raw_api_call('inbox/mark-inbox-read', {'inboxId': str(inbox_id)})
-        return r.json()['result']['inboxId']
+        return r.result['inboxId']
 
     def archive_inbox(self, inbox_id):
         """
@@ -244,7 +811,7 @@ class CapeClient:
         :return: The ID of the inbox item that was archived.
         """
         r = self._raw_api_call('inbox/archive-inbox', {'inboxId': str(inbox_id)})
-        return r.json()['result']['inboxId']
+        return r.result['inboxId']
 
     def get_saved_replies(self, search_term='', saved_reply_ids=None, number_of_items=30, offset=0):
         """
@@ -256,16 +823,39 @@ class CapeClient:
         :param offset: The starting point in the list of saved replies, used in conjunction with number_of_tems to retrieve multiple batches of saved replies.
         :return: A list of saved replies in reverse chronological order (newest first).
         """
-        saved_reply_ids = check_list(saved_reply_ids, 'saved reply IDs')
-        params = {'searchTerm': search_term,
-                  'savedReplyIds': json.dumps(saved_reply_ids),
-                  'numberOfItems': str(number_of_items),
-                  'offset': str(offset)}
-        if len(saved_reply_ids) == 0:
-            params.pop('savedReplyIds')
-        r = self._raw_api_call('saved-replies/get-saved-replies', params)
+        params = saved_replies_parameters(search_term, saved_reply_ids, number_of_items, offset)
+        return self._coalesced('saved-replies/get-saved-replies', params,
+                               lambda: self._raw_api_call('saved-replies/get-saved-replies', params).result)
 
-        return r.json()['result']
+    def iter_saved_replies(self, search_term='', saved_reply_ids=None, page_size=30, prefetch=1):
+        """
+        Iterate over all saved replies, fetching pages in the background.
+
+        :param search_term: Filter saved replies based on whether they contain the search term.
+        :param saved_reply_ids: List of saved reply IDs to return.
+        :param page_size: The number of saved replies to request at a time.
+        :param prefetch: The number of pages to fetch ahead of the items currently being consumed.
+        :return: A generator of saved replies in reverse chronological order (newest first).
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_saved_replies(search_term, saved_reply_ids, number_of_items, offset)
+
+        return iterate_pages(self._inherit_priority(fetch_page), page_size, prefetch)
+
+    def fetch_all_saved_replies(self, search_term='', saved_reply_ids=None, page_size=100, max_concurrency=8):
+        """
+        Retrieve all saved replies, fetching batches concurrently once the total number is known.
+
+        :param search_term: Filter saved replies based on whether they contain the search term.
+        :param saved_reply_ids: List of saved reply IDs to return.
+        :param page_size: The number of saved replies to request at a time.
+        :param max_concurrency: The maximum number of batches to fetch at the same time.
+        :return: A list of all saved replies in reverse chronological order (newest first).
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_saved_replies(search_term, saved_reply_ids, number_of_items, offset)
+
+        return fetch_all_pages(self._inherit_priority(fetch_page), page_size, max_concurrency)
 
     def create_saved_reply(self, question, answer):
         return self.add_saved_reply(question, answer)
@@ -286,7 +876,7 @@ class CapeClient:
         r = self._raw_api_call('saved-replies/add-saved-reply', {'question': question,
                                                                  'answer': answer,
                                                                  'replace': str(replace)})
-        return r.json()['result']
+        return r.result
 
     def delete_saved_reply(self, reply_id):
         """
@@ -296,7 +886,7 @@ class CapeClient:
         :return: The ID of the saved reply that was deleted.
         """
         r = self._raw_api_call('saved-replies/delete-saved-reply', {'replyId': str(reply_id)})
-        return r.json()['result']['replyId']
+        return r.result['replyId']
 
     def add_paraphrase_question(self, reply_id, question):
         """
@@ -308,7 +898,7 @@ class CapeClient:
         """
         r = self._raw_api_call('saved-replies/add-paraphrase-question',
                                {'replyId': str(reply_id), 'question': question})
-        return r.json()['result']['questionId']
+        return r.result['questionId']
 
     def edit_paraphrase_question(self, question_id, question):
         """
@@ -320,7 +910,7 @@ class CapeClient:
         """
         r = self._raw_api_call('saved-replies/edit-paraphrase-question',
                                {'questionId': str(question_id), 'question': question})
-        return r.json()['result']['questionId']
+        return r.result['questionId']
 
     def edit_canonical_question(self, reply_id, question):
         """
@@ -332,7 +922,7 @@ class CapeClient:
         """
         r = self._raw_api_call('saved-replies/edit-canonical-question',
                                {'replyId': str(reply_id), 'question': question})
-        return r.json()['result']['replyId']
+        return r.result['replyId']
 
     def delete_paraphrase_question(self, question_id):
         """
@@ -342,7 +932,7 @@ class CapeClient:
         :return: The ID of the paraphrase question that was deleted.
         """
         r = self._raw_api_call('saved-replies/delete-paraphrase-question', {'questionId': str(question_id)})
-        return r.json()['result']['questionId']
+        return r.result['questionId']
 
     def add_answer(self, reply_id, answer):
         """
@@ -353,7 +943,7 @@ class CapeClient:
         :return: The ID of the newly created answer.
         """
         r = self._raw_api_call('saved-replies/add-answer', {'replyId': str(reply_id), 'answer': answer})
-        return r.json()['result']['answerId']
+        return r.result['answerId']
 
     def edit_answer(self, answer_id, answer):
         """
@@ -364,7 +954,7 @@ class CapeClient:
         :return: The ID of the answer that was modified.
         """
         r = self._raw_api_call('saved-replies/edit-answer', {'answerId': str(answer_id), 'answer': answer})
-        return r.json()['result']['answerId']
+        return r.result['answerId']
 
     def delete_answer(self, answer_id):
         """
@@ -374,7 +964,131 @@ class CapeClient:
         :return: The ID of the answer that was deleted.
         """
         r = self._raw_api_call('saved-replies/delete-answer', {'answerId': str(answer_id)})
-        return r.json()['result']['answerId']
+        return r.result['answerId']
+
+    def _import_records(self, records, import_record, workers, summary, start=0, retry=(), checkpoint=None,
+                        checkpoint_interval=100):
+        """
+        Run import_record() on each record from start onwards, and those before it listed in retry, with up to workers
+        at the same time.
+
+        Records are read as they're needed and completed in order, adding the result of import_record() to the count
+        of that name in summary or the record's 'index', 'question' and error to summary['failed']. The checkpoint
+        records the number of records done and the indexes of those which 'failed' (or haven't been retried yet), so
+        resuming from it retries them.
+        """
+        pending = deque()
+        failed = set(retry)
+        progress = {'records_done': start, 'finished': 0}
+
+        def write_checkpoint():
+            state = {'records_done': progress['records_done']}
+            if failed:
+                state['failed'] = sorted(failed)
+            write_json_file(checkpoint, state)
+
+        def finish_oldest():
+            index, record, future = pending.popleft()
+            failed.discard(index)
+            try:
+                summary[future.result()] += 1
+            except Exception as e:
+                failed.add(index)
+                question = record.get('question') if isinstance(record, dict) else None
+                summary['failed'].append({'index': index, 'question': question, 'error': e})
+            progress['records_done'] = max(progress['records_done'], index + 1)
+            progress['finished'] += 1
+            if checkpoint is not None and progress['finished'] % checkpoint_interval == 0:
+                write_checkpoint()
+
+        retry = set(retry)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                try:
+                    for index, record in enumerate(records):
+                        if index < start and index not in retry:
+                            continue
+                        pending.append((index, record,
+                                        executor.submit(self._inherit_priority(import_record, BULK), record)))
+                        if len(pending) >= 2 * workers:
+                            finish_oldest()
+                finally:
+                    while pending:
+                        finish_oldest()
+        finally:
+            # Written even if reading the records failed, so the import can be resumed after the records finished.
+            if checkpoint is not None:
+                write_checkpoint()
+
+    def import_saved_replies(self, source, format=None, workers=8, replace=True, checkpoint=None,
+                             checkpoint_interval=100):
+        """
+        Create saved replies from a CSV or JSON lines file.
+
+        Records are read as they're needed. Each saved reply is created before its additional answers and paraphrase
+        questions are added concurrently, and up to workers records are imported at the same time. Existing saved
+        replies are matched by their canonical question using a single listing taken when the import starts.
+
+        Each record has a 'question', its 'answers' (or a single 'answer') and optionally 'paraphrase_questions'. In CSV
+        files these are the columns and the list columns hold either a single value or a JSON array.
+
+        :param source: A path, a text file object or an iterable of record dictionaries.
+        :param format: 'csv' or 'jsonl' (Default: 'csv' for file names ending with .csv, otherwise 'jsonl').
+        :param workers: The maximum number of records, and of answers and paraphrases, to submit at the same time.
+        :param replace: If true the answers of existing saved replies are replaced and any new paraphrase questions
+            added, if false records whose question already exists are skipped.
+        :param checkpoint: A file to record progress in, if it exists the records it has recorded as done are skipped
+            and those it recorded as failed are retried, so an interrupted import can be resumed (delete it to start
+            from the beginning).
+        :param checkpoint_interval: The number of records to import between updates of the checkpoint.
+        :return: A dictionary containing the number of records 'imported', 'skipped' and 'resumed' past and a list of
+            dictionaries containing the 'index', 'question' and 'error' of each record which 'failed'.
+        """
+        progress = read_json_file(checkpoint) if checkpoint is not None else {}
+        start = progress.get('records_done', 0)
+        retry = progress.get('failed', [])
+        summary = {'imported': 0, 'skipped': 0, 'resumed': start - len(retry), 'failed': []}
+        existing = {reply['canonicalQuestion']: reply for reply in self.fetch_all_saved_replies()}
+
+        def import_record(record, fanout):
+            record = saved_reply_record(record)
+            current = existing.get(record['question'])
+            if current is not None and not replace:
+                return 'skipped'
+            reply_id = self.add_saved_reply(record['question'], record['answers'][0], replace=replace)['replyId']
+            known = set(paraphrase['question'] for paraphrase in current['paraphraseQuestions']) if current else set()
+            calls = [(self.add_answer, answer) for answer in record['answers'][1:]]
+            calls.extend((self.add_paraphrase_question, question) for question in record['paraphrase_questions']
+                         if question not in known)
+            list(fanout.map(self._inherit_priority(lambda call: call[0](reply_id, call[1]), BULK), calls))
+            return 'imported'
+
+        with ThreadPoolExecutor(max_workers=workers) as fanout:
+            self._import_records(read_records(source, format, decode=False),
+                                 lambda record: import_record(record, fanout), workers, summary, start, retry,
+                                 checkpoint, checkpoint_interval)
+        return summary
+
+    def export_saved_replies(self, sink, format=None, page_size=100):
+        """
+        Write every saved reply to a CSV or JSON lines file which import_saved_replies() can read.
+
+        Saved replies are written as they're retrieved so the whole collection is never held in memory.
+
+        :param sink: A path or a text file object.
+        :param format: 'csv' or 'jsonl' (Default: 'csv' for file names ending with .csv, otherwise 'jsonl').
+        :param page_size: The number of saved replies to request at a time.
+        :return: The number of saved replies written.
+        """
+        count = 0
+        with record_writer(sink, format) as writer:
+            for reply in self.iter_saved_replies(page_size=page_size):
+                writer.write({'question': reply['canonicalQuestion'],
+                              'answers': [answer['answer'] for answer in reply['answers']],
+                              'paraphrase_questions': [question['question']
+                                                       for question in reply['paraphraseQuestions']]})
+                count += 1
+        return count
 
     def get_documents(self, document_ids=None, number_of_items=30, offset=0):
         """
@@ -385,14 +1099,37 @@ class CapeClient:
         :param offset: The starting point in the list of documents, used in conjunction with number_of_items to retrieve multiple batches of documents.
         :return: A list of documents in reverse chronological order (newest first).
         """
-        document_ids = check_list(document_ids, 'document IDs')
-        params = {'documentIds': json.dumps(document_ids),
-                  'numberOfItems': str(number_of_items),
-                  'offset': str(offset)}
-        if len(document_ids) == 0:
-            params.pop('documentIds')
-        r = self._raw_api_call('documents/get-documents', params)
-        return r.json()['result']
+        params = documents_parameters(document_ids, number_of_items, offset)
+        return self._coalesced('documents/get-documents', params,
+                               lambda: self._raw_api_call('documents/get-documents', params).result)
+
+    def iter_documents(self, document_ids=None, page_size=30, prefetch=1):
+        """
+        Iterate over all of this user's documents, fetching pages in the background.
+
+        :param document_ids: A list of documents to return.
+        :param page_size: The number of documents to request at a time.
+        :param prefetch: The number of pages to fetch ahead of the items currently being consumed.
+        :return: A generator of documents in reverse chronological order (newest first).
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_documents(document_ids, number_of_items, offset)
+
+        return iterate_pages(self._inherit_priority(fetch_page), page_size, prefetch)
+
+    def fetch_all_documents(self, document_ids=None, page_size=100, max_concurrency=8):
+        """
+        Retrieve all of this user's documents, fetching batches concurrently once the total number is known.
+
+        :param document_ids: A list of documents to return.
+        :param page_size: The number of documents to request at a time.
+        :param max_concurrency: The maximum number of batches to fetch at the same time.
+        :return: A list of all documents in reverse chronological order (newest first).
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_documents(document_ids, number_of_items, offset)
+
+        return fetch_all_pages(self._inherit_priority(fetch_page), page_size, max_concurrency)
 
     def upload_document(self, title, text=None, file_path=None, document_id='', origin='', replace=False,
                         document_type=None, monitor_callback=None):
@@ -404,13 +1141,13 @@ class CapeClient:
         Create a new document or replace an existing document.
 
         :param title: The title to give the new document.
-        :param text: The plain text contents of the document (either text or file_path must be supplied).
+        :param text: The contents of the document as a string, bytes-like object, binary file object or iterable of chunks (either text or file_path must be supplied). Contents are streamed rather than loaded into memory.
         :param file_path: A file to upload (either text or file_path must be supplied).
         :param document_id: The ID to give the new document (Default: An SHA256 hash of the document contents).
         :param origin: Where the document came from.
         :param replace: If true and a document already exists with the same document ID it will be overwritten with the new upload. If false an error is returned when a document ID already exists.
         :param document_type: Whether this document was created by inputting text or uploading a file (if not set this will be automatically determined).
-        :param monitor_callback: A method to call with updates on the file upload progress.
+        :param monitor_callback: A method to call with updates on the file upload progress, it receives a monitor providing bytes_read and len (None when text is an iterable of chunks).
         :return: The ID of the uploaded document.
         """
         if text is not None:
@@ -425,18 +1162,189 @@ class CapeClient:
         elif file_path is not None:
             if document_type is None:
                 document_type = 'file'
-            directory, file_name = os.path.split(file_path)
-            fh = open(file_path, 'rb')
-            r = self._raw_api_call('documents/add-document', {'title': title,
-                                                              'text': fh,
-                                                              'documentId': document_id,
-                                                              'origin': origin,
-                                                              'replace': str(replace)},
-                                   monitor_callback=monitor_callback)
-            fh.close()
+            with open(file_path, 'rb') as fh:
+                r = self._raw_api_call('documents/add-document', {'title': title,
+                                                                  'text': fh,
+                                                                  'documentId': document_id,
+                                                                  'origin': origin,
+                                                                  'replace': str(replace)},
+                                       monitor_callback=monitor_callback)
         else:
             raise CapeException("Either the 'text' or the 'file_path' parameter are required for document uploads.")
-        return r.json()['result']['documentId']
+        return r.result['documentId']
+
+    def add_documents(self, paths, workers=8, replace=False, check_batch_size=100, monitor_callback=None):
+        """
+        Upload many files, skipping those which have already been uploaded.
+
+        Each file is hashed locally to find the ID Cape would give it, existing documents are looked up in batches
+        and only files whose ID isn't found are uploaded. Documents are titled with their file name.
+
+        :param paths: A file or directory, or an iterable of files and directories (directories are searched recursively).
+        :param workers: The maximum number of files to hash or upload at the same time.
+        :param replace: If true every file is uploaded, replacing any existing document with the same ID.
+        :param check_batch_size: The number of document IDs to look up per get_documents() call.
+        :param monitor_callback: A method to call with a BulkProgress providing the aggregated progress of all uploads.
+        :return: A list of dictionaries, one per file in the order given, containing the 'path', 'document_id' and 'status' ('uploaded', 'skipped' or 'failed') of the file and the 'error' raised if it failed.
+        """
+        files = collect_paths(paths)
+        reports = [{'path': path, 'document_id': None, 'status': None, 'error': None} for path in files]
+        sizes = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def hash_report(report):
+                try:
+                    sizes[report['path']] = os.path.getsize(report['path'])
+                    report['document_id'] = hash_file(report['path'])
+                except OSError as e:
+                    report['status'] = 'failed'
+                    report['error'] = e
+            list(executor.map(hash_report, reports))
+            pending = [report for report in reports if report['status'] is None]
+
+            existing = set()
+            if not replace:
+                existing = self._existing_document_ids(set(report['document_id'] for report in pending),
+                                                       check_batch_size)
+            to_upload = {}
+            for report in pending:
+                if report['document_id'] in existing or report['document_id'] in to_upload:
+                    report['status'] = 'skipped'
+                else:
+                    to_upload[report['document_id']] = report
+
+            progress = BulkProgress({report['path']: sizes[report['path']] for report in to_upload.values()},
+                                    monitor_callback)
+
+            def upload(report):
+                try:
+                    file_name = os.path.basename(report['path'])
+                    report['document_id'] = self.add_document(file_name, file_path=report['path'],
+                                                              document_id=report['document_id'], origin=file_name,
+                                                              replace=replace,
+                                                              monitor_callback=progress.monitor(report['path']))
+                    report['status'] = 'uploaded'
+                except Exception as e:
+                    report['status'] = 'failed'
+                    report['error'] = e
+                progress.file_done()
+            list(executor.map(self._inherit_priority(upload, BULK), to_upload.values()))
+        return reports
+
+    def sync_documents(self, local_root, manifest_path=None, workers=8, dry_run=False, check_batch_size=100,
+                       monitor_callback=None):
+        """
+        Mirror a local folder to Cape, uploading new or changed files and deleting documents for removed files.
+
+        A manifest recording the modification time, size and SHA256 hash of every file is kept between runs, so only
+        files which have changed are re-hashed. Documents use the ID Cape would generate (the SHA256 hash of their
+        contents) and the manifest's document IDs are checked against the server in batches, so only documents
+        missing from Cape are uploaded and only documents previously synced from files which have since been removed
+        or changed are deleted. Documents which weren't created by this sync are never touched.
+
+        :param local_root: The directory to mirror.
+        :param manifest_path: Where to keep the manifest (Default: a .cape-manifest.json file inside local_root).
+        :param workers: The maximum number of files to hash, upload or delete at the same time.
+        :param dry_run: If true nothing is uploaded, deleted or saved and the planned work is returned instead.
+        :param check_batch_size: The number of document IDs to look up per get_documents() call.
+        :param monitor_callback: A method to call with a BulkProgress providing the aggregated progress of all uploads.
+        :return: A dictionary containing the relative paths of files which were (or would be) uploaded under 'upload',
+            the document IDs which were (or would be) deleted under 'delete', the relative paths of files which were
+            already up to date under 'unchanged' and a list of dictionaries containing the 'path' or 'document_id' and
+            'error' of anything that failed under 'failed'.
+        """
+        local_root = os.fspath(local_root)
+        if manifest_path is None:
+            manifest_path = os.path.join(local_root, MANIFEST_NAME)
+        manifest = load_manifest(manifest_path)
+        previous = manifest['files']
+        skip = os.path.abspath(manifest_path)
+        paths = {os.path.relpath(path, local_root).replace(os.sep, '/'): path
+                 for path in collect_paths(local_root) if os.path.abspath(path) != skip}
+        plan = {'upload': [], 'delete': [], 'unchanged': [], 'failed': []}
+        files = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def scan(relative_path):
+                try:
+                    return scan_file(paths[relative_path], previous.get(relative_path))
+                except OSError as e:
+                    plan['failed'].append({'path': relative_path, 'error': e})
+                    return None
+            for relative_path, entry in zip(sorted(paths), executor.map(scan, sorted(paths))):
+                if entry is not None:
+                    files[relative_path] = entry
+                elif relative_path in previous:
+                    # Keep an unreadable file's previous entry so its document isn't deleted
+                    files[relative_path] = dict(previous[relative_path])
+
+            wanted = set(entry['sha256'] for entry in files.values())
+            synced = set(entry['document_id'] for entry in previous.values() if entry.get('document_id'))
+            synced.update(manifest['orphans'])
+            existing = self._existing_document_ids(wanted | synced, check_batch_size)
+
+            to_upload = {}
+            for relative_path in sorted(files):
+                sha256 = files[relative_path]['sha256']
+                if sha256 in existing:
+                    plan['unchanged'].append(relative_path)
+                else:
+                    to_upload.setdefault(sha256, []).append(relative_path)
+            to_delete = sorted((synced & existing) - wanted)
+            if dry_run:
+                plan['upload'] = sorted(relative_path for group in to_upload.values() for relative_path in group)
+                plan['delete'] = to_delete
+                return plan
+
+            progress = BulkProgress({paths[group[0]]: files[group[0]]['size'] for group in to_upload.values()},
+                                    monitor_callback)
+
+            def upload(group):
+                path = paths[group[0]]
+                try:
+                    self.add_document(os.path.basename(path), file_path=path, document_id=files[group[0]]['sha256'],
+                                      origin=group[0], replace=True, monitor_callback=progress.monitor(path))
+                    return True
+                except Exception as e:
+                    plan['failed'].extend({'path': relative_path, 'error': e} for relative_path in group)
+                    return False
+                finally:
+                    progress.file_done()
+
+            def delete(document_id):
+                try:
+                    self.delete_document(document_id)
+                    return True
+                except Exception as e:
+                    plan['failed'].append({'document_id': document_id, 'error': e})
+                    return False
+
+            groups = list(to_upload.values())
+            for group, uploaded in zip(groups, executor.map(self._inherit_priority(upload, BULK), groups)):
+                if uploaded:
+                    existing.add(files[group[0]]['sha256'])
+                    plan['upload'].extend(group)
+            for document_id, deleted in zip(to_delete, executor.map(self._inherit_priority(delete, BULK), to_delete)):
+                if deleted:
+                    plan['delete'].append(document_id)
+                else:
+                    manifest['orphans'].append(document_id)
+
+        for entry in files.values():
+            entry['document_id'] = entry['sha256'] if entry['sha256'] in existing else None
+        manifest['files'] = files
+        manifest['orphans'] = sorted(set(manifest['orphans']) & existing - wanted - set(plan['delete']))
+        write_json_file(manifest_path, manifest)
+        plan['upload'].sort()
+        return plan
+
+    def _existing_document_ids(self, document_ids, batch_size):
+        """
+        Find which of the given document IDs exist on the server, looking them up batch_size at a time.
+        """
+        existing = set()
+        for batch in batches(sorted(document_ids), batch_size):
+            documents = self.get_documents(document_ids=batch, number_of_items=len(batch))
+            existing.update(document['id'] for document in documents['items'])
+        return existing
 
     def delete_document(self, document_id):
         """
@@ -446,7 +1354,7 @@ class CapeClient:
         :return: The ID of the document that was deleted.
         """
         r = self._raw_api_call('documents/delete-document', {'documentId': document_id})
-        return r.json()['result']['documentId']
+        return r.result['documentId']
 
     def add_annotation(self, question, answer, document_id, start_offset=None, end_offset=None, metadata=None):
         """
@@ -466,25 +1374,65 @@ class CapeClient:
         :param metadata: A dictionary containing user definable metadata about this annotation.
         :return: The IDs of the new annotation and answer.
         """
-        params = {
-            'question': question,
-            'answer': answer,
-            'documentId': document_id,
-            'startOffset': str(start_offset),
-            'endOffset': str(end_offset),
-            'metadata': json.dumps(metadata)
-        }
-
-        if start_offset is None:
-            params.pop('startOffset')
-        if end_offset is None:
-            params.pop('endOffset')
-        if metadata is None:
-            params.pop('metadata')
-
+        params = add_annotation_parameters(question, answer, document_id, start_offset, end_offset, metadata)
         r = self._raw_api_call('annotations/add-annotation', params)
 
-        return r.json()['result']
+        return r.result
+
+    def import_annotations(self, records, format=None, workers=8, check_answers=True):
+        """
+        Create annotations and their paraphrase questions from a CSV or JSON lines file.
+
+        Each record's offsets (and, with check_answers, its answer) are checked against the text of its document before
+        anything is sent, so invalid records fail without creating an annotation. The text of each document is
+        retrieved once and shared by all of its records. Up to workers records are imported at the same time, and each
+        annotation's paraphrase questions are added concurrently once it has been created.
+
+        Each record has a 'question', 'answer' and 'document_id' and optionally 'start_offset', 'end_offset',
+        'paraphrase_questions' and 'metadata'. In CSV files these are the columns, paraphrase questions hold either a
+        single value or a JSON array and metadata holds a JSON object.
+
+        :param records: A path, a text file object or an iterable of record dictionaries.
+        :param format: 'csv' or 'jsonl' (Default: 'csv' for file names ending with .csv, otherwise 'jsonl').
+        :param workers: The maximum number of records, and of paraphrase questions, to submit at the same time.
+        :param check_answers: Whether each answer must be the text of its document between its offsets.
+        :return: A dictionary containing the number of records 'imported' and a list of dictionaries containing the
+            'index', 'question' and 'error' of each record which 'failed'.
+        """
+        summary = {'imported': 0, 'failed': []}
+        texts = {}
+        lock = threading.Lock()
+
+        def document_text(document_id):
+            with lock:
+                future = texts.get(document_id)
+                fetch = future is None
+                if fetch:
+                    future = texts[document_id] = Future()
+            if fetch:
+                try:
+                    documents = self.get_documents(document_ids=[document_id], number_of_items=1)['items']
+                    if not documents:
+                        raise CapeException('Document not found: %s' % document_id)
+                    future.set_result(documents[0]['text'])
+                except Exception as e:
+                    future.set_exception(e)
+            return future.result()
+
+        def import_record(record, fanout):
+            record = annotation_record(record)
+            check_annotation_span(record, document_text(record['document_id']), check_answers)
+            annotation_id = self.add_annotation(record['question'], record['answer'], record['document_id'],
+                                                record['start_offset'], record['end_offset'],
+                                                record['metadata'])['annotationId']
+            list(fanout.map(self._inherit_priority(lambda question: self.add_annotation_paraphrase_question(
+                annotation_id, question), BULK), record['paraphrase_questions']))
+            return 'imported'
+
+        with ThreadPoolExecutor(max_workers=workers) as fanout:
+            self._import_records(read_records(records, format, decode=False),
+                                 lambda record: import_record(record, fanout), workers, summary)
+        return summary
 
     def get_annotations(self, search_term='', annotation_ids=None, document_ids=None, pages=None, number_of_items=30,
                         offset=0):
@@ -499,24 +1447,45 @@ class CapeClient:
         :param offset: The starting point in the list of annotations, used in conjunction with number_of_tems to retrieve multiple batches of annotations.
         :return: A list of annotations.
         """
-        annotation_ids = check_list(annotation_ids, 'annotation IDs')
-        document_ids = check_list(document_ids, 'document IDs')
-        pages = check_list(pages, 'pages')
-
-        params = {'searchTerm': search_term,
-                  'annotationIds': json.dumps(annotation_ids),
-                  'documentIds': json.dumps(document_ids),
-                  'pages': json.dumps(pages),
-                  'numberOfItems': str(number_of_items),
-                  'offset': str(offset)}
-        if len(annotation_ids) == 0:
-            params.pop('annotationIds')
-        if len(document_ids) == 0:
-            params.pop('documentIds')
-        if len(pages) == 0:
-            params.pop('pages')
+        params = annotations_parameters(search_term, annotation_ids, document_ids, pages, number_of_items, offset)
         r = self._raw_api_call('annotations/get-annotations', params)
-        return r.json()['result']
+        return r.result
+
+    def iter_annotations(self, search_term='', annotation_ids=None, document_ids=None, pages=None, page_size=30,
+                         prefetch=1):
+        """
+        Iterate over all annotations, fetching pages in the background.
+
+        :param search_term: Filter annotations based on whether they contain the search term.
+        :param annotation_ids: A list of annotations to return/search within (Default: all annotations).
+        :param document_ids: A list of documents to return annotations from (Default: all documents).
+        :param pages: A list of pages to return annotations from (Default: all pages).
+        :param page_size: The number of annotations to request at a time.
+        :param prefetch: The number of pages to fetch ahead of the items currently being consumed.
+        :return: A generator of annotations.
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_annotations(search_term, annotation_ids, document_ids, pages, number_of_items, offset)
+
+        return iterate_pages(self._inherit_priority(fetch_page), page_size, prefetch)
+
+    def fetch_all_annotations(self, search_term='', annotation_ids=None, document_ids=None,
+                              pages=None, page_size=100, max_concurrency=8):
+        """
+        Retrieve all annotations, fetching batches concurrently once the total number is known.
+
+        :param search_term: Filter annotations based on whether they contain the search term.
+        :param annotation_ids: A list of annotations to return/search within (Default: all annotations).
+        :param document_ids: A list of documents to return annotations from (Default: all documents).
+        :param pages: A list of pages to return annotations from (Default: all pages).
+        :param page_size: The number of annotations to request at a time.
+        :param max_concurrency: The maximum number of batches to fetch at the same time.
+        :return: A list of all annotations.
+        """
+        def fetch_page(number_of_items, offset):
+            return self.get_annotations(search_term, annotation_ids, document_ids, pages, number_of_items, offset)
+
+        return fetch_all_pages(self._inherit_priority(fetch_page), page_size, max_concurrency)
 
     def delete_annotation(self, annotation_id):
         """
@@ -528,7 +1497,7 @@ class CapeClient:
         r = self._raw_api_call('annotations/delete-annotation', {
             'annotationId': annotation_id
         })
-        return r.json()['result']['annotationId']
+        return r.result['annotationId']
 
     def edit_annotation_canonical_question(self, annotation_id, question):
         """
@@ -542,7 +1511,7 @@ class CapeClient:
             'annotationId': annotation_id,
             'question': question
         })
-        return r.json()['result']['annotationId']
+        return r.result['annotationId']
 
     def add_annotation_paraphrase_question(self, annotation_id, question):
         """
@@ -556,7 +1525,7 @@ class CapeClient:
             'annotationId': annotation_id,
             'question': question
         })
-        return r.json()['result']['questionId']
+        return r.result['questionId']
 
     def edit_annotation_paraphrase_question(self, question_id, question):
         """
@@ -570,7 +1539,7 @@ class CapeClient:
             'questionId': question_id,
             'question': question
         })
-        return r.json()['result']['questionId']
+        return r.result['questionId']
 
     def delete_annotation_paraphrase_question(self, question_id):
         """
@@ -582,7 +1551,7 @@ class CapeClient:
         r = self._raw_api_call('annotations/delete-paraphrase-question', {
             'questionId': question_id
         })
-        return r.json()['result']['questionId']
+        return r.result['questionId']
 
     def add_annotation_answer(self, annotation_id, answer):
         """
@@ -596,7 +1565,7 @@ class CapeClient:
             'annotationId': annotation_id,
             'answer': answer
         })
-        return r.json()['result']['answerId']
+        return r.result['answerId']
 
     def edit_annotation_answer(self, answer_id, answer):
         """
@@ -610,7 +1579,7 @@ class CapeClient:
             'answerId': answer_id,
             'answer': answer
         })
-        return r.json()['result']['answerId']
+        return r.result['answerId']
 
     def delete_annotation_answer(self, answer_id):
         """
@@ -624,4 +1593,4 @@ class CapeClient:
         r = self._raw_api_call('annotations/delete-answer', {
             'answerId': answer_id
         })
-        return r.json()['result']['answerId']
+        return r.result['answerId']
@@ -0,0 +1,101 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import copy
+import json
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+
+def flight_key(method, account, parameters):
+    """
+    Build the key identifying calls which can share a request.
+
+    :param account: The admin token or login name the call is made with (a user token is one of the parameters).
+    :return: A string identifying the call.
+    """
+    return json.dumps([method, account, sorted((name, value) for name, value in parameters.items())])
+
+
+class SingleFlight:
+    """
+        Shares one request between concurrent identical calls.
+
+        The first call with a key (the leader) makes the request and any others made with the same key before it
+        finishes wait for it, receiving a copy of its result or the exception it raised. A call made after the request
+        has finished makes a new one. Counts are kept per method of the calls made and those that were coalesced.
+        Thread safe, and may be shared between clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._calls = Counter()
+        self._coalesced = Counter()
+
+    def call(self, method, key, function):
+        """
+        Call function(), or wait for the result of a call in progress with the same key.
+
+        :param method: The API method, counts are kept per method.
+        :param key: The key identifying identical calls.
+        :param function: A function making the request.
+        :return: The result of function().
+        """
+        with self._lock:
+            self._calls[method] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = [Future(), 0]
+            else:
+                flight[1] += 1
+                self._coalesced[method] += 1
+        future = flight[0]
+        if not leader:
+            # Callers each get their own copy so one can't modify the result another receives.
+            return copy.deepcopy(future.result())
+        try:
+            result = function()
+        except BaseException as e:
+            self._land(key)
+            future.set_exception(e)
+            raise
+        # The waiting calls copy from a private copy, as the leader may modify the result before they've done so.
+        future.set_result(copy.deepcopy(result) if self._land(key) else result)
+        return result
+
+    def _land(self, key):
+        """
+        :return: The number of calls waiting for the result.
+        """
+        with self._lock:
+            return self._flights.pop(key)[1]
+
+    def stats(self):
+        """
+        :return: A dictionary from API method to a dictionary containing the number of 'calls' made and how many of
+            them were 'coalesced' into another call's request.
+        """
+        with self._lock:
+            return {method: {'calls': calls, 'coalesced': self._coalesced[method]}
+                    for method, calls in self._calls.items()}
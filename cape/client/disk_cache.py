@@ -0,0 +1,260 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import os.path
+import sqlite3
+import threading
+import time
+
+#: The number of answer lookups whose access times are batched before they're written to the database.
+ACCESS_BATCH_SIZE = 100
+
+
+class DiskAnswerCache:
+    """
+        A persistent answer cache stored in an SQLite database.
+
+        The cache can be shared by several processes (e.g. the workers of a web application) by giving them the same
+        path, so answers survive restarts and are shared between workers. It provides the same interface as
+        AnswerCache and can be passed to CapeClient in its place.
+
+        The database records the corpus version its answers were produced from. Whenever a client modifies documents,
+        saved replies, annotations or the default threshold the version is incremented, which discards the answers of
+        every process sharing the cache.
+
+        Lookups only read the database. The time each answer was last used is written in batches (with the next answer
+        stored, or once ACCESS_BATCH_SIZE lookups have been made if the database isn't busy), and the number of answers
+        is checked against max_size every max_size / 100 answers stored, so the cache may briefly hold up to 1% more.
+    """
+
+    def __init__(self, path, max_size=10000, ttl=24 * 60 * 60, timeout=30):
+        """
+
+        :param path: The file to store the cache in, it will be created if it doesn't exist.
+        :param max_size: The maximum number of answers to keep, the least recently used answers are evicted first.
+        :param ttl: The number of seconds an answer remains valid for (None to never expire answers).
+        :param timeout: The number of seconds to wait for another process to release a lock on the database.
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._eviction_interval = max(1, max_size // 100)
+        self._stored = 0
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            connection.execute('INSERT OR IGNORE INTO meta (name, value) VALUES (?, 0)', ('corpus_version',))
+            connection.execute('CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                               'version INTEGER NOT NULL, expires REAL, last_access REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)')
+
+    def _connection(self, write=True, wait=True):
+        """
+        :param write: Whether the transaction writes, if so it takes the database's write lock when it begins.
+        :param wait: Whether to wait for other processes to release the write lock, rather than raise
+            sqlite3.OperationalError.
+        :return: A _Transaction on this thread's connection to the database.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return _Transaction(connection, write, None if wait else self.timeout)
+
+    def __len__(self):
+        with self._connection(write=False) as connection:
+            return connection.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+
+    @property
+    def generation(self):
+        """
+        The corpus version answers are currently being cached for.
+        """
+        with self._connection(write=False) as connection:
+            return self._version(connection)
+
+    def _version(self, connection):
+        return connection.execute("SELECT value FROM meta WHERE name = 'corpus_version'").fetchone()[0]
+
+    def get(self, key):
+        """
+        Retrieve a cached answer.
+
+        :param key: A key created by answer_cache_key().
+        :return: The cached answer, or None if there isn't one valid for the current corpus version.
+        """
+        now = time.time()
+        with self._connection(write=False) as connection:
+            row = connection.execute('SELECT answers.value, answers.expires FROM answers JOIN meta '
+                                     "ON meta.name = 'corpus_version' AND meta.value = answers.version "
+                                     'WHERE answers.key = ?', (key,)).fetchone()
+        # Expired answers are left for purge_expired() or eviction, or replaced when the answer is stored again.
+        hit = row is not None and (row[1] is None or row[1] > now)
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self._accessed[key] = now
+                flush = len(self._accessed) >= ACCESS_BATCH_SIZE
+            else:
+                self.misses += 1
+                flush = False
+        if flush:
+            try:
+                with self._connection(wait=False) as connection:
+                    self._write_accesses(connection)
+            except sqlite3.OperationalError:
+                # Another process is writing, the access times are written with the next answer stored instead.
+                pass
+        return json.loads(row[0]) if hit else None
+
+    def _write_accesses(self, connection):
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+        connection.executemany('UPDATE answers SET last_access = ? WHERE key = ? AND last_access < ?',
+                               [(when, key, when) for key, when in accessed.items()])
+
+    def set(self, key, value, generation=None):
+        """
+        Store an answer.
+
+        :param key: A key created by answer_cache_key().
+        :param value: The answer to store.
+        :param generation: The corpus version when the answer was requested, the answer is discarded if the corpus has
+            changed since.
+        :return:
+        """
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._connection() as connection:
+            version = self._version(connection)
+            if generation is not None and generation != version:
+                return
+            connection.execute('INSERT OR REPLACE INTO answers (key, value, version, expires, last_access) '
+                               'VALUES (?, ?, ?, ?, ?)', (key, json.dumps(value), version, expires, now))
+            if self._accessed:
+                self._write_accesses(connection)
+            with self._lock:
+                self._stored += 1
+                check_size = self._stored % self._eviction_interval == 0
+            excess = 0
+            if check_size:
+                excess = connection.execute('SELECT COUNT(*) FROM answers').fetchone()[0] - self.max_size
+            if excess > 0:
+                connection.execute('DELETE FROM answers WHERE key IN '
+                                   '(SELECT key FROM answers ORDER BY last_access LIMIT ?)', (excess,))
+        if excess > 0:
+            with self._lock:
+                self.evictions += excess
+
+    def clear(self):
+        """
+        Discard all cached answers by moving every process sharing this cache onto a new corpus version.
+
+        :return:
+        """
+        with self._connection() as connection:
+            connection.execute("UPDATE meta SET value = value + 1 WHERE name = 'corpus_version'")
+            connection.execute('DELETE FROM answers')
+
+    def purge_expired(self):
+        """
+        Delete expired answers from the database.
+
+        :return: The number of answers deleted.
+        """
+        with self._connection() as connection:
+            return connection.execute('DELETE FROM answers WHERE expires <= ?', (time.time(),)).rowcount
+
+    def stats(self):
+        """
+        Report the cache's counters.
+
+        :return: A dictionary containing the number of hits, misses and evictions seen by this process, the number of
+            currently cached answers and the current corpus version.
+        """
+        with self._connection(write=False) as connection:
+            size = connection.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+            version = self._version(connection)
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': size,
+                    'corpus_version': version}
+
+    def close(self):
+        """
+        Close this thread's connection to the database.
+
+        :return:
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            if self._accessed:
+                try:
+                    with self._connection(wait=False) as transaction:
+                        self._write_accesses(transaction)
+                except sqlite3.OperationalError:
+                    pass
+            connection.close()
+            self._local.connection = None
+
+
+class _Transaction:
+    """
+        Wraps an autocommit SQLite connection so that 'with' runs a block as a single transaction, an immediate one if
+        it writes. With a busy_timeout the transaction fails straight away if another connection is writing, and the
+        timeout is restored afterwards.
+    """
+
+    def __init__(self, connection, write=True, busy_timeout=None):
+        self.connection = connection
+        self.write = write
+        self.busy_timeout = busy_timeout
+
+    def __enter__(self):
+        if self.busy_timeout is not None:
+            self.connection.execute('PRAGMA busy_timeout = 0')
+        try:
+            self.connection.execute('BEGIN IMMEDIATE' if self.write else 'BEGIN DEFERRED')
+        except BaseException:
+            self._restore_timeout()
+            raise
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.connection.execute('COMMIT')
+            else:
+                self.connection.execute('ROLLBACK')
+        finally:
+            self._restore_timeout()
+
+    def _restore_timeout(self):
+        if self.busy_timeout is not None:
+            self.connection.execute('PRAGMA busy_timeout = %d' % (self.busy_timeout * 1000))
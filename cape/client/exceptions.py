@@ -23,3 +23,25 @@ class CapeException(Exception):
 
     def __init__(self, message):
         self.message = message
+
+
+class CapeTransportError(CapeException):
+    """
+        Raised when an API call fails before the Cape API could handle it, e.g. a connection error or a 502 from a proxy.
+
+        :ivar status_code: The HTTP status code received, None if no response was received.
+        :ivar retry_after: The number of seconds the server asked us to wait before trying again (if any).
+        :ivar connect_failed: Whether no connection to the API could be opened, so the request was never sent.
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None, connect_failed=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.connect_failed = connect_failed
+
+
+class CircuitOpenError(CapeException):
+    """
+        Raised instead of sending an API call while a CircuitBreaker considers the Cape API to be unavailable.
+    """
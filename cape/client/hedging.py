@@ -0,0 +1,180 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class HedgePolicy:
+    """
+        Decides when a duplicate answer request is sent and counts how often that helps.
+
+        With a fixed delay a hedge is sent whenever a request hasn't returned after that many seconds. Without one the
+        delay adapts to the given percentile of the latencies of the last window requests, using initial_delay until
+        min_samples latencies have been seen. A policy may be shared between clients.
+    """
+
+    def __init__(self, delay=None, percentile=0.95, window=200, min_samples=20, initial_delay=0.5, min_delay=0.005):
+        """
+
+        :param delay: The number of seconds to wait before sending a hedge (Default: adapt to recent latencies).
+        :param percentile: The fraction of recent requests expected to finish before a hedge is sent when adapting.
+        :param window: The number of recent latencies to adapt to.
+        :param min_samples: The number of latencies needed before the delay adapts.
+        :param initial_delay: The delay used until min_samples latencies have been seen.
+        :param min_delay: The shortest adaptive delay, which stops a run of fast responses triggering hedges for
+            every request.
+        """
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @property
+    def delay(self):
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(math.ceil(self.percentile * len(latencies))) - 1)
+        return max(self.min_delay, latencies[index])
+
+    def record(self, latency=None, hedged=False, hedge_won=False):
+        """
+        Record the outcome of a hedged call.
+
+        :param latency: The number of seconds the winning request took from when it was sent, if it succeeded.
+        :param hedged: Whether a hedge was sent (one which was still waiting to be sent when the call finished
+            doesn't count).
+        :param hedge_won: Whether the hedge's response was used.
+        """
+        with self._lock:
+            self.requests += 1
+            self.hedges_sent += hedged
+            self.hedges_won += hedge_won
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def stats(self):
+        """
+        :return: A dictionary of the number of 'requests', 'hedges_sent', 'hedges_won' and the current 'delay'.
+        """
+        delay = self.delay
+        with self._lock:
+            return {'requests': self.requests, 'hedges_sent': self.hedges_sent, 'hedges_won': self.hedges_won,
+                    'delay': delay}
+
+
+def _timed(call, sent):
+    started = [time.monotonic()]
+
+    def on_sent():
+        if not sent.is_set():
+            started[0] = time.monotonic()
+            sent.set()
+    result = call(on_sent)
+    return result, time.monotonic() - started[0]
+
+
+def hedged_call(executor, policy, call):
+    """
+    Make a call, sending a duplicate if it hasn't returned within the policy's delay and using whichever succeeds first.
+
+    The delay starts when the request is sent, so time spent waiting for a worker or for the client's own limits
+    doesn't trigger a hedge. A duplicate which has already been sent can't be recalled, its response is discarded when
+    it arrives.
+
+    :param executor: The executor to run both calls on, it needs two free workers per hedged call.
+    :param policy: The HedgePolicy deciding the delay and recording the outcome.
+    :param call: A function which makes the request, taking a function to call as the request is sent.
+    :return: The result of the first call to succeed.
+    """
+    primary_sent = threading.Event()
+    primary = executor.submit(_timed, call, primary_sent)
+    # A call which fails or is cancelled before sending anything mustn't leave us waiting.
+    primary.add_done_callback(lambda future: primary_sent.set())
+    primary_sent.wait()
+    done, _ = wait([primary], timeout=policy.delay)
+    if done:
+        return _finish(policy, done, None, False)
+    hedge_sent = threading.Event()
+    hedge = executor.submit(_timed, call, hedge_sent)
+    pending = {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if any(future.exception() is None for future in done) or not pending:
+            for future in pending:
+                future.cancel()
+            return _finish(policy, done, hedge, hedge_sent.is_set())
+
+
+def _finish(policy, done, hedge, hedged):
+    # Prefer a successful request if both completed together
+    winner = sorted(done, key=lambda future: future.exception() is not None)[0]
+    try:
+        result, latency = winner.result()
+    except BaseException:
+        policy.record(hedged=hedged)
+        raise
+    policy.record(latency, hedged=hedged, hedge_won=winner is hedge)
+    return result
+
+
+async def ahedged_call(policy, call):
+    """
+    Asynchronous version of hedged_call(), call must be a coroutine function. The slower request is cancelled.
+    """
+    started = []
+
+    async def timed():
+        started.append(time.monotonic())
+        result = await call()
+        return result, time.monotonic() - started[-1]
+
+    primary = asyncio.ensure_future(timed())
+    hedge = None
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=policy.delay)
+        if not done:
+            hedge = asyncio.ensure_future(timed())
+            pending = {primary, hedge}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(task.exception() is None for task in done) or not pending:
+                    break
+        # A hedge cancelled before its task began running was never sent.
+        return _finish(policy, done, hedge, len(started) > 1)
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,151 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from .metrics import error_type
+
+#: Parameters whose values are replaced before they're passed to a tracer.
+SECRET_PARAMETERS = frozenset(['password', 'token', 'adminToken'])
+REDACTED = '<redacted>'
+
+_SECRET_QUERY = re.compile(r'((?:^|[?&])(?:%s)=)[^&]*' % '|'.join(sorted(SECRET_PARAMETERS)))
+_connections = threading.local()
+
+
+def redact_parameters(parameters):
+    return {name: REDACTED if name in SECRET_PARAMETERS else value for name, value in parameters.items()}
+
+
+def redact_url(url):
+    return _SECRET_QUERY.sub(r'\1' + REDACTED, url)
+
+
+class CallObservation:
+    """
+        What was seen of a single attempt at an API call, filled in by the client as the call progresses and passed
+        to tracers.
+
+        :ivar method: The API method being called.
+        :ivar url: The URL being called, with any tokens redacted.
+        :ivar parameters: The parameters of the call with any secrets redacted (only set when tracing).
+        :ivar headers: Extra HTTP headers to send, which tracers may add to (e.g. to propagate trace context).
+        :ivar body: The MultipartStream sent as the request body (if any).
+        :ivar status_code: The HTTP status code of the response (if one was received).
+        :ivar response_bytes: The size of the response body.
+        :ivar phases: A dictionary mapping the phases of the call ('encode', 'connect', 'tls', 'send', 'wait',
+            'download' and 'decode') to the seconds spent in each. Phases which didn't happen are left out, e.g. 'connect'
+            when a pooled connection was reused and 'tls' for the asynchronous client, where it's part of 'connect'.
+        :ivar latency: The number of seconds the whole attempt took (set once it has finished).
+        :ivar error: The exception the attempt failed with, or None.
+    """
+
+    def __init__(self, method, url):
+        self.method = method
+        self.url = redact_url(url)
+        self.parameters = None
+        self.headers = {}
+        self.body = None
+        self.status_code = None
+        self.response_bytes = 0
+        self.phases = {}
+        self.latency = None
+        self.error = None
+        self.started = time.perf_counter()
+
+    @property
+    def request_bytes(self):
+        return self.body.bytes_read if self.body is not None else 0
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record_exchange(self, headers_at, body_at):
+        """
+        Split the time between starting the attempt and receiving the response body into phases.
+
+        :param headers_at: The time.perf_counter() value when the response headers were received.
+        :param body_at: The time.perf_counter() value when the response body had been read.
+        """
+        body = self.body
+        if body is not None and body.finished_at is not None:
+            self.add_phase('encode', body.encode_time)
+            self.add_phase('send', body.finished_at - body.started_at - body.encode_time)
+            self.add_phase('wait', headers_at - body.finished_at)
+        else:
+            self.add_phase('wait', headers_at - self.started - self.phases.get('connect', 0.0) -
+                           self.phases.get('tls', 0.0))
+        self.add_phase('download', body_at - headers_at)
+
+
+@contextmanager
+def observe_call(metrics, tracer, method, url, parameters):
+    """
+    Report an attempt at an API call to a metrics sink and a tracer.
+
+    :param metrics: A MetricsSink, or None.
+    :param tracer: A Tracer, or None.
+    :param method: The API method being called.
+    :param url: The URL being called.
+    :param parameters: The parameters of the call.
+    :return: A context manager providing the CallObservation for the client to fill in.
+    """
+    call = CallObservation(method, url)
+    if metrics is None and tracer is None:
+        yield call
+        return
+    if tracer is not None:
+        call.parameters = redact_parameters(parameters)
+        tracer.call_started(call)
+    if metrics is not None:
+        metrics.call_started(method)
+    try:
+        yield call
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        call.latency = time.perf_counter() - call.started
+        if metrics is not None:
+            metrics.call_finished(method, call.latency, call.request_bytes, call.response_bytes,
+                                  error_type(call.error) if call.error is not None else None)
+        if tracer is not None:
+            tracer.call_finished(call)
+
+
+@contextmanager
+def track_connections(call):
+    """
+    Attribute the time spent opening connections on this thread to call, see TimingHTTPAdapter.
+    """
+    _connections.call = call
+    try:
+        yield call
+    finally:
+        _connections.call = None
+
+
+def connection_phase(name, seconds):
+    call = getattr(_connections, 'call', None)
+    if call is not None:
+        call.add_phase(name, seconds)
@@ -0,0 +1,228 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import socket
+import threading
+from bisect import bisect_left
+from .exceptions import CapeTransportError
+
+#: Upper bounds in seconds of the latency histogram buckets, the same defaults Prometheus client libraries use.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def error_type(error):
+    """
+    A short name for the kind of failure an API call ended with, e.g. 'CapeException', 'http_502' or 'ConnectionError'.
+    """
+    if isinstance(error, CapeTransportError):
+        if error.status_code is not None:
+            return 'http_%d' % error.status_code
+        if error.__cause__ is not None:
+            return type(error.__cause__).__name__
+    return type(error).__name__
+
+
+class MetricsSink:
+    """
+        Receives measurements of every attempt at an API call, subclass this to forward them to a monitoring system.
+
+        Sinks are called from whichever thread made the call and must be thread-safe.
+    """
+
+    def call_started(self, method):
+        """
+        Called as an attempt at an API call begins.
+
+        :param method: The API method being called (e.g. 'answer').
+        """
+
+    def call_finished(self, method, latency, request_bytes, response_bytes, error):
+        """
+        Called once an attempt at an API call has completed or failed.
+
+        :param method: The API method that was called.
+        :param latency: The number of seconds the attempt took.
+        :param request_bytes: The size of the request body that was sent.
+        :param response_bytes: The size of the response body that was received.
+        :param error: None if the call succeeded, otherwise a name for the type of error (see error_type()).
+        """
+
+
+class InMemoryMetrics(MetricsSink):
+    """
+        Keeps per-endpoint latency histograms and counters in memory.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+
+        :param buckets: The upper bounds in seconds of the latency histogram buckets.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, method):
+        endpoint = self._endpoints.get(method)
+        if endpoint is None:
+            endpoint = self._endpoints[method] = {'count': 0, 'latency_sum': 0.0,
+                                                  'bucket_counts': [0] * (len(self.buckets) + 1),
+                                                  'request_bytes': 0, 'response_bytes': 0, 'errors': {},
+                                                  'in_flight': 0}
+        return endpoint
+
+    def call_started(self, method):
+        with self._lock:
+            self._endpoint(method)['in_flight'] += 1
+
+    def call_finished(self, method, latency, request_bytes, response_bytes, error):
+        with self._lock:
+            endpoint = self._endpoint(method)
+            endpoint['in_flight'] -= 1
+            endpoint['count'] += 1
+            endpoint['latency_sum'] += latency
+            endpoint['bucket_counts'][bisect_left(self.buckets, latency)] += 1
+            endpoint['request_bytes'] += request_bytes
+            endpoint['response_bytes'] += response_bytes
+            if error is not None:
+                endpoint['errors'][error] = endpoint['errors'].get(error, 0) + 1
+
+    def snapshot(self):
+        """
+        :return: A dictionary mapping each API method called to a dictionary containing its call 'count',
+            'latency_sum', cumulative 'latency_buckets' as a list of (upper bound, count) pairs ending with infinity,
+            'request_bytes', 'response_bytes', 'errors' by type and number of calls 'in_flight'.
+        """
+        with self._lock:
+            snapshot = {}
+            for method, endpoint in self._endpoints.items():
+                cumulative = []
+                total = 0
+                for upper_bound, count in zip(self.buckets + (float('inf'),), endpoint['bucket_counts']):
+                    total += count
+                    cumulative.append((upper_bound, total))
+                snapshot[method] = {'count': endpoint['count'],
+                                    'latency_sum': endpoint['latency_sum'],
+                                    'latency_buckets': cumulative,
+                                    'request_bytes': endpoint['request_bytes'],
+                                    'response_bytes': endpoint['response_bytes'],
+                                    'errors': dict(endpoint['errors']),
+                                    'in_flight': endpoint['in_flight']}
+            return snapshot
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    """
+        Keeps metrics in memory and renders them in the Prometheus text exposition format, e.g. for a /metrics handler.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace='cape_client'):
+        """
+
+        :param buckets: The upper bounds in seconds of the latency histogram buckets.
+        :param namespace: The prefix of every metric name.
+        """
+        super().__init__(buckets)
+        self.namespace = namespace
+
+    def render(self):
+        """
+        :return: The current metrics as a string in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        methods = sorted(snapshot)
+        name = self.namespace + '_request_duration_seconds'
+        lines = ['# HELP %s Latency of Cape API calls.' % name, '# TYPE %s histogram' % name]
+        for method in methods:
+            for upper_bound, count in snapshot[method]['latency_buckets']:
+                lines.append('%s_bucket{method="%s",le="%s"} %d' % (name, _label(method), _number(upper_bound), count))
+            lines.append('%s_sum{method="%s"} %s' % (name, _label(method), _number(snapshot[method]['latency_sum'])))
+            lines.append('%s_count{method="%s"} %d' % (name, _label(method), snapshot[method]['count']))
+        for metric, kind, description in (('request_bytes', 'counter', 'Bytes sent in Cape API request bodies.'),
+                                          ('response_bytes', 'counter', 'Bytes received in Cape API response bodies.'),
+                                          ('in_flight', 'gauge', 'Cape API calls currently in progress.')):
+            name = '%s_%s%s' % (self.namespace, metric, '_total' if kind == 'counter' else '')
+            lines.extend(['# HELP %s %s' % (name, description), '# TYPE %s %s' % (name, kind)])
+            for method in methods:
+                lines.append('%s{method="%s"} %d' % (name, _label(method), snapshot[method][metric]))
+        name = self.namespace + '_errors_total'
+        lines.extend(['# HELP %s Failed Cape API calls by type of error.' % name, '# TYPE %s counter' % name])
+        for method in methods:
+            for error, count in sorted(snapshot[method]['errors'].items()):
+                lines.append('%s{method="%s",type="%s"} %d' % (name, _label(method), _label(error), count))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdMetrics(MetricsSink):
+    """
+        Sends metrics to a StatsD server over UDP.
+
+        For each call a request counter, a timer in milliseconds and byte counters are sent under
+        <prefix>.<method> (with '/' in the method replaced by '.'), along with an in-flight gauge and an
+        errors.<type> counter when a call fails. Sending never raises, metrics are dropped if the server is unreachable.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='cape.client'):
+        """
+
+        :param host: The StatsD server's host name.
+        :param port: The StatsD server's UDP port.
+        :param prefix: The prefix of every metric name.
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, method):
+        return '%s.%s' % (self.prefix, method.replace('/', '.'))
+
+    def _send(self, lines):
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'), self.address)
+        except OSError:
+            pass
+
+    def call_started(self, method):
+        self._send(['%s.in_flight:+1|g' % self._name(method)])
+
+    def call_finished(self, method, latency, request_bytes, response_bytes, error):
+        name = self._name(method)
+        lines = ['%s.in_flight:-1|g' % name,
+                 '%s.requests:1|c' % name,
+                 '%s.latency:%.3f|ms' % (name, latency * 1000),
+                 '%s.request_bytes:%d|c' % (name, request_bytes),
+                 '%s.response_bytes:%d|c' % (name, response_bytes)]
+        if error is not None:
+            lines.append('%s.errors.%s:1|c' % (name, error))
+        self._send(lines)
+
+    def close(self):
+        self._socket.close()
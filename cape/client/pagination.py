@@ -0,0 +1,146 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def iterate_pages(fetch_page, page_size=30, prefetch=1):
+    """
+    Lazily iterate over every item of a paged list endpoint.
+
+    While the items of one page are being consumed the following pages are fetched in the background, at most
+    *prefetch* pages are held in memory in addition to the current one.
+
+    :param fetch_page: A function taking number_of_items and offset and returning a dictionary containing
+        'totalItems' and 'items'.
+    :param page_size: The number of items to request per page.
+    :param prefetch: The number of pages to fetch ahead of the current one (0 to fetch pages only when needed).
+    :return: A generator of items in server order.
+    """
+    if page_size < 1:
+        raise ValueError('Expecting page_size to be at least 1, instead got %s' % page_size)
+    executor = ThreadPoolExecutor(max_workers=prefetch) if prefetch > 0 else None
+    pending = deque()
+    try:
+        page = fetch_page(page_size, 0)
+        total_items = page['totalItems']
+        next_offset = page_size
+        while True:
+            while executor is not None and len(pending) < prefetch and next_offset < total_items:
+                pending.append(executor.submit(fetch_page, page_size, next_offset))
+                next_offset += page_size
+            for item in page['items']:
+                yield item
+            if len(page['items']) < page_size:
+                break
+            if pending:
+                page = pending.popleft().result()
+            elif next_offset < total_items:
+                page = fetch_page(page_size, next_offset)
+                next_offset += page_size
+            else:
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+async def aiterate_pages(fetch_page, page_size=30, prefetch=1):
+    """
+    Asynchronous version of iterate_pages(), fetch_page must be a coroutine function.
+    """
+    if page_size < 1:
+        raise ValueError('Expecting page_size to be at least 1, instead got %s' % page_size)
+    pending = deque()
+    try:
+        page = await fetch_page(page_size, 0)
+        total_items = page['totalItems']
+        next_offset = page_size
+        while True:
+            while len(pending) < prefetch and next_offset < total_items:
+                pending.append(asyncio.ensure_future(fetch_page(page_size, next_offset)))
+                next_offset += page_size
+            for item in page['items']:
+                yield item
+            if len(page['items']) < page_size:
+                break
+            if pending:
+                page = await pending.popleft()
+            elif next_offset < total_items:
+                page = await fetch_page(page_size, next_offset)
+                next_offset += page_size
+            else:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def fetch_all_pages(fetch_page, page_size=100, max_concurrency=8):
+    """
+    Retrieve every item of a paged list endpoint, fetching the pages after the first concurrently.
+
+    The first page reports 'totalItems', which determines the offsets of the remaining pages. Items added or removed
+    while the pages are being fetched may cause items to be missed or repeated.
+
+    :param fetch_page: A function taking number_of_items and offset and returning a dictionary containing
+        'totalItems' and 'items'.
+    :param page_size: The number of items to request per page.
+    :param max_concurrency: The maximum number of pages to fetch at the same time.
+    :return: A list of all items in server order.
+    """
+    if page_size < 1:
+        raise ValueError('Expecting page_size to be at least 1, instead got %s' % page_size)
+    first_page = fetch_page(page_size, 0)
+    items = list(first_page['items'])
+    offsets = range(page_size, first_page['totalItems'], page_size)
+    if len(first_page['items']) < page_size or not offsets:
+        return items
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(offsets))) as executor:
+        for page in executor.map(lambda offset: fetch_page(page_size, offset), offsets):
+            items.extend(page['items'])
+    return items
+
+
+async def afetch_all_pages(fetch_page, page_size=100, max_concurrency=8):
+    """
+    Asynchronous version of fetch_all_pages(), fetch_page must be a coroutine function.
+    """
+    if page_size < 1:
+        raise ValueError('Expecting page_size to be at least 1, instead got %s' % page_size)
+    first_page = await fetch_page(page_size, 0)
+    items = list(first_page['items'])
+    if len(first_page['items']) < page_size:
+        return items
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(offset):
+        async with semaphore:
+            return await fetch_page(page_size, offset)
+
+    for page in await asyncio.gather(*[fetch(offset) for offset in
+                                       range(page_size, first_page['totalItems'], page_size)]):
+        items.extend(page['items'])
+    return items
@@ -0,0 +1,212 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from .exceptions import CapeException, CapeTransportError
+from .instrumentation import REDACTED, SECRET_PARAMETERS
+
+#: Response fields which hold credentials and are redacted in recordings.
+SECRET_RESULTS = frozenset(['adminToken', 'userToken'])
+#: Longer string parameters are recorded as a hash to keep recordings compact.
+MAX_PARAMETER_LENGTH = 256
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _parameter(name, value):
+    if name in SECRET_PARAMETERS:
+        return REDACTED
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return 'sha256:%s' % hashlib.sha256(value).hexdigest()
+    if isinstance(value, str):
+        if len(value) > MAX_PARAMETER_LENGTH:
+            return 'sha256:%s' % hashlib.sha256(value.encode('utf-8')).hexdigest()
+        return value
+    if value is None or isinstance(value, (int, float)):
+        return value
+    # Files and iterables can't be inspected without consuming them
+    return '<stream>'
+
+
+def recorded_parameters(parameters):
+    """
+    The form in which request parameters are stored and matched: secrets are redacted, long values hashed and
+    streamed values replaced with a placeholder.
+    """
+    return OrderedDict((name, _parameter(name, value)) for name, value in sorted(parameters.items()))
+
+
+def _redact_body(content):
+    try:
+        body = json.loads(content.decode('utf-8'))
+    except ValueError:
+        return content.decode('utf-8', 'replace')
+    result = body.get('result') if isinstance(body, dict) else None
+    if isinstance(result, dict) and SECRET_RESULTS.intersection(result):
+        body['result'] = {name: REDACTED if name in SECRET_RESULTS else value for name, value in result.items()}
+    return json.dumps(body, separators=(',', ':'))
+
+
+class TrafficRecorder:
+    """
+        Records every API call made by a client, with the response it received and how long it took, to a JSON lines
+        file (gzip compressed if the path ends with .gz) which a TrafficReplayer can serve back.
+
+        Passwords and tokens are redacted, long parameters are stored as SHA256 hashes and uploaded files aren't
+        stored at all. Each line records the 'method', 'parameters', 'offset' in seconds since recording started,
+        'latency', and either the response's 'status', 'body', 'cookies' and 'retry_after' or the 'error' if no
+        response was received.
+    """
+
+    def __init__(self, path):
+        """
+
+        :param path: The file to write the recording to, it is overwritten.
+        """
+        self.path = path
+        self._file = _open(path, 'w')
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, method, parameters, latency, status=None, content=None, retry_after=None, cookies=None,
+               error=None):
+        """
+        Record a single attempt at an API call.
+
+        :param method: The API method called.
+        :param parameters: The parameters of the call.
+        :param latency: The number of seconds between sending the request and receiving the whole response.
+        :param status: The HTTP status code of the response.
+        :param content: The raw body of the response.
+        :param retry_after: The response's Retry-After header.
+        :param cookies: A dictionary of the cookies set by the response.
+        :param error: A description of the error if no response was received.
+        """
+        entry = OrderedDict([('method', method), ('parameters', recorded_parameters(parameters)),
+                             ('offset', round(time.monotonic() - self._started - latency, 6)),
+                             ('latency', round(latency, 6))])
+        if error is not None:
+            entry['error'] = error
+        else:
+            entry['status'] = status
+            entry['body'] = _redact_body(content)
+            if cookies:
+                entry['cookies'] = {name: REDACTED for name in cookies}
+            if retry_after is not None:
+                entry['retry_after'] = retry_after
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TrafficReplayer:
+    """
+        Serves the responses in a recording made by a TrafficRecorder instead of calling the Cape API.
+
+        Each call is answered with the first unused recorded response to the same method and parameters, or failing
+        that to the same method, in the order they were recorded. Recorded connection errors are raised again as
+        CapeTransportError.
+    """
+
+    def __init__(self, path, speed=None, repeat=False):
+        """
+
+        :param path: The recording to replay.
+        :param speed: If set, each response is delayed by its recorded latency divided by speed (e.g. 1 for the
+            original latencies, 2 for half of them). By default responses are returned immediately.
+        :param repeat: If true recorded responses are reused in rotation once they have all been served, otherwise
+            a CapeException is raised when a call has no unused response.
+        """
+        self.path = path
+        self.speed = speed
+        self.repeat = repeat
+        with _open(path, 'r') as fh:
+            self.entries = [json.loads(line) for line in fh if line.strip()]
+        self._by_request = {}
+        self._by_method = {}
+        for entry in self.entries:
+            self._by_request.setdefault(self._key(entry['method'], entry['parameters']), deque()).append(entry)
+            self._by_method.setdefault(entry['method'], deque()).append(entry)
+        self._served = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(method, parameters):
+        return json.dumps([method, parameters], sort_keys=True)
+
+    def _take(self, queue):
+        while queue:
+            entry = queue.popleft()
+            if self.repeat:
+                queue.append(entry)
+                return entry
+            if id(entry) not in self._served:
+                self._served.add(id(entry))
+                return entry
+        return None
+
+    def next_response(self, method, parameters):
+        """
+        Find the recorded response for an API call.
+
+        :param method: The API method being called.
+        :param parameters: The parameters of the call.
+        :return: A tuple of the recorded entry and the number of seconds to wait before returning it.
+        """
+        key = self._key(method, recorded_parameters(parameters))
+        with self._lock:
+            entry = self._take(self._by_request.get(key, deque()))
+            if entry is None:
+                entry = self._take(self._by_method.get(method, deque()))
+        if entry is None:
+            raise CapeException('No recorded response for %s in %s' % (method, self.path))
+        delay = entry['latency'] / self.speed if self.speed else 0.0
+        return entry, delay
+
+    @staticmethod
+    def response(entry):
+        """
+        :return: A tuple of the status code, body, Retry-After header and cookies of a recorded response.
+        :raises CapeTransportError: If the recorded call received no response.
+        """
+        if 'error' in entry:
+            raise CapeTransportError('Unable to reach the Cape API: %s (replayed)' % entry['error'])
+        return entry['status'], entry['body'].encode('utf-8'), entry.get('retry_after'), entry.get('cookies', {})
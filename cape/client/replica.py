@@ -0,0 +1,387 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import bisect
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from .exceptions import CapeException
+
+WORD = re.compile(r'\w+')
+FETCH_BATCH_SIZE = 100
+
+
+def words(text):
+    return [word.casefold() for word in WORD.findall(text)]
+
+
+def question_key(question):
+    """
+    The key questions are matched by, ignoring case, whitespace and punctuation.
+    """
+    return ' '.join(words(question))
+
+
+def item_text(item):
+    """
+    The searchable text of a saved reply or annotation: its canonical question, answers and paraphrase questions.
+    """
+    return [item['canonicalQuestion']] + [answer['answer'] for answer in item['answers']] + \
+        [question['question'] for question in item['paraphraseQuestions']]
+
+
+class ReplicaStore:
+    """
+        The items of one kind held by a LocalReplica, with a word index, an index of their canonical and paraphrase
+        questions and lookups from answer and paraphrase question IDs to the item they belong to.
+
+        Items are kept in the API's order, newest first. Not thread safe, LocalReplica serialises access.
+    """
+
+    def __init__(self, items=()):
+        self.items = OrderedDict()
+        self.owners = {}
+        self.index = {}
+        self.questions = {}
+        self.vocabulary = []
+        self._vocabulary_stale = False
+        for item in items:
+            self.put(item)
+
+    def put(self, item, newest=False):
+        item_id = item['id']
+        if item_id in self.items:
+            self._unindex(self.items[item_id])
+        elif newest:
+            self.items[item_id] = None
+            self.items.move_to_end(item_id, last=False)
+        self.items[item_id] = item
+        for child in item['answers'] + item['paraphraseQuestions']:
+            self.owners[child['id']] = item_id
+        for word in set(word for text in item_text(item) for word in words(text)):
+            ids = self.index.get(word)
+            if ids is None:
+                ids = self.index[word] = set()
+                self._vocabulary_stale = True
+            ids.add(item_id)
+        for key in self._question_keys(item):
+            self.questions.setdefault(key, set()).add(item_id)
+
+    @staticmethod
+    def _question_keys(item):
+        return set(question_key(question) for question in
+                   [item['canonicalQuestion']] + [question['question'] for question in item['paraphraseQuestions']])
+
+    def remove(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is not None:
+            self._unindex(item)
+
+    def _unindex(self, item):
+        for child in item['answers'] + item['paraphraseQuestions']:
+            self.owners.pop(child['id'], None)
+        for word in set(word for text in item_text(item) for word in words(text)):
+            ids = self.index.get(word)
+            if ids is not None:
+                ids.discard(item['id'])
+                if not ids:
+                    del self.index[word]
+                    self._vocabulary_stale = True
+        for key in self._question_keys(item):
+            ids = self.questions.get(key)
+            if ids is not None:
+                ids.discard(item['id'])
+                if not ids:
+                    del self.questions[key]
+
+    def _prefixed(self, prefix):
+        if self._vocabulary_stale:
+            self.vocabulary = sorted(self.index)
+            self._vocabulary_stale = False
+        ids = set()
+        for i in range(bisect.bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            if not self.vocabulary[i].startswith(prefix):
+                break
+            ids.update(self.index[self.vocabulary[i]])
+        return ids
+
+    def search(self, search_term):
+        """
+        :return: The items with a word starting with each word of the search term, newest first.
+        """
+        matches = None
+        for word in words(search_term or ''):
+            ids = self._prefixed(word)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+        if matches is None:
+            return list(self.items.values())
+        return [item for item_id, item in self.items.items() if item_id in matches]
+
+
+class LocalReplica:
+    """
+        An in-memory copy of a client's saved replies and annotations, searchable and retrievable by ID without
+        calling the API.
+
+        The replica is populated from the paged list endpoints when first used and completely refreshed every
+        refresh_interval seconds in the background. Changes made through the client it was created with are applied
+        before the next lookup, by retrieving just the items which changed, so searches see the client's own edits.
+        Changes made by other clients appear after the next refresh.
+
+        Searches match items with a word (in the canonical question, an answer or a paraphrase question) starting with
+        each word of the search term, ignoring case, so each keystroke of a search box can be looked up locally.
+
+        With answer_locally the client's answer() calls for a single saved reply answer are answered from the replica
+        when the question matches exactly one saved reply's canonical or paraphrase question, ignoring case, whitespace
+        and punctuation. Answers given locally aren't added to the inbox. Until the saved replies have been loaded, and
+        while the replica is out of date, questions are answered by the API and the replica is refreshed in the
+        background.
+    """
+
+    def __init__(self, client, refresh_interval=300.0, page_size=100, answer_locally=False):
+        """
+
+        :param client: The CapeClient to populate the replica with and follow the changes of.
+        :param refresh_interval: Seconds between complete refreshes, or None to only refresh when refresh() is called.
+        :param page_size: The number of items to request at a time when refreshing.
+        :param answer_locally: Whether the client should answer questions matching a saved reply from the replica.
+        """
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self.saved_replies = None
+        self.annotations = None
+        self.refreshed = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.RLock()
+        self._refreshing = False
+        self._stale = False
+        self._changes = 0
+        self._dirty = {'saved_replies': {}, 'annotations': {}}
+        client.corpus_listeners.append(self._corpus_changed)
+        if answer_locally:
+            client.local_answers = self
+
+    def close(self):
+        """
+        Stop following the client's changes and answering its questions.
+        """
+        if self._corpus_changed in self.client.corpus_listeners:
+            self.client.corpus_listeners.remove(self._corpus_changed)
+        if self.client.local_answers is self:
+            self.client.local_answers = None
+
+    def refresh(self):
+        """
+        Replace the contents of the replica with every saved reply and annotation retrieved from the API.
+
+        The saved replies are replaced as soon as they're retrieved, so answers can be given before the annotations
+        have been loaded.
+        """
+        with self._fetch_lock:
+            started = time.monotonic()
+            saved_replies = ReplicaStore(self.client.fetch_all_saved_replies(page_size=self.page_size))
+            with self._lock:
+                self.saved_replies = saved_replies
+            annotations = ReplicaStore(self.client.fetch_all_annotations(page_size=self.page_size))
+            with self._lock:
+                self.annotations = annotations
+                self.refreshed = started
+                self._stale = False
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except CapeException:
+            # The previous contents keep being served and the refresh is attempted again on the next lookup.
+            pass
+        finally:
+            self._refreshing = False
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _mark(self, kind, item_id):
+        self._changes += 1
+        self._dirty[kind][item_id] = self._changes
+
+    def _corpus_changed(self, method, parameters, result):
+        group, _, action = method.partition('/')
+        kind = {'saved-replies': 'saved_replies', 'annotations': 'annotations'}.get(group)
+        with self._lock:
+            if group == 'documents' and self.annotations is not None:
+                document_id = result.get('documentId')
+                for annotation in list(self.annotations.items.values()):
+                    if annotation['documentId'] == document_id:
+                        self._mark('annotations', annotation['id'])
+                return
+            store = getattr(self, kind) if kind is not None else None
+            if store is None:
+                return
+            key = 'replyId' if kind == 'saved_replies' else 'annotationId'
+            item_id = result.get(key) if action in ('add-saved-reply', 'add-annotation') else parameters.get(key)
+            if item_id is None:
+                child_id = parameters.get('questionId', parameters.get('answerId'))
+                item_id = store.owners.get(child_id)
+            if item_id is None:
+                # The change is to something the replica doesn't know about, so it's out of date.
+                self._stale = True
+            else:
+                self._mark(kind, str(item_id))
+
+    def _apply_changes(self, kinds=('saved_replies', 'annotations'), wait=True):
+        """
+        Retrieve the items changed through the client.
+
+        :param kinds: The kinds of item to update.
+        :param wait: Whether to wait for a refresh in progress, rather than give up.
+        :return: Whether the changes were applied.
+        """
+        if not self._fetch_lock.acquire(blocking=wait):
+            return False
+        try:
+            for kind in kinds:
+                fetch = self._fetch_saved_replies if kind == 'saved_replies' else self._fetch_annotations
+                with self._lock:
+                    dirty = dict(self._dirty[kind])
+                if not dirty:
+                    continue
+                item_ids = list(dirty)
+                items = []
+                for start in range(0, len(item_ids), FETCH_BATCH_SIZE):
+                    items.extend(fetch(item_ids[start:start + FETCH_BATCH_SIZE]))
+                with self._lock:
+                    store = getattr(self, kind)
+                    found = {item['id']: item for item in items}
+                    for item_id, change in dirty.items():
+                        if item_id in found:
+                            store.put(found[item_id], newest=True)
+                        else:
+                            store.remove(item_id)
+                        if self._dirty[kind].get(item_id) == change:
+                            del self._dirty[kind][item_id]
+        finally:
+            self._fetch_lock.release()
+        return True
+
+    def _fetch_saved_replies(self, item_ids):
+        return self.client.get_saved_replies(saved_reply_ids=item_ids, number_of_items=len(item_ids))['items']
+
+    def _fetch_annotations(self, item_ids):
+        return self.client.get_annotations(annotation_ids=item_ids, number_of_items=len(item_ids))['items']
+
+    def _current(self):
+        """
+        Bring the replica up to date before a lookup.
+        """
+        if self.annotations is None or self._stale:
+            with self._fetch_lock:
+                # Another thread may have refreshed the replica while this one waited.
+                if self.annotations is None or self._stale:
+                    self.refresh()
+        elif self.refresh_interval is not None and time.monotonic() - self.refreshed >= self.refresh_interval:
+            self._start_refresh()
+        if self._dirty['saved_replies'] or self._dirty['annotations']:
+            self._apply_changes()
+
+    def saved_reply(self, reply_id):
+        """
+        :return: The saved reply with the given ID, or None if there isn't one.
+        """
+        self._current()
+        with self._lock:
+            return copy.deepcopy(self.saved_replies.items.get(reply_id))
+
+    def annotation(self, annotation_id):
+        """
+        :return: The annotation with the given ID, or None if there isn't one.
+        """
+        self._current()
+        with self._lock:
+            return copy.deepcopy(self.annotations.items.get(annotation_id))
+
+    def get_saved_replies(self, search_term='', number_of_items=30, offset=0):
+        """
+        Search the saved replies, like CapeClient.get_saved_replies().
+
+        :param search_term: Only return saved replies with a word starting with each word of the search term.
+        :param number_of_items: The number of saved replies to return.
+        :param offset: The starting point in the list of saved replies.
+        :return: A dictionary containing the 'totalItems' matching and the page of 'items', newest first.
+        """
+        self._current()
+        with self._lock:
+            items = self.saved_replies.search(search_term)
+            return {'totalItems': len(items), 'items': copy.deepcopy(items[offset:offset + number_of_items])}
+
+    def get_annotations(self, search_term='', document_ids=None, pages=None, number_of_items=30, offset=0):
+        """
+        Search the annotations, like CapeClient.get_annotations().
+
+        :param search_term: Only return annotations with a word starting with each word of the search term.
+        :param document_ids: A list of documents to return annotations from (Default: all documents).
+        :param pages: A list of pages to return annotations from (Default: all pages).
+        :param number_of_items: The number of annotations to return.
+        :param offset: The starting point in the list of annotations.
+        :return: A dictionary containing the 'totalItems' matching and the page of 'items', newest first.
+        """
+        self._current()
+        with self._lock:
+            items = self.annotations.search(search_term)
+            if document_ids:
+                items = [item for item in items if item['documentId'] in document_ids]
+            if pages:
+                items = [item for item in items if item.get('page') in pages]
+            return {'totalItems': len(items), 'items': copy.deepcopy(items[offset:offset + number_of_items])}
+
+    def answer(self, question):
+        """
+        Answer a question which matches exactly one saved reply, in the same form as CapeClient.answer().
+
+        :param question: The question to answer.
+        :return: A list containing the saved reply's answer, or None if the question doesn't match exactly one saved
+            reply's canonical or paraphrase question or the replica isn't ready to answer it.
+        """
+        if self.saved_replies is None or self._stale:
+            self._start_refresh()
+            return None
+        if self.refresh_interval is not None and self.refreshed is not None and \
+                time.monotonic() - self.refreshed >= self.refresh_interval:
+            self._start_refresh()
+        if self._dirty['saved_replies'] and not self._apply_changes(['saved_replies'], wait=False):
+            return None
+        with self._lock:
+            reply_ids = self.saved_replies.questions.get(question_key(question))
+            if reply_ids is None or len(reply_ids) != 1:
+                return None
+            reply_id, = reply_ids
+            answer = self.saved_replies.items[reply_id]['answers'][0]['answer']
+        return [{'answerText': answer, 'answerContext': answer, 'confidence': 1.0, 'sourceType': 'saved_reply',
+                 'sourceId': reply_id, 'answerTextStartOffset': 0, 'answerTextEndOffset': len(answer),
+                 'answerContextStartOffset': 0, 'answerContextEndOffset': len(answer)}]
@@ -0,0 +1,57 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from .exceptions import CapeException
+
+
+class ApiResponse:
+    """
+        A decoded response from the Cape API.
+    """
+
+    def __init__(self, status_code, body, cookies=None):
+        """
+
+        :param status_code: The HTTP status code of the response.
+        :param body: The decoded JSON body of the response.
+        :param cookies: A dictionary of the cookies set by the response.
+        """
+        self.status_code = status_code
+        self.body = body
+        self.cookies = cookies if cookies is not None else {}
+
+    @property
+    def success(self):
+        return self.status_code == 200 and self.body['success']
+
+    @property
+    def result(self):
+        return self.body['result']
+
+    def raise_for_failure(self):
+        """
+        Raise a CapeException carrying the server's message if this response reports a failure.
+
+        :return: This response.
+        """
+        if not self.success:
+            raise CapeException(self.body['result']['message'])
+        return self
@@ -0,0 +1,185 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import random
+import threading
+import time
+from .exceptions import CircuitOpenError
+
+#: API methods which only read data (plus answer) and so are safe to send again after a failure.
+IDEMPOTENT_METHODS = frozenset([
+    'user/get-admin-token',
+    'user/get-user-token',
+    'user/get-profile',
+    'user/get-default-threshold',
+    'answer',
+    'inbox/get-inbox',
+    'saved-replies/get-saved-replies',
+    'documents/get-documents',
+    'annotations/get-annotations',
+])
+
+#: HTTP status codes returned by proxies and overloaded backends rather than by the Cape API itself.
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+
+def is_replayable(parameters):
+    """
+    Whether a request body can be rebuilt from its parameters, which isn't the case once a file or iterable of chunks
+    has been streamed.
+    """
+    return all(value is None or isinstance(value, (str, bytes, int, float)) for value in parameters.values())
+
+
+def parse_retry_after(value):
+    """
+    Read the number of seconds from a Retry-After header, HTTP dates aren't supported and are ignored.
+    """
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+        Decides which failed API calls are sent again and how long to wait between attempts.
+
+        Delays grow exponentially from backoff up to max_backoff and, with jitter, a random delay between zero and that
+        value is used so clients which failed together don't retry together. Each call may spend at most budget seconds
+        retrying, counted from its first attempt.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.1, max_backoff=5.0, jitter=True, budget=10.0,
+                 methods=IDEMPOTENT_METHODS, statuses=RETRY_STATUSES):
+        """
+
+        :param max_attempts: The maximum number of times to send a call, including the first attempt (1 disables retries).
+        :param backoff: The delay in seconds before the first retry, doubled for each retry after that.
+        :param max_backoff: The longest delay in seconds between two attempts.
+        :param jitter: If true a random delay between zero and the exponential delay is used ("full jitter").
+        :param budget: The most time in seconds a single call may spend on retries, including waiting.
+        :param methods: The API methods which may be retried (Default: reads and answer).
+        :param statuses: The HTTP status codes which are treated as transient failures.
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.budget = budget
+        self.methods = frozenset(methods)
+        self.statuses = frozenset(statuses)
+
+    def can_retry(self, method, parameters):
+        return self.max_attempts > 1 and method in self.methods and is_replayable(parameters)
+
+    def is_transient(self, error):
+        return error.status_code is None or error.status_code in self.statuses
+
+    def next_delay(self, attempt, started, error=None):
+        """
+        Decide whether to make another attempt after a transient failure.
+
+        :param attempt: The number of attempts made so far.
+        :param started: The time.monotonic() value when the first attempt began.
+        :param error: The CapeTransportError raised by the last attempt, its retry_after is honoured when set.
+        :return: The number of seconds to wait before retrying, or None if the call should fail.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if error is not None and error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        if time.monotonic() - started + delay > self.budget:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+        Fails calls immediately while the Cape API appears to be down instead of letting them queue up.
+
+        After failure_threshold consecutive transient failures the breaker opens and calls raise CircuitOpenError. Once
+        recovery_timeout seconds have passed a single probe call is let through: if it succeeds the breaker closes
+        again, otherwise it stays open for another recovery_timeout. A breaker may be shared between clients.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        """
+
+        :param failure_threshold: The number of consecutive failures which opens the breaker.
+        :param recovery_timeout: The number of seconds to wait before probing an open breaker.
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return self.CLOSED
+            if self._probing or time.monotonic() - self.opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a call may be sent now.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError('The Cape API is unavailable, not retrying for another %.1f seconds.' %
+                                       max(remaining, 0))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def record_abandoned(self):
+        """
+        Called when a call let through by before_call() ended without reaching the API or failing to (e.g. it was
+        cancelled), so another call may probe in its place.
+        """
+        with self._lock:
+            self._probing = False
@@ -0,0 +1,169 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import threading
+import time
+from requests import RequestException, Session
+from .utils import json_loads
+
+#: API methods which are sent to another endpoint after failing with a 5xx or disconnection even if the client's
+#: RetryPolicy doesn't retry them (any call which failed to connect is).
+FAILOVER_METHODS = frozenset(['user/login'])
+
+
+class Endpoint:
+    """
+        One of the URLs an EndpointRouter sends API calls to, with its health, latency estimate and session cookie.
+    """
+
+    def __init__(self, api_base):
+        self.api_base = api_base
+        self.healthy = True
+        self.latency = None
+        self.failed_at = None
+        self.session_cookie = None
+
+    def __repr__(self):
+        return '<Endpoint %s healthy=%s latency=%s>' % (self.api_base, self.healthy, self.latency)
+
+
+class EndpointRouter:
+    """
+        Chooses which of several API URLs each call is sent to.
+
+        Each endpoint is probed every probe_interval seconds in the background, keeping an exponentially weighted
+        moving average of its latency. Calls go to the healthy endpoint with the lowest average (the first listed
+        until they've been measured). An endpoint is unhealthy from a call or probe failing to reach it until a probe
+        succeeds again, and if every endpoint is unhealthy the one which failed longest ago is tried.
+
+        Thread safe. Each endpoint keeps its own session cookie, so a session is never sent to another endpoint.
+    """
+
+    def __init__(self, api_bases, probe_interval=10.0, probe_timeout=2.0, smoothing=0.3,
+                 probe_method='user/get-profile'):
+        """
+
+        :param api_bases: The versioned URLs to send API calls to.
+        :param probe_interval: Seconds between probes of each endpoint, or None to not probe.
+        :param probe_timeout: Seconds a probe may take before the endpoint is considered unhealthy.
+        :param smoothing: The weight of each new latency measurement in the moving average.
+        :param probe_method: The API method probes request, any response from the API counts as healthy.
+        """
+        self.endpoints = [Endpoint(api_base) for api_base in api_bases]
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.smoothing = smoothing
+        self.probe_method = probe_method
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._prober = None
+
+    def choose(self, exclude=()):
+        """
+        :param exclude: Endpoints to avoid (e.g. ones which already failed this call) unless there are no others.
+        :return: The Endpoint to send the next call to.
+        """
+        self._start_probing()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+            if healthy:
+                return min(healthy, key=lambda endpoint: endpoint.latency if endpoint.latency is not None
+                           else float('inf'))
+            return min(candidates, key=lambda endpoint: endpoint.failed_at)
+
+    def endpoint_for(self, url):
+        """
+        :return: The Endpoint a URL belongs to, or None.
+        """
+        for endpoint in self.endpoints:
+            if url.startswith(endpoint.api_base + '/'):
+                return endpoint
+        return None
+
+    def record_success(self, endpoint):
+        with self._lock:
+            endpoint.healthy = True
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.failed_at = time.monotonic()
+
+    def record_latency(self, endpoint, latency):
+        with self._lock:
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.smoothing * (latency - endpoint.latency)
+
+    def clear_sessions(self):
+        with self._lock:
+            for endpoint in self.endpoints:
+                endpoint.session_cookie = None
+
+    def probe(self, session=None):
+        """
+        Probe every endpoint once, updating their health and latency estimates.
+        """
+        session = session if session is not None else Session()
+        for endpoint in self.endpoints:
+            started = time.perf_counter()
+            try:
+                r = session.get('%s/%s' % (endpoint.api_base, self.probe_method), timeout=self.probe_timeout)
+                reached = r.status_code < 500 and 'success' in json_loads(r.content)
+            except (RequestException, ValueError, TypeError):
+                reached = False
+            if not reached:
+                self.record_failure(endpoint)
+                continue
+            self.record_latency(endpoint, time.perf_counter() - started)
+            self.record_success(endpoint)
+
+    def _start_probing(self):
+        if self.probe_interval is None or self._prober is not None:
+            return
+        with self._lock:
+            if self._prober is None and not self._stopped.is_set():
+                self._prober = threading.Thread(target=self._probe_forever, daemon=True)
+                self._prober.start()
+
+    def _probe_forever(self):
+        session = Session()
+        while not self._stopped.is_set():
+            self.probe(session)
+            self._stopped.wait(self.probe_interval)
+        session.close()
+
+    def close(self):
+        """
+        Stop probing the endpoints.
+        """
+        self._stopped.set()
+
+    def stats(self):
+        """
+        :return: A list of dictionaries containing the 'api_base', whether it's 'healthy' and the 'latency' estimate
+            of each endpoint.
+        """
+        with self._lock:
+            return [{'api_base': endpoint.api_base, 'healthy': endpoint.healthy, 'latency': endpoint.latency}
+                    for endpoint in self.endpoints]
@@ -0,0 +1,125 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import heapq
+import itertools
+import threading
+from collections import Counter
+from .exceptions import CapeException
+
+INTERACTIVE = 'interactive'
+NORMAL = 'normal'
+BULK = 'bulk'
+#: Priority classes, in the order they're served.
+PRIORITIES = {INTERACTIVE: 0, NORMAL: 1, BULK: 2}
+#: The priority of calls to each API method which weren't given one.
+DEFAULT_PRIORITIES = {'answer': INTERACTIVE, 'user/login': INTERACTIVE, 'documents/add-document': BULK}
+
+
+def check_priority(priority):
+    if priority not in PRIORITIES:
+        raise CapeException("Expecting priority to be one of %s, instead got %r" % (', '.join(PRIORITIES), priority))
+    return priority
+
+
+class PriorityScheduler:
+    """
+        Decides which API calls are sent when more are waiting than there are connection slots.
+
+        Calls are given one of the priority classes 'interactive', 'normal' or 'bulk'. Waiting calls are sent in
+        priority order, oldest first within a class, so an interactive call overtakes any queued bulk work. reserved
+        of the slots are kept for interactive calls, so a burst of bulk work never leaves an interactive call waiting
+        for another call to finish. Calls already sent are never interrupted.
+
+        Thread safe, and may be shared between clients to schedule all of a process's calls together.
+    """
+
+    def __init__(self, slots=10, reserved=2, priorities=None):
+        """
+
+        :param slots: The number of calls sent at the same time, at most the size of the connection pool (10 by
+            default) so no call waits for a connection.
+        :param reserved: The number of slots only interactive calls may use.
+        :param priorities: A dictionary from API method to the priority class of calls to it which weren't given one,
+            added to DEFAULT_PRIORITIES (other methods are 'normal').
+        """
+        if not 0 <= reserved < slots:
+            raise CapeException('Expecting reserved to be at least 0 and less than slots')
+        self.slots = slots
+        self.reserved = reserved
+        self.priorities = dict(DEFAULT_PRIORITIES, **(priorities or {}))
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._order = itertools.count()
+        self._sent = Counter()
+        self._overtaken = 0
+
+    def priority(self, method, priority=None):
+        """
+        :return: The priority class of a call to method, the given priority if there is one.
+        """
+        return check_priority(priority) if priority is not None else self.priorities.get(method, NORMAL)
+
+    def _available(self, priority):
+        limit = self.slots if priority == INTERACTIVE else self.slots - self.reserved
+        return self.in_use < limit
+
+    def acquire(self, priority):
+        """
+        Wait for a slot to send a call of the given priority class in.
+        """
+        with self._lock:
+            if (not self._waiting or self._waiting[0][0] > PRIORITIES[priority]) and self._available(priority):
+                self._grant(priority)
+                return
+            ready = threading.Event()
+            heapq.heappush(self._waiting, (PRIORITIES[priority], next(self._order), priority, ready))
+        ready.wait()
+
+    def release(self):
+        """
+        Free the slot of a call which has finished, handing it to the next waiting call.
+        """
+        with self._lock:
+            self.in_use -= 1
+            while self._waiting and self._available(self._waiting[0][2]):
+                _, _, priority, ready = heapq.heappop(self._waiting)
+                self._grant(priority)
+                ready.set()
+
+    def _grant(self, priority):
+        self.in_use += 1
+        self._sent[priority] += 1
+        if priority != BULK:
+            # Waiting calls of a lower priority class are overtaken.
+            self._overtaken += sum(1 for entry in self._waiting if entry[0] > PRIORITIES[priority])
+
+    def stats(self):
+        """
+        :return: A dictionary containing the number of slots 'in_use', the number of calls 'waiting' and 'sent' in
+            each priority class and the number of times a waiting call was 'overtaken' by one of a higher class.
+        """
+        with self._lock:
+            waiting = Counter(entry[2] for entry in self._waiting)
+            return {'in_use': self.in_use, 'waiting': {priority: waiting[priority] for priority in PRIORITIES},
+                    'sent': {priority: self._sent[priority] for priority in PRIORITIES},
+                    'overtaken': self._overtaken}
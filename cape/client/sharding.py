@@ -0,0 +1,57 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from .exceptions import CapeException
+
+
+def shard_document_ids(document_ids, shard_size):
+    """
+    Split a list of document IDs into consecutive shards of at most shard_size IDs.
+
+    :return: A list of lists of document IDs.
+    """
+    if shard_size < 1:
+        raise CapeException('Expecting shard_size to be at least 1, instead got %s' % shard_size)
+    return [document_ids[start:start + shard_size] for start in range(0, len(document_ids), shard_size)]
+
+
+def merge_answer_items(item_lists, number_of_items, offset):
+    """
+    Merge the answers to each shard of a question into the window of answers the whole question would have returned.
+
+    Each list must hold the shard's best offset + number_of_items answers. Answers every shard returns (saved replies)
+    are only counted once, and answers with equal confidence keep the order of the shards, so inline text should be
+    searched with the last shard as the API lists its answers after those from documents.
+
+    :param item_lists: The answer items of each shard, in shard order.
+    :return: A list of answer items, highest confidence first.
+    """
+    seen = set()
+    items = []
+    for item_list in item_lists:
+        for item in item_list:
+            key = (item.get('sourceType'), item.get('sourceId'), item.get('answerTextStartOffset'),
+                   item.get('answerTextEndOffset'), item.get('answerText'))
+            if key not in seen:
+                seen.add(key)
+                items.append(item)
+    items.sort(key=lambda item: item['confidence'], reverse=True)
+    return items[int(offset):int(offset) + int(number_of_items)]
@@ -0,0 +1,172 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import io
+import os
+import time
+import uuid
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _is_buffer(value):
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def _str_chunks(value, chunk_size):
+    # Encode large strings a slice at a time so the whole text is never duplicated as bytes.
+    for start in range(0, len(value), chunk_size):
+        yield value[start:start + chunk_size].encode('utf-8')
+
+
+def _utf8_length(value, chunk_size):
+    if hasattr(value, 'isascii') and value.isascii():
+        return len(value)
+    return sum(len(chunk) for chunk in _str_chunks(value, chunk_size))
+
+
+def _remaining_file_length(value):
+    try:
+        if isinstance(value, io.TextIOBase):
+            return None
+        return os.fstat(value.fileno()).st_size - value.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    try:
+        position = value.tell()
+        end = value.seek(0, io.SEEK_END)
+        value.seek(position)
+        return end - position
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+class MultipartStream:
+    """
+        A multipart/form-data request body which is produced lazily as it is sent.
+
+        Field values may be strings, bytes-like objects, file objects or iterables of str/bytes chunks. Values are
+        never copied into a single buffer: bytes-like values are sent as slices of the original, files are read into
+        one fixed-size buffer and strings are encoded a slice at a time.
+
+        The stream also acts as the monitor passed to upload progress callbacks, providing the same bytes_read and len
+        attributes as requests_toolbelt's MultipartEncoderMonitor.
+    """
+
+    def __init__(self, fields, callback=None, chunk_size=CHUNK_SIZE, reuse_buffer=True):
+        """
+
+        :param fields: A dictionary mapping field names to values.
+        :param callback: A function called with this stream each time a chunk has been produced.
+        :param chunk_size: The maximum size of each chunk.
+        :param reuse_buffer: Whether file contents may be yielded as views of a single reused buffer, only safe when
+            each chunk is written out before the next is requested.
+        """
+        self.fields = list(fields.items())
+        self.callback = callback
+        self.chunk_size = chunk_size
+        self.reuse_buffer = reuse_buffer
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self.bytes_read = 0
+        self.len = self._length()
+        # Timings for tracing: seconds spent producing chunks and perf_counter() values when sending began and ended
+        self.encode_time = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    def _field_header(self, name):
+        return ('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (self.boundary, name)).encode('utf-8')
+
+    def _closing_boundary(self):
+        return ('--%s--\r\n' % self.boundary).encode('utf-8')
+
+    def _value_length(self, value):
+        if isinstance(value, str):
+            return _utf8_length(value, self.chunk_size)
+        if _is_buffer(value):
+            return memoryview(value).nbytes
+        if hasattr(value, 'read'):
+            return _remaining_file_length(value)
+        return None
+
+    def _length(self):
+        total = len(self._closing_boundary())
+        for name, value in self.fields:
+            length = self._value_length(value)
+            if length is None:
+                return None
+            total += len(self._field_header(name)) + length + 2
+        return total
+
+    def _value_chunks(self, value):
+        if isinstance(value, str):
+            yield from _str_chunks(value, self.chunk_size)
+        elif _is_buffer(value):
+            view = memoryview(value).cast('B')
+            for start in range(0, len(view), self.chunk_size):
+                yield view[start:start + self.chunk_size]
+        elif hasattr(value, 'read'):
+            yield from self._file_chunks(value)
+        else:
+            for chunk in value:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if len(chunk):
+                    yield chunk
+
+    def _file_chunks(self, value):
+        if self.reuse_buffer and hasattr(value, 'readinto') and not isinstance(value, io.TextIOBase):
+            buffer = bytearray(self.chunk_size)
+            view = memoryview(buffer)
+            while True:
+                size = value.readinto(buffer)
+                if not size:
+                    break
+                yield view[:size]
+        else:
+            while True:
+                chunk = value.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+    def _chunks(self):
+        for name, value in self.fields:
+            yield self._field_header(name)
+            yield from self._value_chunks(value)
+            yield b'\r\n'
+        yield self._closing_boundary()
+
+    def __iter__(self):
+        chunks = self._chunks()
+        self.started_at = time.perf_counter()
+        while True:
+            produce_started = time.perf_counter()
+            chunk = next(chunks, None)
+            self.encode_time += time.perf_counter() - produce_started
+            if chunk is None:
+                break
+            self.bytes_read += len(chunk)
+            yield chunk
+            if self.callback is not None:
+                self.callback(self)
+        self.finished_at = time.perf_counter()
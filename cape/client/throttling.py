@@ -0,0 +1,220 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """
+        A thread safe token bucket allowing rate calls per second on average, with bursts of up to burst calls.
+
+        Calls reserve their token immediately and are told how long to wait for it, so waiting callers are paced in
+        the order they arrived whether they sleep in a thread or in an event loop.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+
+        :param rate: The number of calls allowed per second.
+        :param burst: The number of calls which may be made at once after a quiet period (Default: rate, at least 1).
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token.
+
+        :return: The number of seconds to wait before making the call.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+        Limits the rate of calls to each API method with a separate TokenBucket.
+
+        A limiter may be shared between threads and clients, including AsyncCapeClient.
+    """
+
+    def __init__(self, rates=None, default_rate=None, default_burst=None):
+        """
+
+        :param rates: A dictionary from API method (e.g. 'answer') to its calls per second, or a (rate, burst) tuple.
+        :param default_rate: The calls per second allowed to each method not in rates (Default: unlimited).
+        :param default_burst: The burst allowed to each method not in rates (Default: default_rate).
+        """
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        for method, rate in (rates or {}).items():
+            self._buckets[method] = TokenBucket(*rate) if isinstance(rate, tuple) else TokenBucket(rate)
+
+    def reserve(self, method):
+        """
+        Take a token for a call to method.
+
+        :return: The number of seconds to wait before making the call.
+        """
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            if self.default_rate is None:
+                return 0.0
+            with self._lock:
+                bucket = self._buckets.get(method)
+                if bucket is None:
+                    bucket = self._buckets[method] = TokenBucket(self.default_rate, self.default_burst)
+        return bucket.reserve()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AIMDLimiter:
+    """
+        Limits the number of API calls in progress, adapting the limit to how the Cape API is coping.
+
+        The limit grows additively, by increase per limit calls, while it is fully used and calls succeed quickly. It
+        shrinks multiplicatively, to decrease times its value, when a call fails with a transport error (e.g. a 503 or
+        a connection error) or a call to one of latency_methods takes more than latency_tolerance times the fastest
+        of that method's last window calls. Calls which were already in progress when the limit shrank don't shrink it
+        again.
+
+        A limiter may be shared between threads and clients, including AsyncCapeClient, so for example bulk uploads
+        back off when the latency of answers rises.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, increase=1.0, decrease=0.5, latency_tolerance=2.0,
+                 latency_methods=('answer',), window=100, min_samples=10):
+        """
+
+        :param initial_limit: The number of calls allowed in progress to begin with.
+        :param min_limit: The smallest the limit is reduced to.
+        :param max_limit: The largest the limit grows to.
+        :param increase: How much the limit grows for every limit successful calls.
+        :param decrease: The fraction of the limit kept when the API is overloaded.
+        :param latency_tolerance: How many times slower than the fastest recent call a call may be before the API is
+            considered overloaded.
+        :param latency_methods: The API methods whose latency is watched (uploads' latencies vary with their size).
+        :param window: The number of recent calls of each method the fastest is taken from.
+        :param min_samples: The number of calls of a method needed before its latency is watched.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.latency_methods = frozenset(latency_methods)
+        self.window = window
+        self.min_samples = min_samples
+        self.in_flight = 0
+        self.decreases = 0
+        self._limit = float(initial_limit)
+        self._latencies = {}
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+        self._async_waiters = []
+
+    @property
+    def limit(self):
+        """
+        The number of calls currently allowed in progress.
+        """
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self):
+        """
+        Wait until another call is allowed in progress and count it.
+        """
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def aacquire(self):
+        """
+        Wait in the event loop until another call is allowed in progress and count it.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            await future
+
+    def release(self, method, latency=None, error=None):
+        """
+        Count a call as finished and adapt the limit to its outcome.
+
+        :param method: The API method that was called.
+        :param latency: The number of seconds the call took, None if it says nothing about the API's load (e.g. it
+            wasn't sent).
+        :param error: The CapeTransportError the call failed with, if any.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if latency is not None:
+                if error is not None or self._slow(method, latency):
+                    # Calls started before the last decrease saw the same overload, so only one of them counts.
+                    if time.monotonic() - latency >= self._last_decrease:
+                        self._limit = max(self.min_limit, self._limit * self.decrease)
+                        self._last_decrease = time.monotonic()
+                        self.decreases += 1
+                elif self.in_flight + 1 >= self.limit:
+                    self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+            self._condition.notify_all()
+            for loop, future in self._async_waiters:
+                loop.call_soon_threadsafe(_wake, future)
+            self._async_waiters = []
+
+    def _slow(self, method, latency):
+        if method not in self.latency_methods:
+            return False
+        latencies = self._latencies.get(method)
+        if latencies is None:
+            latencies = self._latencies[method] = deque(maxlen=self.window)
+        slow = len(latencies) >= self.min_samples and latency > self.latency_tolerance * min(latencies)
+        latencies.append(latency)
+        return slow
+
+    def stats(self):
+        """
+        :return: A dictionary containing the current 'limit', the number of calls 'in_flight' and the number of
+            'decreases' of the limit so far.
+        """
+        with self._condition:
+            return {'limit': self.limit, 'in_flight': self.in_flight, 'decreases': self.decreases}
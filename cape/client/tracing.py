@@ -0,0 +1,182 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from .exceptions import CapeException
+from .instrumentation import connection_phase
+from .metrics import error_type
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class Tracer:
+    """
+        Receives a callback as every attempt at an API call starts and finishes, subclass this to trace calls.
+
+        Both callbacks receive the same CallObservation, which provides the API method, the URL and parameters with
+        secrets redacted, and once the call has finished its latency, status code, error and the time spent in each
+        phase of the call. Tracers may add headers to the request in call_started and may store their own state on
+        the observation. Tracers are called from whichever thread made the call and must be thread-safe.
+    """
+
+    def call_started(self, call):
+        """
+        Called before an attempt at an API call is sent.
+
+        :param call: The CallObservation for this attempt.
+        """
+
+    def call_finished(self, call):
+        """
+        Called once an attempt at an API call has completed or failed.
+
+        :param call: The CallObservation for this attempt.
+        """
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+        Records every attempt at an API call as an OpenTelemetry client span, with the time spent in each phase as
+        cape.phase.* attributes, and propagates the trace context to the Cape API in the request headers.
+
+        Requires the optional ``opentelemetry-api`` package.
+    """
+
+    def __init__(self, tracer=None, max_attribute_length=256):
+        """
+
+        :param tracer: The OpenTelemetry tracer to create spans with (Default: the global tracer provider's tracer).
+        :param max_attribute_length: Longer string parameters are truncated before being recorded.
+        """
+        try:
+            from opentelemetry import context, propagate, trace
+        except ImportError:
+            raise CapeException("The OpenTelemetryTracer requires the 'opentelemetry-api' package to be installed.")
+        self._trace = trace
+        self._propagate = propagate
+        self._context = context
+        self.tracer = tracer if tracer is not None else trace.get_tracer('cape.client')
+        self.max_attribute_length = max_attribute_length
+
+    def _attribute(self, value):
+        if isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            return value[:self.max_attribute_length]
+        return '<%s>' % type(value).__name__
+
+    def call_started(self, call):
+        attributes = {'http.method': 'POST' if call.parameters else 'GET', 'http.url': call.url,
+                      'cape.method': call.method}
+        for name, value in call.parameters.items():
+            if value is not None:
+                attributes['cape.parameter.%s' % name] = self._attribute(value)
+        call.span = self.tracer.start_span('cape %s' % call.method, kind=self._trace.SpanKind.CLIENT,
+                                           attributes=attributes)
+        self._propagate.inject(call.headers, context=self._trace.set_span_in_context(call.span))
+
+    def call_finished(self, call):
+        span = call.span
+        for name, seconds in call.phases.items():
+            span.set_attribute('cape.phase.%s' % name, seconds)
+        span.set_attribute('http.request_content_length', call.request_bytes)
+        span.set_attribute('http.response_content_length', call.response_bytes)
+        if call.status_code is not None:
+            span.set_attribute('http.status_code', call.status_code)
+        if call.error is not None:
+            span.set_attribute('error.type', error_type(call.error))
+            span.record_exception(call.error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(call.error)))
+        span.end()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._connect_time = time.perf_counter() - started
+            connection_phase('connect', self._connect_time)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._connect_time = time.perf_counter() - started
+            connection_phase('connect', self._connect_time)
+
+    def connect(self):
+        self._connect_time = 0.0
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            connection_phase('tls', time.perf_counter() - started - self._connect_time)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """
+        A requests transport adapter which reports the time spent opening connections (and TLS handshakes) to the
+        call being traced on the current thread.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                   'https': _TimedHTTPSConnectionPool}
+
+
+def aiohttp_trace_config():
+    """
+    Create an aiohttp TraceConfig which reports the time spent opening connections to the CallObservation passed as
+    each request's trace_request_ctx.
+    """
+    async def connection_create_start(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    async def connection_create_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.add_phase('connect', time.perf_counter() - context.connect_started)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(connection_create_start)
+    trace_config.on_connection_create_end.append(connection_create_end)
+    return trace_config
@@ -0,0 +1,216 @@
+# Copyright (c) 2017 Blemundsbury AI Limited
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import csv
+import json
+import os
+from contextlib import contextmanager
+from .exceptions import CapeException
+
+#: The columns of saved reply CSV files, list columns hold a JSON array.
+SAVED_REPLY_COLUMNS = ('question', 'answers', 'paraphrase_questions')
+#: The columns of annotation CSV files, metadata holds a JSON object.
+ANNOTATION_COLUMNS = ('question', 'answer', 'document_id', 'start_offset', 'end_offset', 'paraphrase_questions',
+                      'metadata')
+
+
+def record_format(target, format=None):
+    """
+    Determine whether records are read from or written to a CSV or JSON lines file.
+
+    :param target: A path or file object.
+    :param format: 'csv' or 'jsonl', or None to decide based on the file name (defaulting to JSON lines).
+    :return: 'csv' or 'jsonl'.
+    """
+    if format is None:
+        name = target if isinstance(target, (str, os.PathLike)) else getattr(target, 'name', '')
+        format = 'csv' if str(name).lower().endswith('.csv') else 'jsonl'
+    if format not in ('csv', 'jsonl'):
+        raise CapeException("Expecting format to be 'csv' or 'jsonl', instead got %s" % format)
+    return format
+
+
+@contextmanager
+def _opened(target, mode):
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, mode, encoding='utf-8', newline='') as fh:
+            yield fh
+    else:
+        yield target
+
+
+def _list_cell(value):
+    if not value:
+        return []
+    if value.startswith('['):
+        try:
+            values = json.loads(value)
+        except ValueError:
+            values = None
+        if isinstance(values, list):
+            return [str(item) for item in values]
+    return [value]
+
+
+def decode_record(record):
+    """
+    Decode a line of a JSON lines file read by read_records(records, decode=False), other records are returned as they
+    are.
+    """
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            raise CapeException('Expecting each line to be a JSON object')
+    return record
+
+
+def saved_reply_record(record):
+    """
+    Normalise a saved reply record to a dictionary with a 'question' and lists of 'answers' and 'paraphrase_questions'.
+
+    Records may give a single 'answer' instead of 'answers', and CSV cells hold either a single value or a JSON array.
+    """
+    record = decode_record(record)
+    answers = record.get('answers', record.get('answer'))
+    paraphrases = record.get('paraphrase_questions')
+    if isinstance(answers, str):
+        answers = _list_cell(answers)
+    if isinstance(paraphrases, str):
+        paraphrases = _list_cell(paraphrases)
+    question = record.get('question')
+    if not question or not answers:
+        raise CapeException('Expecting every saved reply to have a question and at least one answer')
+    return {'question': question, 'answers': list(answers), 'paraphrase_questions': list(paraphrases or [])}
+
+
+def _offset(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CapeException('Expecting %s to be an integer, instead got %r' % (name, value))
+
+
+def annotation_record(record):
+    """
+    Normalise an annotation record to a dictionary with a 'question', 'answer', 'document_id', integer (or None)
+    'start_offset' and 'end_offset', a list of 'paraphrase_questions' and its 'metadata' (or None).
+
+    CSV cells hold offsets as text, paraphrase questions as a single value or a JSON array and metadata as a JSON object.
+    """
+    record = decode_record(record)
+    question = record.get('question')
+    answer = record.get('answer')
+    document_id = record.get('document_id')
+    if not question or not answer or not document_id:
+        raise CapeException('Expecting every annotation to have a question, an answer and a document_id')
+    paraphrases = record.get('paraphrase_questions')
+    if isinstance(paraphrases, str):
+        paraphrases = _list_cell(paraphrases)
+    metadata = record.get('metadata')
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata) if metadata else None
+        except ValueError:
+            raise CapeException('Expecting annotation metadata to be a JSON object, instead got %r' % metadata)
+    return {'question': question, 'answer': answer, 'document_id': document_id,
+            'start_offset': _offset(record.get('start_offset'), 'start_offset'),
+            'end_offset': _offset(record.get('end_offset'), 'end_offset'),
+            'paraphrase_questions': list(paraphrases or []), 'metadata': metadata}
+
+
+def check_annotation_span(record, text, check_answer=True):
+    """
+    Check a normalised annotation's offsets against the text of its document.
+
+    :param record: A record returned by annotation_record().
+    :param text: The text of the annotated document.
+    :param check_answer: Whether the answer must also be the text between the offsets.
+    """
+    start_offset, end_offset = record['start_offset'], record['end_offset']
+    if start_offset is None and end_offset is None:
+        return
+    if start_offset is None or end_offset is None:
+        raise CapeException('Expecting both start_offset and end_offset, or neither')
+    if not 0 <= start_offset < end_offset <= len(text):
+        raise CapeException('Invalid offsets %d-%d for document %s of length %d' %
+                            (start_offset, end_offset, record['document_id'], len(text)))
+    if check_answer and text[start_offset:end_offset] != record['answer']:
+        raise CapeException('Expecting the answer to be the text at offsets %d-%d, instead found %r' %
+                            (start_offset, end_offset, text[start_offset:end_offset]))
+
+
+def read_records(source, format=None, decode=True):
+    """
+    Lazily read records from a CSV file with a header row or a JSON lines file.
+
+    :param source: A path, a text file object or an iterable of dictionaries (which is returned unchanged).
+    :param format: 'csv' or 'jsonl' (Default: based on the file name).
+    :param decode: Whether to decode JSON lines, if false each line is returned as a string to be decoded by
+        decode_record(), so an invalid line fails on its own.
+    :return: A generator of dictionaries.
+    """
+    if not isinstance(source, (str, os.PathLike)) and not hasattr(source, 'read'):
+        yield from source
+        return
+    format = record_format(source, format)
+    with _opened(source, 'r') as fh:
+        if format == 'csv':
+            yield from csv.DictReader(fh)
+        else:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line) if decode else line
+
+
+class RecordWriter:
+    """
+        Writes records one at a time to a CSV or JSON lines file.
+    """
+
+    def __init__(self, fh, format, columns):
+        self.fh = fh
+        self.format = format
+        self.columns = columns
+        if format == 'csv':
+            self._csv = csv.writer(fh)
+            self._csv.writerow(columns)
+
+    def write(self, record):
+        if self.format == 'csv':
+            self._csv.writerow([json.dumps(record[column]) if isinstance(record[column], list) else record[column]
+                                for column in self.columns])
+        else:
+            self.fh.write(json.dumps(record) + '\n')
+
+
+@contextmanager
+def record_writer(sink, format=None, columns=SAVED_REPLY_COLUMNS):
+    """
+    Open a RecordWriter for a path or text file object.
+    """
+    format = record_format(sink, format)
+    with _opened(sink, 'w') as fh:
+        yield RecordWriter(fh, format, columns)
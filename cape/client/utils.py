@@ -1,3 +1,29 @@
+import json
+
+try:
+    import orjson as _fast_json
+except ImportError:
+    try:
+        import ujson as _fast_json
+    except ImportError:
+        _fast_json = None
+
+#: The name of the module used to decode API responses ('orjson', 'ujson' or 'json').
+JSON_BACKEND = _fast_json.__name__ if _fast_json is not None else 'json'
+
+
+def json_loads(data):
+    """
+    Decode a JSON document, using orjson or ujson when one of them is installed.
+
+    :param data: The bytes or string to decode.
+    :return: The decoded object.
+    """
+    if _fast_json is not None:
+        return _fast_json.loads(data)
+    return json.loads(data)
+
+
 def check_list(list_to_check, description):
     if list_to_check is not None:
         if not isinstance(list_to_check, list):
@@ -17,7 +17,6 @@ setup(
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Topic :: Communications :: Chat',
         'Topic :: Scientific/Engineering :: Artificial Intelligence',
@@ -25,9 +24,13 @@ setup(
     ],
     packages=PACKAGES,
     include_package_data=True,
-    python_requires='>=3.5',
+    python_requires='>=3.6',
     install_requires=[
         'requests>=2.18.1',
-        'requests-toolbelt>=0.8.0',
     ],
+    extras_require={
+        'async': ['aiohttp>=3.0.0'],
+        'fast-json': ['orjson'],
+        'opentelemetry': ['opentelemetry-api'],
+    },
 )
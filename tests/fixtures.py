@@ -1,5 +1,6 @@
 import pytest
 from cape.client import CapeClient
+from .local_server import LocalCapeServer, USERNAME, PASSWORD
 
 
 API_URL = 'https://ui-thermocline.thecape.ai/mock/full/api'
@@ -12,3 +13,18 @@ def cc():
     client.login('testuser', 'testpass')
     yield client
     client.logout()
+
+
+@pytest.fixture()
+def local_server():
+    server = LocalCapeServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture()
+def local_cc(local_server):
+    client = CapeClient(local_server.api_base)
+    client.login(USERNAME, PASSWORD)
+    yield client
+    client.logout()
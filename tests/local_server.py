@@ -0,0 +1,561 @@
+"""
+An in-process stand-in for the Cape API.
+
+This implements the endpoints used by CapeClient with an in-memory store so that the client can be exercised without
+network access to a real Cape deployment.
+"""
+import email.parser
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+USERNAME = 'testuser'
+PASSWORD = 'testpass'
+
+THRESHOLDS = {'verylow': 0.0, 'low': 0.1, 'medium': 0.25, 'high': 0.5, 'veryhigh': 0.75}
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+
+
+def _tokens(text):
+    return set(re.findall(r'\w+', text.lower()))
+
+
+def _similarity(question, candidate):
+    question_tokens = _tokens(question)
+    candidate_tokens = _tokens(candidate)
+    if not question_tokens or not candidate_tokens:
+        return 0.0
+    return len(question_tokens & candidate_tokens) / len(question_tokens)
+
+
+def _page(items, parameters):
+    number_of_items = int(parameters.get('numberOfItems', 30))
+    offset = int(parameters.get('offset', 0))
+    return {'totalItems': len(items), 'items': items[offset:offset + number_of_items]}
+
+
+def _json_list(parameters, name):
+    if name not in parameters:
+        return []
+    return json.loads(parameters[name])
+
+
+def _contains(item, search_term, *fields):
+    if not search_term:
+        return True
+    search_term = search_term.lower()
+    for field in fields:
+        value = item.get(field)
+        if isinstance(value, list):
+            if any(search_term in json.dumps(entry).lower() for entry in value):
+                return True
+        elif value is not None and search_term in str(value).lower():
+            return True
+    return False
+
+
+class CapeState:
+    """
+    The data held by a LocalCapeServer.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sessions = set()
+        self.admin_token = 'local-admin-token'
+        self.user_token = 'local-user-token'
+        self.threshold = 'medium'
+        self.forward_email = None
+        self.documents = OrderedDict()
+        self.saved_replies = OrderedDict()
+        self.annotations = OrderedDict()
+        self.inbox = OrderedDict()
+        self.calls = []
+
+    def _newest_first(self, store):
+        return list(reversed(store.values()))
+
+    # Users
+
+    def login(self, parameters, handler):
+        if parameters.get('login') != USERNAME or parameters.get('password') != PASSWORD:
+            raise ApiError('Invalid credentials', 401)
+        session = uuid.uuid4().hex
+        self.sessions.add(session)
+        handler.new_cookie = session
+        return {'message': 'You were logged in'}
+
+    def logout(self, parameters, handler):
+        self.sessions.discard(handler.session)
+        return {'message': 'You were logged out'}
+
+    def get_admin_token(self, parameters, handler):
+        return {'adminToken': self.admin_token}
+
+    def get_user_token(self, parameters, handler):
+        return {'userToken': self.user_token}
+
+    def get_profile(self, parameters, handler):
+        return {'username': USERNAME, 'plan': 'free', 'termsAgreed': True,
+                'forwardEmail': self.forward_email, 'forwardEmailVerified': False}
+
+    def get_default_threshold(self, parameters, handler):
+        return {'threshold': self.threshold}
+
+    def set_default_threshold(self, parameters, handler):
+        threshold = parameters.get('threshold')
+        if threshold not in THRESHOLDS:
+            raise ApiError('Invalid threshold: %s' % threshold)
+        self.threshold = threshold
+        return {'threshold': threshold}
+
+    def set_forward_email(self, parameters, handler):
+        self.forward_email = parameters['email']
+        return {'forwardEmail': self.forward_email}
+
+    # Answering
+
+    def _saved_reply_answers(self, question):
+        items = []
+        for reply in self.saved_replies.values():
+            questions = [reply['canonicalQuestion']] + [q['question'] for q in reply['paraphraseQuestions']]
+            confidence = max(_similarity(question, candidate) for candidate in questions)
+            answer = reply['answers'][0]['answer']
+            items.append({'answerText': answer, 'answerContext': answer, 'confidence': confidence,
+                          'sourceType': 'saved_reply', 'sourceId': reply['id'],
+                          'answerTextStartOffset': 0, 'answerTextEndOffset': len(answer),
+                          'answerContextStartOffset': 0, 'answerContextEndOffset': len(answer)})
+        return items
+
+    def _document_answers(self, question, document_id, text):
+        items = []
+        for match in re.finditer(r'.+?(?:[.!?](?=\s|$)|$)', text, re.DOTALL):
+            sentence = match.group().strip()
+            if not sentence:
+                continue
+            start = match.start() + match.group().index(sentence)
+            end = start + len(sentence)
+            items.append({'answerText': sentence, 'answerContext': sentence,
+                          'confidence': _similarity(question, sentence),
+                          'sourceType': 'document', 'sourceId': document_id,
+                          'answerTextStartOffset': start, 'answerTextEndOffset': end,
+                          'answerContextStartOffset': start, 'answerContextEndOffset': end})
+        return items
+
+    def answer(self, parameters, handler):
+        question = parameters['question']
+        source_type = parameters.get('sourceType', 'all')
+        document_ids = _json_list(parameters, 'documentIds')
+        threshold = THRESHOLDS[parameters.get('threshold', self.threshold)]
+        items = []
+        if source_type in ('all', 'saved_reply'):
+            items.extend(self._saved_reply_answers(question))
+        if source_type in ('all', 'document'):
+            for document in self.documents.values():
+                if document_ids and document['id'] not in document_ids:
+                    continue
+                items.extend(self._document_answers(question, document['id'], document['text']))
+            if 'text' in parameters:
+                items.extend(self._document_answers(question, 'Inline Text', parameters['text']))
+        items = [item for item in items if item['confidence'] > 0 and item['confidence'] >= threshold]
+        items.sort(key=lambda item: item['confidence'], reverse=True)
+        inbox_id = str(len(self.inbox) + 1)
+        self.inbox[inbox_id] = {'id': inbox_id, 'answered': bool(items), 'read': False, 'question': question,
+                                'questionSource': 'API', 'created': int(time.time()), 'answers': items[:1]}
+        return _page(items, parameters)
+
+    # Inbox
+
+    def get_inbox(self, parameters, handler):
+        items = self._newest_first(self.inbox)
+        for name in ('read', 'answered'):
+            value = parameters.get(name, 'both')
+            if value != 'both':
+                items = [item for item in items if item[name] == (value == 'True')]
+        items = [item for item in items if _contains(item, parameters.get('searchTerm'), 'question')]
+        return _page(items, parameters)
+
+    def _inbox_item(self, parameters):
+        inbox_id = parameters['inboxId']
+        if inbox_id not in self.inbox:
+            raise ApiError('Inbox item not found: %s' % inbox_id, 404)
+        return self.inbox[inbox_id]
+
+    def mark_inbox_read(self, parameters, handler):
+        self._inbox_item(parameters)['read'] = True
+        return {'inboxId': parameters['inboxId']}
+
+    def archive_inbox(self, parameters, handler):
+        self._inbox_item(parameters)
+        del self.inbox[parameters['inboxId']]
+        return {'inboxId': parameters['inboxId']}
+
+    # Saved replies
+
+    def get_saved_replies(self, parameters, handler):
+        saved_reply_ids = _json_list(parameters, 'savedReplyIds')
+        items = self._newest_first(self.saved_replies)
+        if saved_reply_ids:
+            items = [item for item in items if item['id'] in saved_reply_ids]
+        items = [item for item in items if _contains(item, parameters.get('searchTerm'), 'canonicalQuestion',
+                                                     'answers', 'paraphraseQuestions')]
+        return _page(items, parameters)
+
+    def add_saved_reply(self, parameters, handler):
+        question = parameters['question']
+        for reply in self.saved_replies.values():
+            if reply['canonicalQuestion'] == question:
+                if parameters.get('replace') != 'True':
+                    raise ApiError('Saved reply already exists for question: %s' % question)
+                answer_id = str(uuid.uuid4())
+                reply['answers'] = [{'id': answer_id, 'answer': parameters['answer']}]
+                reply['modified'] = int(time.time())
+                return {'replyId': reply['id'], 'answerId': answer_id}
+        reply_id = str(uuid.uuid4())
+        answer_id = str(uuid.uuid4())
+        self.saved_replies[reply_id] = {'id': reply_id, 'canonicalQuestion': question,
+                                        'answers': [{'id': answer_id, 'answer': parameters['answer']}],
+                                        'paraphraseQuestions': [], 'created': int(time.time()),
+                                        'modified': int(time.time())}
+        return {'replyId': reply_id, 'answerId': answer_id}
+
+    def _reply(self, reply_id, store=None):
+        store = self.saved_replies if store is None else store
+        if reply_id not in store:
+            raise ApiError('Not found: %s' % reply_id, 404)
+        return store[reply_id]
+
+    def _find(self, store, field, item_id):
+        for item in store.values():
+            for entry in item[field]:
+                if entry['id'] == item_id:
+                    return item, entry
+        raise ApiError('Not found: %s' % item_id, 404)
+
+    def delete_saved_reply(self, parameters, handler):
+        self._reply(parameters['replyId'])
+        del self.saved_replies[parameters['replyId']]
+        return {'replyId': parameters['replyId']}
+
+    def add_paraphrase_question(self, parameters, handler, store=None, id_field='replyId'):
+        item = self._reply(parameters[id_field], store)
+        question_id = str(uuid.uuid4())
+        item['paraphraseQuestions'].append({'id': question_id, 'question': parameters['question']})
+        return {'questionId': question_id}
+
+    def edit_paraphrase_question(self, parameters, handler, store=None):
+        _, entry = self._find(self.saved_replies if store is None else store, 'paraphraseQuestions',
+                              parameters['questionId'])
+        entry['question'] = parameters['question']
+        return {'questionId': parameters['questionId']}
+
+    def delete_paraphrase_question(self, parameters, handler, store=None):
+        item, entry = self._find(self.saved_replies if store is None else store, 'paraphraseQuestions',
+                                 parameters['questionId'])
+        item['paraphraseQuestions'].remove(entry)
+        return {'questionId': parameters['questionId']}
+
+    def edit_canonical_question(self, parameters, handler, store=None, id_field='replyId'):
+        self._reply(parameters[id_field], store)['canonicalQuestion'] = parameters['question']
+        return {id_field: parameters[id_field]}
+
+    def add_answer(self, parameters, handler, store=None, id_field='replyId'):
+        item = self._reply(parameters[id_field], store)
+        answer_id = str(uuid.uuid4())
+        item['answers'].append({'id': answer_id, 'answer': parameters['answer']})
+        return {'answerId': answer_id}
+
+    def edit_answer(self, parameters, handler, store=None):
+        _, entry = self._find(self.saved_replies if store is None else store, 'answers', parameters['answerId'])
+        entry['answer'] = parameters['answer']
+        return {'answerId': parameters['answerId']}
+
+    def delete_answer(self, parameters, handler, store=None):
+        item, entry = self._find(self.saved_replies if store is None else store, 'answers', parameters['answerId'])
+        if len(item['answers']) == 1:
+            raise ApiError('At least one answer must remain')
+        item['answers'].remove(entry)
+        return {'answerId': parameters['answerId']}
+
+    # Documents
+
+    def get_documents(self, parameters, handler):
+        document_ids = _json_list(parameters, 'documentIds')
+        items = self._newest_first(self.documents)
+        if document_ids:
+            items = [item for item in items if item['id'] in document_ids]
+        return _page(items, parameters)
+
+    def add_document(self, parameters, handler):
+        text = parameters['text']
+        document_id = parameters.get('documentId') or hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if document_id in self.documents:
+            if parameters.get('replace') != 'True':
+                raise ApiError('Document already exists: %s' % document_id)
+            del self.documents[document_id]
+        self.documents[document_id] = {'id': document_id, 'title': parameters['title'],
+                                       'origin': parameters.get('origin', ''), 'text': text,
+                                       'created': int(time.time())}
+        return {'documentId': document_id}
+
+    def delete_document(self, parameters, handler):
+        document_id = parameters['documentId']
+        if document_id not in self.documents:
+            raise ApiError('Document not found: %s' % document_id, 404)
+        del self.documents[document_id]
+        return {'documentId': document_id}
+
+    # Annotations
+
+    def get_annotations(self, parameters, handler):
+        annotation_ids = _json_list(parameters, 'annotationIds')
+        document_ids = _json_list(parameters, 'documentIds')
+        pages = _json_list(parameters, 'pages')
+        items = self._newest_first(self.annotations)
+        if annotation_ids:
+            items = [item for item in items if item['id'] in annotation_ids]
+        if document_ids:
+            items = [item for item in items if item['documentId'] in document_ids]
+        if pages:
+            items = [item for item in items if item['page'] in pages]
+        items = [item for item in items if _contains(item, parameters.get('searchTerm'), 'canonicalQuestion',
+                                                     'answers', 'paraphraseQuestions')]
+        return _page(items, parameters)
+
+    def add_annotation(self, parameters, handler):
+        document_id = parameters['documentId']
+        if document_id not in self.documents:
+            raise ApiError('Document not found: %s' % document_id, 404)
+        text_length = len(self.documents[document_id]['text'])
+        start_offset = int(parameters['startOffset']) if 'startOffset' in parameters else None
+        end_offset = int(parameters['endOffset']) if 'endOffset' in parameters else None
+        if start_offset is not None and end_offset is not None:
+            if not 0 <= start_offset < end_offset <= text_length:
+                raise ApiError('Invalid annotation offsets')
+        metadata = json.loads(parameters['metadata']) if 'metadata' in parameters else None
+        annotation_id = str(uuid.uuid4())
+        answer_id = str(uuid.uuid4())
+        self.annotations[annotation_id] = {'id': annotation_id, 'canonicalQuestion': parameters['question'],
+                                           'answers': [{'id': answer_id, 'answer': parameters['answer']}],
+                                           'paraphraseQuestions': [], 'documentId': document_id,
+                                           'startOffset': start_offset, 'endOffset': end_offset,
+                                           'metadata': metadata, 'page': (metadata or {}).get('page'),
+                                           'created': int(time.time()), 'modified': int(time.time())}
+        return {'annotationId': annotation_id, 'answerId': answer_id}
+
+    def delete_annotation(self, parameters, handler):
+        self._reply(parameters['annotationId'], self.annotations)
+        del self.annotations[parameters['annotationId']]
+        return {'annotationId': parameters['annotationId']}
+
+    def edit_annotation_canonical_question(self, parameters, handler):
+        return self.edit_canonical_question(parameters, handler, self.annotations, 'annotationId')
+
+    def add_annotation_paraphrase_question(self, parameters, handler):
+        return self.add_paraphrase_question(parameters, handler, self.annotations, 'annotationId')
+
+    def edit_annotation_paraphrase_question(self, parameters, handler):
+        return self.edit_paraphrase_question(parameters, handler, self.annotations)
+
+    def delete_annotation_paraphrase_question(self, parameters, handler):
+        return self.delete_paraphrase_question(parameters, handler, self.annotations)
+
+    def add_annotation_answer(self, parameters, handler):
+        return self.add_answer(parameters, handler, self.annotations, 'annotationId')
+
+    def edit_annotation_answer(self, parameters, handler):
+        return self.edit_answer(parameters, handler, self.annotations)
+
+    def delete_annotation_answer(self, parameters, handler):
+        return self.delete_answer(parameters, handler, self.annotations)
+
+
+ROUTES = {
+    'user/login': ('login', False),
+    'user/logout': ('logout', True),
+    'user/get-admin-token': ('get_admin_token', True),
+    'user/get-user-token': ('get_user_token', True),
+    'user/get-profile': ('get_profile', True),
+    'user/get-default-threshold': ('get_default_threshold', True),
+    'user/set-default-threshold': ('set_default_threshold', True),
+    'user/set-forward-email': ('set_forward_email', True),
+    'answer': ('answer', True),
+    'inbox/get-inbox': ('get_inbox', True),
+    'inbox/mark-inbox-read': ('mark_inbox_read', True),
+    'inbox/archive-inbox': ('archive_inbox', True),
+    'saved-replies/get-saved-replies': ('get_saved_replies', True),
+    'saved-replies/add-saved-reply': ('add_saved_reply', True),
+    'saved-replies/delete-saved-reply': ('delete_saved_reply', True),
+    'saved-replies/add-paraphrase-question': ('add_paraphrase_question', True),
+    'saved-replies/edit-paraphrase-question': ('edit_paraphrase_question', True),
+    'saved-replies/edit-canonical-question': ('edit_canonical_question', True),
+    'saved-replies/delete-paraphrase-question': ('delete_paraphrase_question', True),
+    'saved-replies/add-answer': ('add_answer', True),
+    'saved-replies/edit-answer': ('edit_answer', True),
+    'saved-replies/delete-answer': ('delete_answer', True),
+    'documents/get-documents': ('get_documents', True),
+    'documents/add-document': ('add_document', True),
+    'documents/delete-document': ('delete_document', True),
+    'annotations/get-annotations': ('get_annotations', True),
+    'annotations/add-annotation': ('add_annotation', True),
+    'annotations/delete-annotation': ('delete_annotation', True),
+    'annotations/edit-canonical-question': ('edit_annotation_canonical_question', True),
+    'annotations/add-paraphrase-question': ('add_annotation_paraphrase_question', True),
+    'annotations/edit-paraphrase-question': ('edit_annotation_paraphrase_question', True),
+    'annotations/delete-paraphrase-question': ('delete_annotation_paraphrase_question', True),
+    'annotations/add-answer': ('add_annotation_answer', True),
+    'annotations/edit-answer': ('edit_annotation_answer', True),
+    'annotations/delete-answer': ('delete_annotation_answer', True),
+}
+
+
+def _parse_multipart(content_type, body):
+    message = email.parser.BytesParser().parsebytes(b'Content-Type: ' + content_type.encode('latin-1') +
+                                                    b'\r\n\r\n' + body)
+    parameters = {}
+    for part in message.get_payload():
+        name = part.get_param('name', header='content-disposition')
+        parameters[name] = part.get_payload(decode=True).decode('utf-8')
+    return parameters
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, with Nagle's algorithm the body waits for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(chunks)
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _session(self):
+        for cookie in self.headers.get_all('Cookie', []):
+            for pair in cookie.split(';'):
+                name, _, value = pair.strip().partition('=')
+                if name == 'session':
+                    return value
+        return None
+
+    def _respond(self, status_code, success, result):
+        body = json.dumps({'success': success, 'result': result}).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.new_cookie is not None:
+            self.send_header('Set-Cookie', 'session=%s; Path=/' % self.new_cookie)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        server = self.server.cape_server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self._read_body()
+        content_type = self.headers.get('Content-Type', '')
+        parameters = _parse_multipart(content_type, body) if content_type.startswith('multipart/') else {}
+        method = url.path[len(server.prefix):]
+        self.new_cookie = None
+        self.session = self._session()
+        state = server.state
+        with state.lock:
+            state.calls.append(method)
+            server.last_headers = self.headers
+            failure = server.failures.pop(0) if server.failures else None
+            delay = server.delays.pop(0) if server.delays else 0.0
+        if failure == 'reset':
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if failure is not None:
+            self.send_response(failure)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', '11')
+            self.end_headers()
+            self.wfile.write(b'Bad Gateway')
+            return
+        if server.latency or delay:
+            time.sleep(server.latency + delay)
+        try:
+            if method not in ROUTES:
+                raise ApiError('Unknown method: %s' % method, 404)
+            handler_name, needs_auth = ROUTES[method]
+            with state.lock:
+                authenticated = (self.session in state.sessions or
+                                 query.get('adminToken') == [state.admin_token] or
+                                 (method == 'answer' and query.get('token') == [state.user_token]))
+                if needs_auth and not authenticated:
+                    raise ApiError('Not authenticated', 401)
+                result = getattr(state, handler_name)(parameters, self)
+        except ApiError as exc:
+            self._respond(exc.status_code, False, {'message': exc.message})
+        else:
+            self._respond(200, True, result)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LocalCapeServer:
+    """
+    Serve the Cape API from a background thread on a local port.
+
+    :param latency: Seconds to wait before handling each request.
+
+    Requests fail with the HTTP status codes queued in failures (or drop the connection for 'reset') before any
+    are handled normally, and are slowed down by the extra seconds queued in delays.
+    """
+
+    prefix = '/api/%s/' % '0.1'
+
+    def __init__(self, latency=0.0):
+        self.state = CapeState()
+        self.latency = latency
+        self.failures = []
+        self.delays = []
+        self.last_headers = None
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._httpd.cape_server = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={'poll_interval': 0.05},
+                                        daemon=True)
+
+    @property
+    def api_base(self):
+        return 'http://127.0.0.1:%d/api' % self._httpd.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,95 @@
+import time
+import pytest
+from cape.client import CapeClient, AnswerCache
+from cape.client.cache import answer_cache_key
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+
+
+@pytest.fixture()
+def cached_cc(local_server):
+    client = CapeClient(local_server.api_base, answer_cache=AnswerCache(max_size=2, ttl=60))
+    client.login(USERNAME, PASSWORD)
+    client.add_document("Cape API Documentation", document_text)
+    yield client
+    client.logout()
+
+
+def answer_calls(local_server):
+    return local_server.state.calls.count('answer')
+
+
+def test_cache_key_normalization():
+    key = answer_cache_key('How  easy is it?', None, None, ['b', 'a'], 'all', 'balanced', 1, 0, None)
+    assert key == answer_cache_key(' how easy IS it? ', None, None, ['a', 'b'], 'all', 'balanced', 1, 0, None)
+    assert key != answer_cache_key('How easy is it?', None, 'high', ['a', 'b'], 'all', 'balanced', 1, 0, None)
+    assert key != answer_cache_key('How easy is it?', None, None, ['a', 'b'], 'all', 'balanced', 1, 0, 'text')
+
+
+def test_cache_hit(local_server, cached_cc):
+    answers = cached_cc.answer('How easy is this API to use?')
+    assert cached_cc.answer('how easy is this API  to use?') == answers
+    assert answer_calls(local_server) == 1
+    assert cached_cc.answer_cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1}
+
+
+def test_cache_returns_copies(cached_cc):
+    cached_cc.answer('How easy is this API to use?')[0]['answerText'] = 'Modified'
+    assert cached_cc.answer('How easy is this API to use?')[0]['answerText'] != 'Modified'
+
+
+def test_cache_parameters_in_key(local_server, cached_cc):
+    cached_cc.answer('How easy is this API to use?')
+    cached_cc.answer('How easy is this API to use?', number_of_items=2)
+    cached_cc.answer('How easy is this API to use?', text=document_text)
+    assert answer_calls(local_server) == 3
+
+
+def test_cache_lru_eviction(local_server, cached_cc):
+    cached_cc.answer('Question one?')
+    cached_cc.answer('Question two?')
+    cached_cc.answer('Question one?')
+    cached_cc.answer('Question three?')
+    assert cached_cc.answer_cache.evictions == 1
+    cached_cc.answer('Question one?')
+    assert answer_calls(local_server) == 3
+    cached_cc.answer('Question two?')
+    assert answer_calls(local_server) == 4
+
+
+def test_cache_ttl(local_server, cached_cc):
+    cached_cc.answer_cache.ttl = 0.05
+    cached_cc.answer('How easy is this API to use?')
+    time.sleep(0.1)
+    cached_cc.answer('How easy is this API to use?')
+    assert answer_calls(local_server) == 2
+
+
+def test_cache_invalidated_by_mutations(local_server, cached_cc):
+    question = 'What colour is the sky?'
+    assert cached_cc.answer(question) == []
+    reply = cached_cc.add_saved_reply(question, 'Blue')
+    assert cached_cc.answer(question)[0]['answerText'] == 'Blue'
+    cached_cc.edit_answer(reply['answerId'], 'Grey')
+    assert cached_cc.answer(question)[0]['answerText'] == 'Grey'
+    cached_cc.set_default_threshold('veryhigh')
+    cached_cc.answer(question)
+    assert answer_calls(local_server) == 4
+
+
+def test_cache_not_invalidated_by_reads(local_server, cached_cc):
+    cached_cc.answer('How easy is this API to use?')
+    cached_cc.get_documents()
+    cached_cc.set_forward_email('test@bloomsbury.ai')
+    cached_cc.answer('How easy is this API to use?')
+    assert answer_calls(local_server) == 1
+
+
+def test_cache_discards_answers_from_before_invalidation():
+    cache = AnswerCache()
+    generation = cache.generation
+    cache.clear()
+    cache.set('key', ['stale'], generation)
+    assert cache.get('key') is None
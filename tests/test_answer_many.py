@@ -0,0 +1,64 @@
+import asyncio
+import time
+import pytest
+from cape.client import AsyncCapeClient
+from cape.client import CapeException
+from .fixtures import local_server, local_cc
+from .local_server import USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+
+
+def test_answer_many_order(local_cc):
+    local_cc.add_document("Cape API Documentation", document_text)
+    questions = ['How easy is this API to use?', 'Welcome to which API?', 'How easy is it?']
+    results = local_cc.answer_many(questions)
+    assert [result['question'] for result in results] == questions
+    assert results[0]['answers'][0]['answerText'] == "Hopefully it's pretty easy to use."
+    assert results[1]['answers'][0]['answerText'] == "Welcome to the Cape API 0.1."
+    assert all(result['error'] is None for result in results)
+
+
+def test_answer_many_failures(local_cc):
+    results = local_cc.answer_many(['Who are you?', '???', {'question': 'Who are you?', 'threshold': 'bogus'}])
+    assert results[0]['error'] is None
+    assert isinstance(results[1]['error'], CapeException)
+    assert results[1]['answers'] is None
+    assert results[2]['error'] is not None
+
+
+def test_answer_many_overrides(local_cc):
+    results = local_cc.answer_many([{'question': 'How easy is it?', 'text': document_text},
+                                    {'question': 'How easy is it?'}],
+                                   source_type='document')
+    assert results[0]['answers'][0]['sourceId'] == 'Inline Text'
+    assert results[1]['answers'] == []
+
+
+def test_answer_many_unknown_override(local_cc):
+    with pytest.raises(TypeError):
+        local_cc.answer_many([{'question': 'How easy is it?', 'offset': 3}])
+
+
+def test_answer_many_concurrency(local_server, local_cc):
+    local_server.latency = 0.2
+    start = time.time()
+    results = local_cc.answer_many(['Who are you?'] * 8, max_concurrency=8)
+    assert len(results) == 8
+    assert time.time() - start < 0.2 * 4
+
+
+def test_async_answer_many(local_server):
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login(USERNAME, PASSWORD)
+            return await client.answer_many(['How easy is it?', '   ', 'Is it easy?'], text=document_text,
+                                            max_concurrency=2)
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert results[0]['answers'][0]['sourceId'] == 'Inline Text'
+    assert isinstance(results[1]['error'], CapeException)
+    assert results[2]['question'] == 'Is it easy?'
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import pytest
+from unittest.mock import Mock
+from cape.client import AsyncCapeClient
+from cape.client import CapeException, CapeTransportError, CircuitBreaker, RetryPolicy
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def logged_in_client(local_server):
+    client = AsyncCapeClient(local_server.api_base)
+    await client.login(USERNAME, PASSWORD)
+    return client
+
+
+def test_login_logout(local_server):
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            assert not client.logged_in()
+            await client.login(USERNAME, PASSWORD)
+            assert client.logged_in()
+            await client.logout()
+            assert not client.logged_in()
+    run(scenario())
+
+
+def test_failed_login(local_server):
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login('invalid', 'invalid')
+    with pytest.raises(CapeException):
+        run(scenario())
+
+
+def test_answer(local_server):
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            await client.add_document("Cape API Documentation", document_text)
+            return await client.answer('How easy is this API to use?')
+    answers = run(scenario())
+    assert answers[0]['answerText'] == "Hopefully it's pretty easy to use."
+
+
+def test_answer_with_user_token(local_server):
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            token = await client.get_user_token()
+        async with AsyncCapeClient(local_server.api_base) as client:
+            return await client.answer('Is this easy?', token, text=document_text)
+    answers = run(scenario())
+    assert answers[0]['sourceId'] == 'Inline Text'
+
+
+def test_answer_requires_token(local_server):
+    with pytest.raises(CapeException):
+        run(AsyncCapeClient(local_server.api_base).answer('Is this easy?'))
+
+
+def test_concurrent_answers_share_session(local_server):
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            await client.add_document("Cape API Documentation", document_text)
+            session = client.session
+            answers = await asyncio.gather(*[client.answer('How easy is this API to use?') for _ in range(10)])
+            assert client.session is session
+            return answers
+    assert len(run(scenario())) == 10
+
+
+def test_documents(local_server, tmpdir):
+    file_path = str(tmpdir.join('cape_api.txt'))
+    with open(file_path, 'w') as fh:
+        fh.write(document_text)
+    upload_cb = Mock()
+
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            document_id = await client.add_document("Cape API Documentation", file_path=file_path,
+                                                    monitor_callback=upload_cb)
+            documents = await client.get_documents(document_ids=[document_id])
+            await client.delete_document(document_id)
+            return document_id, documents
+    document_id, documents = run(scenario())
+    assert document_id == hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+    assert documents['totalItems'] == 1
+    upload_cb.assert_called()
+
+
+def test_saved_replies(local_server):
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            response = await client.add_saved_reply('What colour is the sky?', 'Blue')
+            await client.add_paraphrase_question(response['replyId'], 'What color is the sky?')
+            await client.add_answer(response['replyId'], 'Grey')
+            return await client.get_saved_replies(search_term='sky')
+    saved_replies = run(scenario())
+    assert saved_replies['totalItems'] == 1
+    assert len(saved_replies['items'][0]['answers']) == 2
+
+
+def test_annotations(local_server):
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            document_id = await client.add_document("Cape API Documentation", document_text)
+            response = await client.add_annotation('How easy is it?', 'Pretty easy', document_id,
+                                                   start_offset=29, end_offset=63, metadata={'page': 1})
+            await client.add_annotation_paraphrase_question(response['annotationId'], 'Is it easy?')
+            return await client.get_annotations(document_ids=[document_id], pages=[1])
+    annotations = run(scenario())
+    assert annotations['totalItems'] == 1
+    assert annotations['items'][0]['paraphraseQuestions'][0]['question'] == 'Is it easy?'
+
+
+def test_inbox(local_server):
+    async def scenario():
+        async with await logged_in_client(local_server) as client:
+            await client.answer('Who are you?')
+            inbox = await client.get_inbox()
+            await client.mark_inbox_read(inbox['items'][0]['id'])
+            return await client.get_inbox(read=True)
+    assert len(run(scenario())['items']) == 1
+
+
+def test_retries_transient_failures(local_server):
+    async def scenario():
+        policy = RetryPolicy(backoff=0.001, max_backoff=0.01)
+        async with AsyncCapeClient(local_server.api_base, retry_policy=policy) as client:
+            await client.login(USERNAME, PASSWORD)
+            local_server.failures.extend([502, 'reset'])
+            assert (await client.get_documents())['totalItems'] == 0
+            local_server.failures.append(502)
+            with pytest.raises(CapeTransportError):
+                await client.add_document('Title', 'Some text.')
+    run(scenario())
+    assert local_server.state.calls.count('documents/get-documents') == 3
+    assert local_server.state.calls.count('documents/add-document') == 1
+
+
+def test_cancelled_probe_releases_circuit_breaker(local_server):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=1),
+                                   circuit_breaker=breaker) as client:
+            await client.login(USERNAME, PASSWORD)
+            local_server.failures.append(502)
+            with pytest.raises(CapeTransportError):
+                await client.get_profile()
+            await asyncio.sleep(0.05)
+            # The probe is cancelled before the API responds
+            local_server.delays.append(0.5)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.get_profile(), 0.05)
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            return await client.get_profile()
+    assert run(scenario())['username'] == USERNAME
+    assert breaker.state == CircuitBreaker.CLOSED
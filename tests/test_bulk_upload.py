@@ -0,0 +1,141 @@
+import hashlib
+import os
+import pytest
+from unittest.mock import Mock, patch
+from cape.client.bulk import collect_paths, hash_file
+from .fixtures import local_server, local_cc
+
+
+def write_files(directory, contents):
+    paths = []
+    for name, text in contents.items():
+        path = os.path.join(str(directory), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fh:
+            fh.write(text)
+        paths.append(path)
+    return paths
+
+
+def test_hash_file(tmpdir):
+    path, = write_files(tmpdir, {'cape_api.txt': 'Hello and welcome to my document!'})
+    assert hash_file(path, chunk_size=4) == hashlib.sha256(b'Hello and welcome to my document!').hexdigest()
+
+
+def test_collect_paths(tmpdir):
+    write_files(tmpdir, {'b.txt': 'b', 'a.txt': 'a', 'sub/c.txt': 'c'})
+    assert [os.path.relpath(path, str(tmpdir)) for path in collect_paths(str(tmpdir))] == \
+           ['a.txt', 'b.txt', os.path.join('sub', 'c.txt')]
+    assert collect_paths([os.path.join(str(tmpdir), 'b.txt')]) == [os.path.join(str(tmpdir), 'b.txt')]
+
+
+def test_add_documents(local_server, local_cc, tmpdir):
+    write_files(tmpdir, {'one.txt': 'Document one.', 'two.txt': 'Document two.', 'sub/three.txt': 'Document three.'})
+    reports = local_cc.add_documents(str(tmpdir), workers=2)
+    assert [report['status'] for report in reports] == ['uploaded'] * 3
+    assert {report['document_id'] for report in reports} == set(local_server.state.documents)
+    assert local_server.state.documents[reports[0]['document_id']]['title'] == 'one.txt'
+
+
+def test_add_documents_skips_existing(local_server, local_cc, tmpdir):
+    local_cc.add_document('Existing', 'Document one.')
+    paths = write_files(tmpdir, {'one.txt': 'Document one.', 'two.txt': 'Document two.', 'copy.txt': 'Document two.'})
+    local_server.state.calls.clear()
+    reports = local_cc.add_documents(paths, check_batch_size=2)
+    assert [report['status'] for report in reports] == ['skipped', 'uploaded', 'skipped']
+    assert local_server.state.calls.count('documents/add-document') == 1
+    assert local_server.state.calls.count('documents/get-documents') == 1
+
+
+def test_add_documents_replace(local_server, local_cc, tmpdir):
+    local_cc.add_document('Existing', 'Document one.')
+    paths = write_files(tmpdir, {'one.txt': 'Document one.'})
+    reports = local_cc.add_documents(paths, replace=True)
+    assert reports[0]['status'] == 'uploaded'
+    assert local_server.state.documents[reports[0]['document_id']]['title'] == 'one.txt'
+
+
+def test_add_documents_failures(local_cc, tmpdir):
+    paths = write_files(tmpdir, {'one.txt': 'Document one.', 'empty.txt': ''})
+    reports = local_cc.add_documents(paths + [os.path.join(str(tmpdir), 'missing.txt')])
+    assert reports[0]['status'] == 'uploaded'
+    assert reports[1]['status'] == 'uploaded'
+    assert reports[2]['status'] == 'failed'
+    assert isinstance(reports[2]['error'], OSError)
+
+
+def test_add_documents_file_removed_after_hashing(local_cc, tmpdir):
+    paths = write_files(tmpdir, {'one.txt': 'Document one.', 'two.txt': 'Document two.'})
+
+    def hash_and_remove(path):
+        document_id = hash_file(path)
+        if path == paths[1]:
+            os.remove(path)
+        return document_id
+
+    with patch('cape.client.client.hash_file', side_effect=hash_and_remove):
+        reports = local_cc.add_documents(paths)
+    assert [report['status'] for report in reports] == ['uploaded', 'failed']
+    assert isinstance(reports[1]['error'], OSError)
+
+
+def test_add_documents_progress(local_cc, tmpdir):
+    paths = write_files(tmpdir, {'one.txt': 'Document one. ' * 10000, 'two.txt': 'Document two. ' * 10000})
+    progress = Mock()
+    local_cc.add_documents(paths, monitor_callback=progress)
+    aggregate = progress.call_args[0][0]
+    assert aggregate.files_done == aggregate.files_total == 2
+    assert aggregate.bytes_read == aggregate.len > 2 * 140000
+
+
+def test_sync_documents(local_server, local_cc, tmpdir):
+    local_cc.add_document('Unrelated', 'Not part of the sync.')
+    root = tmpdir.mkdir('root')
+    write_files(root, {'one.txt': 'Document one.', 'two.txt': 'Document two.', 'sub/three.txt': 'Document three.'})
+    plan = local_cc.sync_documents(str(root), workers=2)
+    assert plan['upload'] == ['one.txt', 'sub/three.txt', 'two.txt']
+    assert plan['delete'] == [] and plan['failed'] == []
+    assert len(local_server.state.documents) == 4
+    assert local_server.state.documents[hash_file(str(root.join('one.txt')))]['origin'] == 'one.txt'
+
+    local_server.state.calls.clear()
+    plan = local_cc.sync_documents(str(root))
+    assert plan['upload'] == [] and plan['delete'] == []
+    assert plan['unchanged'] == ['one.txt', 'sub/three.txt', 'two.txt']
+    assert local_server.state.calls == ['documents/get-documents']
+
+    old_id = hash_file(str(root.join('two.txt')))
+    write_files(root, {'two.txt': 'Document two, revised.'})
+    root.join('sub', 'three.txt').remove()
+    plan = local_cc.sync_documents(str(root))
+    assert plan['upload'] == ['two.txt']
+    assert sorted(plan['delete']) == sorted([old_id, hashlib.sha256(b'Document three.').hexdigest()])
+    assert plan['unchanged'] == ['one.txt']
+    assert len(local_server.state.documents) == 3
+    assert 'Not part of the sync.' in [document['text'] for document in local_server.state.documents.values()]
+
+
+def test_sync_documents_dry_run(local_server, local_cc, tmpdir):
+    write_files(tmpdir, {'one.txt': 'Document one.', 'two.txt': 'Document two.'})
+    local_cc.sync_documents(str(tmpdir))
+    write_files(tmpdir, {'three.txt': 'Document three.'})
+    tmpdir.join('one.txt').remove()
+    manifest = tmpdir.join('.cape-manifest.json').read()
+    local_server.state.calls.clear()
+    plan = local_cc.sync_documents(str(tmpdir), dry_run=True)
+    assert plan['upload'] == ['three.txt']
+    assert plan['delete'] == [hashlib.sha256(b'Document one.').hexdigest()]
+    assert plan['unchanged'] == ['two.txt']
+    assert local_server.state.calls == ['documents/get-documents']
+    assert tmpdir.join('.cape-manifest.json').read() == manifest
+
+
+def test_sync_documents_restores_remote_deletions(local_server, local_cc, tmpdir):
+    manifest_path = str(tmpdir.join('manifest.json'))
+    root = str(tmpdir.join('docs'))
+    write_files(root, {'one.txt': 'Document one.'})
+    local_cc.sync_documents(root, manifest_path=manifest_path)
+    local_cc.delete_document(hashlib.sha256(b'Document one.').hexdigest())
+    plan = local_cc.sync_documents(root, manifest_path=manifest_path)
+    assert plan['upload'] == ['one.txt']
+    assert len(local_server.state.documents) == 1
@@ -0,0 +1,122 @@
+import copy
+import threading
+import time
+from unittest.mock import patch
+import pytest
+from cape.client import CapeClient, CapeException, RetryPolicy, SingleFlight
+from cape.client.coalescing import flight_key
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+THREADS = 10
+
+
+@pytest.fixture
+def coalescing_cc(local_server):
+    cc = CapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=1), single_flight=SingleFlight())
+    cc.login(USERNAME, PASSWORD)
+    return cc
+
+
+def concurrently(call):
+    barrier = threading.Barrier(THREADS)
+    results = [None] * THREADS
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = call()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_calls_share_a_request(local_server, coalescing_cc):
+    coalescing_cc.add_saved_reply('How old are you?', 'Eighteen')
+    for method, call in (('answer', lambda: coalescing_cc.answer('How old are you?')),
+                         ('user/get-profile', coalescing_cc.get_profile),
+                         ('saved-replies/get-saved-replies', coalescing_cc.get_saved_replies),
+                         ('documents/get-documents', coalescing_cc.get_documents)):
+        local_server.delays = [0.3]
+        calls = len(local_server.state.calls)
+        results = concurrently(call)
+        assert local_server.state.calls[calls:] == [method]
+        assert all(result == results[0] for result in results)
+        # Each caller receives its own copy of the result
+        assert len(set(id(result) for result in results)) == THREADS
+        assert coalescing_cc.single_flight.stats()[method] == {'calls': THREADS, 'coalesced': THREADS - 1}
+
+    # Calls made after the request finishes make a new one
+    coalescing_cc.get_profile()
+    assert local_server.state.calls[-1] == 'user/get-profile'
+
+
+def test_different_calls_are_not_shared(local_server, coalescing_cc):
+    local_server.delays = [0.3]
+    questions = iter(range(THREADS))
+    lock = threading.Lock()
+
+    def answer():
+        with lock:
+            question = 'Question %d' % next(questions)
+        return coalescing_cc.answer(question)
+
+    concurrently(answer)
+    assert local_server.state.calls.count('answer') == THREADS
+    assert coalescing_cc.single_flight.stats()['answer']['coalesced'] == 0
+
+
+def test_callers_share_exceptions(local_server, coalescing_cc):
+    local_server.delays = [0.3]
+    local_server.failures = [500]
+    results = concurrently(coalescing_cc.get_profile)
+    assert all(isinstance(result, CapeException) for result in results)
+    assert coalescing_cc.single_flight.stats()['user/get-profile']['coalesced'] == THREADS - 1
+
+
+def test_leader_changes_do_not_reach_followers():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    modified = threading.Event()
+    results = []
+
+    def leader():
+        started.set()
+        release.wait()
+        return {'items': [1]}
+
+    real_deepcopy = copy.deepcopy
+
+    def deepcopy(value):
+        # The follower copies the result only after the leader has modified it
+        if threading.current_thread() is following:
+            modified.wait()
+        return real_deepcopy(value)
+
+    leading = threading.Thread(target=lambda: results.append(single_flight.call('answer', 'key', leader)))
+    following = threading.Thread(target=lambda: results.append(single_flight.call('answer', 'key', leader)))
+    with patch('cape.client.coalescing.copy.deepcopy', side_effect=deepcopy):
+        leading.start()
+        started.wait()
+        following.start()
+        while single_flight.stats()['answer']['coalesced'] == 0:
+            time.sleep(0.001)
+        release.set()
+        leading.join()
+        results[0]['items'].append(2)
+        modified.set()
+        following.join()
+    assert results == [{'items': [1, 2]}, {'items': [1]}]
+
+
+def test_flight_key():
+    assert flight_key('answer', 'user', {'question': 'Q', 'offset': '0'}) == \
+        flight_key('answer', 'user', {'offset': '0', 'question': 'Q'})
+    assert flight_key('answer', 'user', {'question': 'Q'}) != flight_key('answer', 'other', {'question': 'Q'})
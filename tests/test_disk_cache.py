@@ -0,0 +1,113 @@
+import multiprocessing
+import sqlite3
+import time
+import pytest
+from cape.client import CapeClient, DiskAnswerCache
+from cape.client.disk_cache import ACCESS_BATCH_SIZE
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+
+
+@pytest.fixture()
+def cache_path(tmpdir):
+    return str(tmpdir.join('answers.sqlite'))
+
+
+def fill_cache(path, worker):
+    cache = DiskAnswerCache(path)
+    for i in range(50):
+        cache.set('%d-%d' % (worker, i), [{'answerText': str(i)}])
+
+
+def test_persistence(cache_path):
+    cache = DiskAnswerCache(cache_path)
+    cache.set('key', [{'answerText': 'Blue'}])
+    cache.close()
+    assert DiskAnswerCache(cache_path).get('key') == [{'answerText': 'Blue'}]
+
+
+def test_shared_invalidation(cache_path):
+    first = DiskAnswerCache(cache_path)
+    second = DiskAnswerCache(cache_path)
+    first.set('key', ['answer'])
+    generation = second.generation
+    first.clear()
+    assert second.get('key') is None
+    second.set('key', ['stale'], generation)
+    assert first.get('key') is None
+    assert second.stats()['corpus_version'] == 1
+
+
+def test_ttl(cache_path):
+    cache = DiskAnswerCache(cache_path, ttl=0.05)
+    cache.set('key', ['answer'])
+    assert cache.get('key') == ['answer']
+    time.sleep(0.1)
+    assert cache.get('key') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru_eviction(cache_path):
+    cache = DiskAnswerCache(cache_path, max_size=2)
+    cache.set('one', [1])
+    cache.set('two', [2])
+    cache.get('one')
+    cache.set('three', [3])
+    assert cache.get('two') is None
+    assert cache.get('one') == [1]
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+
+def test_periodic_eviction(cache_path):
+    cache = DiskAnswerCache(cache_path, max_size=200)
+    for i in range(203):
+        cache.set(str(i), [i])
+    # The size is checked every second answer stored
+    assert len(cache) == 201
+    assert cache.evictions == 2
+    assert cache.get('0') is None
+    assert cache.get('2') == [2]
+
+
+def test_lookups_do_not_wait_for_writers(cache_path):
+    cache = DiskAnswerCache(cache_path, timeout=5)
+    cache.set('key', ['answer'])
+    writer = sqlite3.connect(cache_path, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    started = time.monotonic()
+    for _ in range(ACCESS_BATCH_SIZE + 1):
+        assert cache.get('key') == ['answer']
+    assert time.monotonic() - started < 1
+    writer.execute('ROLLBACK')
+    # The access times which couldn't be written are written with the next answer stored
+    cache.set('other', ['answer'])
+    assert not cache._accessed
+
+
+def test_multiple_processes(cache_path):
+    DiskAnswerCache(cache_path)
+    processes = [multiprocessing.Process(target=fill_cache, args=(cache_path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert len(DiskAnswerCache(cache_path)) == 200
+
+
+def test_client_integration(local_server, cache_path):
+    client = CapeClient(local_server.api_base, answer_cache=DiskAnswerCache(cache_path))
+    client.login(USERNAME, PASSWORD)
+    client.add_document("Cape API Documentation", document_text)
+    answers = client.answer('How easy is this API to use?')
+    restarted = CapeClient(local_server.api_base, answer_cache=DiskAnswerCache(cache_path))
+    restarted.login(USERNAME, PASSWORD)
+    assert restarted.answer('How easy is this API to use?') == answers
+    assert local_server.state.calls.count('answer') == 1
+    client.delete_document(answers[0]['sourceId'])
+    assert restarted.answer('How easy is this API to use?') == []
+    assert local_server.state.calls.count('answer') == 2
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from cape.client import AsyncCapeClient, CapeClient, HedgePolicy
+from .fixtures import local_server
+from .local_server import LocalCapeServer, USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+
+
+def hedged_client(local_server, policy):
+    client = CapeClient(local_server.api_base, hedge_policy=policy)
+    client.login(USERNAME, PASSWORD)
+    client.add_document('Welcome', document_text)
+    return client
+
+
+def test_adaptive_delay():
+    policy = HedgePolicy(min_samples=10, initial_delay=0.25)
+    assert policy.delay == 0.25
+    for latency in range(1, 101):
+        policy.record(latency / 100)
+    assert policy.delay == 0.95
+    assert HedgePolicy(delay=0.1).delay == 0.1
+
+
+def test_hedge_wins(local_server):
+    policy = HedgePolicy(delay=0.05)
+    client = hedged_client(local_server, policy)
+    local_server.delays.append(2.0)
+    started = time.monotonic()
+    answers = client.answer('How easy is this API to use?', user_token='local-user-token')
+    assert time.monotonic() - started < 1.0
+    assert answers[0]['answerText']
+    assert local_server.state.calls.count('answer') == 2
+    assert policy.stats() == {'requests': 1, 'hedges_sent': 1, 'hedges_won': 1, 'delay': 0.05}
+
+
+def test_no_hedge_for_fast_answers(local_server):
+    policy = HedgePolicy(delay=1.0)
+    client = hedged_client(local_server, policy)
+    client.answer('How easy is this API to use?')
+    client.answer('How easy is this API to use?')
+    assert local_server.state.calls.count('answer') == 2
+    assert policy.stats()['hedges_sent'] == 0
+
+
+def test_no_hedge_while_waiting_for_a_worker():
+    server = LocalCapeServer(latency=0.1).start()
+    try:
+        policy = HedgePolicy(delay=0.3)
+        client = CapeClient(server.api_base, hedge_policy=policy, hedge_workers=2)
+        client.login(USERNAME, PASSWORD)
+        client.add_document('Welcome', document_text)
+        # Most of the calls wait for one of the two workers for longer than the delay, but each request is faster
+        threads = [threading.Thread(target=client.answer, args=('Question %d?' % i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+    finally:
+        server.stop()
+    assert server.state.calls.count('answer') == 8
+    assert policy.stats()['requests'] == 8
+    assert policy.stats()['hedges_sent'] == 0
+
+
+def test_async_hedge_wins(local_server):
+    policy = HedgePolicy(delay=0.05)
+
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base, hedge_policy=policy) as client:
+            await client.login(USERNAME, PASSWORD)
+            await client.add_document('Welcome', document_text)
+            local_server.delays.append(2.0)
+            started = time.monotonic()
+            answers = await client.answer('How easy is this API to use?')
+            assert time.monotonic() - started < 1.0
+            return answers
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(scenario())[0]['answerText']
+    finally:
+        loop.close()
+    assert policy.stats()['hedges_won'] == 1
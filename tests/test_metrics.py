@@ -0,0 +1,83 @@
+import socket
+import pytest
+from cape.client import CapeClient, CapeException, CapeTransportError, InMemoryMetrics, PrometheusMetrics, \
+    RetryPolicy, StatsdMetrics
+from cape.client.metrics import error_type
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+
+def metrics_client(local_server, metrics):
+    client = CapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=1), metrics=metrics)
+    client.login(USERNAME, PASSWORD)
+    return client
+
+
+def test_in_memory_metrics(local_server):
+    metrics = InMemoryMetrics(buckets=(0.001, 10.0))
+    client = metrics_client(local_server, metrics)
+    client.add_document('Title', 'Some text.')
+    client.get_documents()
+    client.get_documents()
+    local_server.failures.append(502)
+    with pytest.raises(CapeTransportError):
+        client.get_documents()
+    with pytest.raises(CapeException):
+        client.delete_document('missing')
+    snapshot = metrics.snapshot()
+    assert set(snapshot) == {'user/login', 'documents/add-document', 'documents/get-documents',
+                             'documents/delete-document'}
+    documents = snapshot['documents/get-documents']
+    assert documents['count'] == 3
+    assert documents['latency_buckets'][-1] == (float('inf'), 3)
+    assert documents['latency_buckets'][1][1] == 3
+    assert documents['errors'] == {'http_502': 1}
+    assert documents['in_flight'] == 0
+    assert documents['response_bytes'] > 0
+    assert snapshot['documents/add-document']['request_bytes'] > len('Some text.')
+    assert snapshot['documents/delete-document']['errors'] == {'CapeException': 1}
+
+
+def test_error_type():
+    try:
+        try:
+            raise ConnectionResetError()
+        except ConnectionResetError as e:
+            raise CapeTransportError('Unable to reach the Cape API') from e
+    except CapeTransportError as e:
+        assert error_type(e) == 'ConnectionResetError'
+    assert error_type(CapeTransportError('Unavailable', 503)) == 'http_503'
+    assert error_type(ValueError()) == 'ValueError'
+
+
+def test_prometheus_metrics(local_server):
+    metrics = PrometheusMetrics(buckets=(0.5,))
+    client = metrics_client(local_server, metrics)
+    client.get_profile()
+    local_server.failures.append(504)
+    with pytest.raises(CapeTransportError):
+        client.get_profile()
+    lines = metrics.render().splitlines()
+    assert '# TYPE cape_client_request_duration_seconds histogram' in lines
+    assert 'cape_client_request_duration_seconds_bucket{method="user/get-profile",le="+Inf"} 2' in lines
+    assert 'cape_client_request_duration_seconds_count{method="user/get-profile"} 2' in lines
+    assert 'cape_client_in_flight{method="user/get-profile"} 0' in lines
+    assert 'cape_client_errors_total{method="user/get-profile",type="http_504"} 1' in lines
+    assert any(line.startswith('cape_client_response_bytes_total{method="user/login"} ') for line in lines)
+
+
+def test_statsd_metrics(local_server):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(5)
+    metrics = StatsdMetrics(port=receiver.getsockname()[1], prefix='test')
+    try:
+        metrics_client(local_server, metrics)
+        started = receiver.recv(65536).decode('utf-8')
+        finished = receiver.recv(65536).decode('utf-8').split('\n')
+    finally:
+        metrics.close()
+        receiver.close()
+    assert started == 'test.user.login.in_flight:+1|g'
+    assert finished[:2] == ['test.user.login.in_flight:-1|g', 'test.user.login.requests:1|c']
+    assert finished[2].startswith('test.user.login.latency:') and finished[2].endswith('|ms')
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+import pytest
+from cape.client import AsyncCapeClient
+from cape.client.pagination import iterate_pages, aiterate_pages, fetch_all_pages
+from .fixtures import local_server, local_cc
+from .local_server import USERNAME, PASSWORD
+
+
+class Pages:
+
+    def __init__(self, total_items, delay=0.0):
+        self.total_items = total_items
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def __call__(self, number_of_items, offset):
+        with self.lock:
+            self.requests.append(offset)
+        time.sleep(self.delay)
+        items = list(range(offset, min(offset + number_of_items, self.total_items)))
+        return {'totalItems': self.total_items, 'items': items}
+
+
+@pytest.mark.parametrize('prefetch', [0, 1, 3])
+def test_iterate_pages(prefetch):
+    pages = Pages(10)
+    assert list(iterate_pages(pages, page_size=3, prefetch=prefetch)) == list(range(10))
+    assert sorted(pages.requests) == [0, 3, 6, 9]
+
+
+def test_iterate_exact_pages():
+    pages = Pages(6)
+    assert list(iterate_pages(pages, page_size=3)) == list(range(6))
+    assert sorted(pages.requests) == [0, 3]
+
+
+def test_iterate_empty():
+    assert list(iterate_pages(Pages(0), page_size=3)) == []
+
+
+def test_prefetch_is_bounded():
+    pages = Pages(100)
+    iterator = iterate_pages(pages, page_size=2, prefetch=2)
+    next(iterator)
+    time.sleep(0.05)
+    assert sorted(pages.requests) == [0, 2, 4]
+    iterator.close()
+
+
+def test_prefetch_overlaps_consumption():
+    pages = Pages(8, delay=0.1)
+    start = time.time()
+    for _ in iterate_pages(pages, page_size=2, prefetch=1):
+        time.sleep(0.05)
+    assert time.time() - start < 4 * 0.1 + 8 * 0.05
+
+
+def test_page_errors_are_raised():
+    def fetch_page(number_of_items, offset):
+        if offset:
+            raise ValueError('Page failed')
+        return {'totalItems': 4, 'items': [0, 1]}
+    with pytest.raises(ValueError):
+        list(iterate_pages(fetch_page, page_size=2))
+
+
+def test_iter_documents(local_cc):
+    for i in range(7):
+        local_cc.add_document('Document %d' % i, 'Document number %d.' % i)
+    titles = [document['title'] for document in local_cc.iter_documents(page_size=3, prefetch=2)]
+    assert titles == ['Document %d' % i for i in reversed(range(7))]
+
+
+def test_iter_saved_replies_and_annotations(local_cc):
+    document_id = local_cc.add_document('Document', 'Hello and welcome to my document!')
+    for i in range(5):
+        local_cc.add_saved_reply('Question %d?' % i, 'Answer %d' % i)
+        local_cc.add_annotation('Question %d?' % i, 'Answer %d' % i, document_id)
+    assert len(list(local_cc.iter_saved_replies(page_size=2))) == 5
+    assert len(list(local_cc.iter_saved_replies(search_term='Question 3', page_size=2))) == 1
+    assert len(list(local_cc.iter_annotations(document_ids=[document_id], page_size=2))) == 5
+
+
+def test_iter_inbox(local_cc):
+    for i in range(4):
+        local_cc.answer('Question %d?' % i)
+    assert [item['question'] for item in local_cc.iter_inbox(page_size=3)] == \
+           ['Question %d?' % i for i in reversed(range(4))]
+
+
+def test_aiterate_pages():
+    pages = Pages(10)
+
+    async def fetch_page(number_of_items, offset):
+        return pages(number_of_items, offset)
+
+    async def scenario():
+        return [item async for item in aiterate_pages(fetch_page, page_size=3, prefetch=2)]
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(scenario()) == list(range(10))
+    finally:
+        loop.close()
+
+
+def test_async_iter_documents(local_server):
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login(USERNAME, PASSWORD)
+            for i in range(5):
+                await client.add_document('Document %d' % i, 'Document number %d.' % i)
+            return [document['title'] async for document in client.iter_documents(page_size=2)]
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(scenario()) == ['Document %d' % i for i in reversed(range(5))]
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('total_items', [0, 2, 5, 6, 7])
+def test_fetch_all_pages(total_items):
+    pages = Pages(total_items)
+    assert fetch_all_pages(pages, page_size=3, max_concurrency=2) == list(range(total_items))
+
+
+def test_fetch_all_pages_concurrently():
+    pages = Pages(40, delay=0.1)
+    start = time.time()
+    assert fetch_all_pages(pages, page_size=4, max_concurrency=9) == list(range(40))
+    assert time.time() - start < 0.1 * 4
+
+
+def test_fetch_all_documents(local_cc):
+    for i in range(7):
+        local_cc.add_document('Document %d' % i, 'Document number %d.' % i)
+    documents = local_cc.fetch_all_documents(page_size=2, max_concurrency=3)
+    assert [document['title'] for document in documents] == ['Document %d' % i for i in reversed(range(7))]
+
+
+def test_fetch_all_saved_replies_annotations_and_inbox(local_cc):
+    document_id = local_cc.add_document('Document', 'Hello and welcome to my document!')
+    for i in range(5):
+        local_cc.add_saved_reply('Question %d?' % i, 'Answer %d' % i)
+        local_cc.add_annotation('Question %d?' % i, 'Answer %d' % i, document_id)
+        local_cc.answer('Question %d?' % i)
+    assert len(local_cc.fetch_all_saved_replies(page_size=2)) == 5
+    assert len(local_cc.fetch_all_annotations(search_term='Question', page_size=2)) == 5
+    assert len(local_cc.fetch_all_inbox(page_size=2)) == 5
+
+
+def test_async_fetch_all_documents(local_server):
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login(USERNAME, PASSWORD)
+            for i in range(5):
+                await client.add_document('Document %d' % i, 'Document number %d.' % i)
+            return await client.fetch_all_documents(page_size=2, max_concurrency=2)
+    loop = asyncio.new_event_loop()
+    try:
+        documents = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert [document['title'] for document in documents] == ['Document %d' % i for i in reversed(range(5))]
@@ -0,0 +1,103 @@
+import asyncio
+import gzip
+import json
+import time
+import pytest
+from cape.client import AsyncCapeClient, CapeClient, CapeException, CapeTransportError, RetryPolicy, \
+    TrafficRecorder, TrafficReplayer
+from cape.client.client import answer_parameters
+from cape.client.instrumentation import REDACTED
+from cape.client.recording import recorded_parameters
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+
+
+def record_session(local_server, path):
+    with TrafficRecorder(path) as recorder:
+        client = CapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=1), recorder=recorder)
+        client.login(USERNAME, PASSWORD)
+        client.add_document('Welcome', document_text * 10, document_id='welcome')
+        answers = client.answer('How easy is this API to use?')
+        token = client.get_user_token()
+        local_server.failures.append('reset')
+        with pytest.raises(CapeTransportError):
+            client.get_profile()
+    return answers, token
+
+
+def test_recording(local_server, tmpdir):
+    path = str(tmpdir.join('traffic.jsonl'))
+    record_session(local_server, path)
+    with open(path) as fh:
+        entries = [json.loads(line) for line in fh]
+    assert [entry['method'] for entry in entries] == ['user/login', 'documents/add-document', 'answer',
+                                                      'user/get-user-token', 'user/get-profile']
+    login, document, answer, token, profile = entries
+    assert login['parameters']['password'] == REDACTED
+    assert login['cookies'] == {'session': REDACTED}
+    assert document['parameters']['text'].startswith('sha256:')
+    assert json.loads(token['body'])['result']['userToken'] == REDACTED
+    assert 'error' in profile and 'status' not in profile
+    assert all(entry['latency'] >= 0 and entry['offset'] >= 0 for entry in entries)
+    assert answer['offset'] >= document['offset'] >= login['offset']
+
+
+def test_replay(local_server, tmpdir):
+    path = str(tmpdir.join('traffic.jsonl.gz'))
+    answers, _ = record_session(local_server, path)
+    with gzip.open(path, 'rt') as fh:
+        assert len(fh.readlines()) == 5
+    calls = len(local_server.state.calls)
+    client = CapeClient('http://127.0.0.1:1/api', retry_policy=RetryPolicy(max_attempts=1),
+                        replayer=TrafficReplayer(path))
+    client.login(USERNAME, PASSWORD)
+    assert client.logged_in()
+    assert client.add_document('Welcome', document_text * 10, document_id='welcome') == 'welcome'
+    assert client.answer('How easy is this API to use?') == answers
+    assert client.get_user_token() == REDACTED
+    with pytest.raises(CapeTransportError):
+        client.get_profile()
+    with pytest.raises(CapeException):
+        client.get_profile()
+    assert len(local_server.state.calls) == calls
+
+
+def test_replay_matching_and_speed(tmpdir):
+    path = str(tmpdir.join('traffic.jsonl'))
+    with open(path, 'w') as fh:
+        for question, latency in (('first', 0.2), ('second', 0.4)):
+            body = json.dumps({'success': True, 'result': {'items': [{'answerText': question}]}})
+            parameters = recorded_parameters(answer_parameters(question, None, None, None, 'all', 'balanced', 1, 0,
+                                                               None, True))
+            fh.write(json.dumps({'method': 'answer', 'parameters': parameters, 'offset': 0,
+                                 'latency': latency, 'status': 200, 'body': body}) + '\n')
+    replayer = TrafficReplayer(path, speed=4, repeat=True)
+    client = CapeClient('http://127.0.0.1:1/api', admin_token='token', replayer=replayer)
+    started = time.monotonic()
+    assert client.answer('second')[0]['answerText'] == 'second'
+    assert 0.1 <= time.monotonic() - started < 0.3
+    assert client.answer('first')[0]['answerText'] == 'first'
+    assert client.answer('first')[0]['answerText'] == 'first'
+    # Unrecorded parameters fall back to the recorded responses for the same method
+    assert client.answer('third')[0]['answerText'] in ('first', 'second')
+
+
+def test_async_record_and_replay(local_server, tmpdir):
+    path = str(tmpdir.join('traffic.jsonl'))
+
+    async def scenario(**kwargs):
+        async with AsyncCapeClient(kwargs.pop('api_base', local_server.api_base), **kwargs) as client:
+            await client.login(USERNAME, PASSWORD)
+            return await client.get_profile()
+
+    loop = asyncio.new_event_loop()
+    try:
+        with TrafficRecorder(path) as recorder:
+            profile = loop.run_until_complete(scenario(recorder=recorder))
+        replayed = loop.run_until_complete(scenario(api_base='http://127.0.0.1:1/api',
+                                                    replayer=TrafficReplayer(path)))
+    finally:
+        loop.close()
+    assert replayed == profile
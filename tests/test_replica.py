@@ -0,0 +1,125 @@
+import time
+from unittest.mock import patch
+from cape.client import LocalReplica
+from .fixtures import local_server, local_cc
+
+
+def seed(local_cc):
+    text = 'Cape answers questions about documents.'
+    local_cc.add_saved_reply('How old are you?', 'Eighteen')
+    reply_id = local_cc.add_saved_reply('What colour is the sky?', 'Blue')['replyId']
+    local_cc.add_paraphrase_question(reply_id, 'Which colour is the sky?')
+    local_cc.add_document('About', text, document_id='about')
+    local_cc.add_annotation('What does Cape answer?', 'questions about documents', 'about', 13, 38,
+                            metadata={'page': 2})
+    return reply_id
+
+
+def wait_until_refreshed(replica):
+    deadline = time.monotonic() + 5
+    while replica._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_search_locally(local_server, local_cc):
+    reply_id = seed(local_cc)
+    replica = LocalReplica(local_cc)
+    assert replica.get_saved_replies()['totalItems'] == 2
+    calls = len(local_server.state.calls)
+
+    assert [item['id'] for item in replica.get_saved_replies('colo')['items']] == [reply_id]
+    assert replica.get_saved_replies('WHICH sky')['totalItems'] == 1
+    assert replica.get_saved_replies('eigh')['items'][0]['canonicalQuestion'] == 'How old are you?'
+    assert replica.get_saved_replies('sky old')['totalItems'] == 0
+    assert replica.get_saved_replies('', number_of_items=1, offset=1)['items'][0]['canonicalQuestion'] == \
+        'How old are you?'
+    assert replica.saved_reply(reply_id)['answers'][0]['answer'] == 'Blue'
+    assert replica.saved_reply('missing') is None
+    assert replica.get_annotations('documents', pages=[2])['totalItems'] == 1
+    assert replica.get_annotations('documents', document_ids=['other'])['totalItems'] == 0
+    assert len(local_server.state.calls) == calls
+
+
+def test_follows_client_changes(local_server, local_cc):
+    reply_id = seed(local_cc)
+    replica = LocalReplica(local_cc, refresh_interval=None)
+    replica.get_saved_replies()
+
+    new_id = local_cc.add_saved_reply('Where do you live?', 'In the cloud')['replyId']
+    question_id = local_cc.add_paraphrase_question(reply_id, 'What colour is the heavens?')
+    local_cc.edit_paraphrase_question(question_id, 'What hue is the sky?')
+    annotation_id = replica.get_annotations()['items'][0]['id']
+    local_cc.add_annotation_paraphrase_question(annotation_id, 'What is Cape for?')
+    assert replica.get_saved_replies()['items'][0]['id'] == new_id
+    assert replica.get_saved_replies('hue')['items'][0]['id'] == reply_id
+    assert replica.get_saved_replies('heavens')['totalItems'] == 0
+    assert replica.get_annotations('for')['totalItems'] == 1
+
+    local_cc.delete_saved_reply(new_id)
+    assert replica.saved_reply(new_id) is None
+    local_cc.delete_document('about')
+    # The stand-in server doesn't delete a document's annotations with it
+    local_server.state.annotations.clear()
+    assert replica.get_annotations()['totalItems'] == 0
+
+    replica.close()
+    local_cc.delete_saved_reply(reply_id)
+    assert replica.saved_reply(reply_id) is not None
+
+
+def test_periodic_refresh(local_server, local_cc):
+    seed(local_cc)
+    replica = LocalReplica(local_cc, refresh_interval=0.05)
+    assert replica.get_saved_replies()['totalItems'] == 2
+    # Changes made by other clients appear after the next refresh, which happens in the background
+    local_server.state.add_saved_reply({'question': 'Who made you?', 'answer': 'Cape'}, None)
+    time.sleep(0.1)
+    replica.get_saved_replies()
+    deadline = time.monotonic() + 5
+    while replica.get_saved_replies()['totalItems'] != 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert replica.get_saved_replies('made')['totalItems'] == 1
+
+
+def test_answer_locally(local_server, local_cc):
+    reply_id = seed(local_cc)
+    replica = LocalReplica(local_cc, answer_locally=True)
+    fetch_all_saved_replies = local_cc.fetch_all_saved_replies
+
+    def slow_fetch(*args, **kwargs):
+        time.sleep(0.5)
+        return fetch_all_saved_replies(*args, **kwargs)
+
+    # The replica is loaded in the background, answer() doesn't wait for it
+    with patch.object(local_cc, 'fetch_all_saved_replies', side_effect=slow_fetch):
+        started = time.monotonic()
+        remote = local_cc.answer('What colour is the sky?', source_type='saved_reply')
+        assert time.monotonic() - started < 0.5
+        assert local_server.state.calls[-1] == 'answer'
+        wait_until_refreshed(replica)
+    calls = len(local_server.state.calls)
+
+    for question in ('What colour is the sky?', '  which COLOUR is the sky', 'what colour, is the sky?!'):
+        assert local_cc.answer(question) == remote
+    assert local_cc.answer('Which colour is the sky?', source_type='saved_reply')[0]['sourceId'] == reply_id
+    assert len(local_server.state.calls) == calls
+
+    # Anything else is answered by the API
+    local_cc.answer('What colour is the sea?')
+    local_cc.answer('What colour is the sky?', number_of_items=2)
+    local_cc.answer('What colour is the sky?', source_type='document')
+    assert local_server.state.calls[calls:] == ['answer'] * 3
+
+    # Edits made through the client are picked up before the next answer
+    local_cc.edit_canonical_question(reply_id, 'What colour is the sea?')
+    local_cc.add_answer(reply_id, 'Green')
+    assert local_cc.answer('What colour is the sea?')[0]['answerText'] == 'Blue'
+    # A question matching more than one saved reply is answered by the API
+    local_cc.add_saved_reply('Which colour is the sky?', 'Grey')
+    calls = len(local_server.state.calls)
+    local_cc.answer('Which colour is the sky?')
+    assert local_server.state.calls[calls:] == ['saved-replies/get-saved-replies', 'answer']
+
+    replica.close()
+    local_cc.answer('What colour is the sea?')
+    assert local_server.state.calls[-1] == 'answer'
@@ -0,0 +1,32 @@
+import pytest
+from unittest.mock import patch
+from cape.client import CapeException
+from cape.client import utils
+from cape.client.response import ApiResponse
+from .fixtures import local_server, local_cc
+
+
+def test_response_result():
+    response = ApiResponse(200, {'success': True, 'result': {'documentId': 'doc1'}})
+    assert response.raise_for_failure() is response
+    assert response.result['documentId'] == 'doc1'
+
+
+def test_response_failure():
+    with pytest.raises(CapeException) as excinfo:
+        ApiResponse(200, {'success': False, 'result': {'message': 'Nope'}}).raise_for_failure()
+    assert excinfo.value.message == 'Nope'
+    with pytest.raises(CapeException):
+        ApiResponse(500, {'success': True, 'result': {'message': 'Nope'}}).raise_for_failure()
+
+
+def test_json_loads():
+    assert utils.json_loads(b'{"success": true, "result": [1, 2]}') == {'success': True, 'result': [1, 2]}
+    assert utils.JSON_BACKEND in ('orjson', 'ujson', 'json')
+
+
+def test_body_decoded_once(local_cc):
+    with patch('cape.client.client.json_loads', wraps=utils.json_loads) as json_loads:
+        local_cc.get_documents()
+        local_cc.get_profile()
+    assert json_loads.call_count == 2
@@ -0,0 +1,126 @@
+import time
+import pytest
+from unittest.mock import patch
+from cape.client import CapeClient, CapeException, CapeTransportError, CircuitBreaker, CircuitOpenError, RetryPolicy
+from cape.client.retry import is_replayable, parse_retry_after
+from .fixtures import local_server, local_cc
+from .local_server import USERNAME, PASSWORD
+
+
+def fast_policy(**kwargs):
+    return RetryPolicy(backoff=0.001, max_backoff=0.01, **kwargs)
+
+
+def test_retry_delays():
+    policy = RetryPolicy(max_attempts=5, backoff=0.5, max_backoff=1.5, jitter=False)
+    started = time.monotonic()
+    assert [policy.next_delay(attempt, started) for attempt in range(1, 6)] == [0.5, 1.0, 1.5, 1.5, None]
+    jittered = RetryPolicy(backoff=1.0)
+    assert all(0 <= jittered.next_delay(2, started) <= 2.0 for _ in range(100))
+
+
+def test_retry_budget():
+    policy = RetryPolicy(max_attempts=10, backoff=1.0, jitter=False, budget=2.5)
+    started = time.monotonic()
+    assert policy.next_delay(1, started) == 1.0
+    assert policy.next_delay(2, started) == 2.0
+    assert policy.next_delay(2, started - 1) is None
+    retry_after = CapeTransportError('Slow down', 429, retry_after=2.0)
+    assert policy.next_delay(1, started, retry_after) == 2.0
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') is None
+
+
+def test_can_retry():
+    policy = RetryPolicy()
+    assert policy.can_retry('answer', {'question': 'Hello?', 'numberOfItems': '1'})
+    assert policy.can_retry('documents/get-documents', {})
+    assert not policy.can_retry('documents/add-document', {'text': 'Hello'})
+    assert not RetryPolicy(max_attempts=1).can_retry('answer', {})
+    assert not is_replayable({'text': iter([b'chunk'])})
+
+
+def test_retries_transient_failures(local_server):
+    client = CapeClient(local_server.api_base, retry_policy=fast_policy())
+    client.login(USERNAME, PASSWORD)
+    local_server.failures.extend([502, 'reset'])
+    assert client.get_documents()['totalItems'] == 0
+    assert local_server.state.calls[-3:] == ['documents/get-documents'] * 3
+
+
+def test_retries_exhausted(local_server):
+    client = CapeClient(local_server.api_base, retry_policy=fast_policy(max_attempts=2))
+    client.login(USERNAME, PASSWORD)
+    local_server.failures.extend([503, 503])
+    with pytest.raises(CapeTransportError) as excinfo:
+        client.get_profile()
+    assert excinfo.value.status_code == 503
+    assert local_server.state.calls.count('user/get-profile') == 2
+
+
+def test_no_retry_for_writes_and_api_errors(local_server, local_cc):
+    local_cc.retry_policy = fast_policy()
+    local_server.failures.append(502)
+    with pytest.raises(CapeTransportError):
+        local_cc.add_document('Title', 'Some text.')
+    assert local_server.state.calls.count('documents/add-document') == 1
+    with pytest.raises(CapeException) as excinfo:
+        CapeClient(local_server.api_base, retry_policy=fast_policy()).get_profile()
+    assert not isinstance(excinfo.value, CapeTransportError)
+    assert local_server.state.calls.count('user/get-profile') == 1
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10)
+    with patch('cape.client.retry.time.monotonic', return_value=100.0):
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+    with patch('cape.client.retry.time.monotonic', return_value=110.0):
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+    with patch('cape.client.retry.time.monotonic', return_value=120.0):
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_call()
+
+
+def test_client_circuit_breaker(local_server):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.2)
+    client = CapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=1), circuit_breaker=breaker)
+    client.login(USERNAME, PASSWORD)
+    local_server.failures.extend([502, 502])
+    for _ in range(2):
+        with pytest.raises(CapeTransportError):
+            client.get_profile()
+    calls = len(local_server.state.calls)
+    with pytest.raises(CircuitOpenError):
+        client.get_profile()
+    assert len(local_server.state.calls) == calls
+    time.sleep(0.2)
+    assert client.get_profile()['username'] == USERNAME
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_abandoned_probe_releases_circuit_breaker(local_server):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+    client = CapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=1), circuit_breaker=breaker)
+    client.login(USERNAME, PASSWORD)
+    local_server.failures.append(502)
+    with pytest.raises(CapeTransportError):
+        client.get_profile()
+    time.sleep(0.05)
+    with patch.object(client, '_exchange', side_effect=TypeError('Unable to encode the body')):
+        with pytest.raises(TypeError):
+            client.get_profile()
+    assert client.get_profile()['username'] == USERNAME
+    assert breaker.state == CircuitBreaker.CLOSED
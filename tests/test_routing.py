@@ -0,0 +1,110 @@
+import pytest
+from cape.client import CapeClient, CapeTransportError, EndpointRouter
+from .local_server import LocalCapeServer, USERNAME, PASSWORD
+
+
+@pytest.fixture
+def servers():
+    servers = [LocalCapeServer(latency=0.02).start(), LocalCapeServer().start()]
+    yield servers
+    for server in servers:
+        if server._thread.is_alive():
+            server.stop()
+
+
+def routed_client(servers):
+    cc = CapeClient([server.api_base for server in servers])
+    cc.router.probe_interval = None
+    return cc
+
+
+def test_router_prefers_healthy_fast_endpoints():
+    router = EndpointRouter(['http://a/api/0.1', 'http://b/api/0.1'], probe_interval=None)
+    a, b = router.endpoints
+    assert router.choose() is a
+    router.record_latency(a, 0.2)
+    router.record_latency(b, 0.1)
+    assert router.choose() is b
+    router.record_latency(b, 0.5)
+    assert b.latency == pytest.approx(0.22)
+    assert router.choose() is a
+    router.record_failure(a)
+    assert router.choose() is b
+    assert router.choose(exclude=[b]) is a
+    router.record_failure(b)
+    assert router.choose() is a
+    assert router.endpoint_for('http://b/api/0.1/answer?token=x') is b
+
+
+def test_routes_to_fastest_endpoint(servers):
+    slow, fast = servers
+    cc = routed_client(servers)
+    cc.router.probe()
+    assert [endpoint['healthy'] for endpoint in cc.router.stats()] == [True, True]
+    assert cc.router.stats()[0]['latency'] > cc.router.stats()[1]['latency']
+    cc.login(USERNAME, PASSWORD)
+    cc.get_profile()
+    assert fast.state.calls[-2:] == ['user/login', 'user/get-profile']
+    assert 'user/login' not in slow.state.calls
+
+
+def test_fails_over_with_a_session_per_endpoint(servers):
+    first, second = servers
+    cc = routed_client(servers)
+    cc.login(USERNAME, PASSWORD)
+    assert first.state.calls == ['user/login']
+    first.stop()
+    # Drop the pooled connection the stopped server would otherwise keep serving
+    cc.session.close()
+    # The second endpoint has its own session, created the first time a call is sent to it
+    assert cc.get_profile()['username'] == USERNAME
+    assert second.state.calls == ['user/login', 'user/get-profile']
+    assert [endpoint['healthy'] for endpoint in cc.router.stats()] == [False, True]
+    cc.answer('How old are you?')
+    assert second.state.calls[-1] == 'answer'
+    cc.logout()
+    assert second.state.calls[-1] == 'user/logout'
+    assert not cc.logged_in()
+
+
+def test_probe_marks_recovered_endpoints_healthy(servers):
+    first, second = servers
+    cc = routed_client(servers)
+    cc.router.record_failure(cc.router.endpoints[0])
+    cc.login(USERNAME, PASSWORD)
+    assert second.state.calls == ['user/login']
+    cc.router.probe()
+    assert cc.router.endpoints[0].healthy
+
+
+def test_login_and_mutations_fail_over_when_unreachable(servers):
+    first, second = servers
+    first.stop()
+    cc = routed_client(servers)
+    cc.login(USERNAME, PASSWORD)
+    assert second.state.calls == ['user/login']
+    cc.router.endpoints[0].healthy = True
+    cc.session.close()
+    # The request was never sent to the first endpoint, so it's safe to send a mutation to the second
+    cc.add_saved_reply('How old are you?', 'Very old')
+    assert second.state.calls[-1] == 'saved-replies/add-saved-reply'
+
+
+def test_mutations_do_not_fail_over_once_sent(servers):
+    first, second = servers
+    cc = routed_client(servers)
+    cc.login(USERNAME, PASSWORD)
+    first.failures.append(502)
+    with pytest.raises(CapeTransportError):
+        cc.add_saved_reply('How old are you?', 'Very old')
+    assert second.state.calls == []
+
+
+def test_client_accepts_a_router_and_closes_it(servers):
+    router = EndpointRouter(['%s/0.1' % server.api_base for server in servers], probe_interval=0.01)
+    with CapeClient(router) as cc:
+        assert cc.router is router
+        cc.login(USERNAME, PASSWORD)
+        assert router._prober.is_alive()
+    router._prober.join(1)
+    assert not router._prober.is_alive()
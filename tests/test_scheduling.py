@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+from cape.client import CapeClient, CapeException, PriorityScheduler
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+
+def acquire_in_thread(scheduler, priority, order):
+    def acquire():
+        scheduler.acquire(priority)
+        order.append(priority)
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    return thread
+
+
+def wait_for_waiting(scheduler, count):
+    deadline = time.monotonic() + 2
+    while sum(scheduler.stats()['waiting'].values()) < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_reserved_slots():
+    scheduler = PriorityScheduler(slots=2, reserved=1)
+    scheduler.acquire('bulk')
+    order = []
+    thread = acquire_in_thread(scheduler, 'bulk', order)
+    wait_for_waiting(scheduler, 1)
+    # The bulk call waits while the last slot is kept for an interactive call
+    scheduler.acquire('interactive')
+    assert order == []
+    scheduler.release()
+    scheduler.release()
+    thread.join(1)
+    assert order == ['bulk']
+
+
+def test_interactive_calls_overtake_queued_bulk_calls():
+    scheduler = PriorityScheduler(slots=1, reserved=0)
+    scheduler.acquire('bulk')
+    order = []
+    threads = []
+    for i, priority in enumerate(('bulk', 'bulk', 'normal', 'interactive')):
+        threads.append(acquire_in_thread(scheduler, priority, order))
+        wait_for_waiting(scheduler, i + 1)
+    assert scheduler.stats()['waiting'] == {'interactive': 1, 'normal': 1, 'bulk': 2}
+    for i in range(len(threads)):
+        scheduler.release()
+        deadline = time.monotonic() + 2
+        while len(order) <= i and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(1)
+    assert order == ['interactive', 'normal', 'bulk', 'bulk']
+    assert scheduler.stats()['overtaken'] == 5
+    assert scheduler.stats()['sent'] == {'interactive': 1, 'normal': 1, 'bulk': 3}
+
+
+def test_priorities():
+    scheduler = PriorityScheduler(priorities={'inbox/get-inbox': 'bulk'})
+    assert scheduler.priority('answer') == 'interactive'
+    assert scheduler.priority('documents/add-document') == 'bulk'
+    assert scheduler.priority('inbox/get-inbox') == 'bulk'
+    assert scheduler.priority('user/get-profile') == 'normal'
+    assert scheduler.priority('answer', 'bulk') == 'bulk'
+    with pytest.raises(CapeException):
+        scheduler.priority('answer', 'urgent')
+    with pytest.raises(CapeException):
+        PriorityScheduler(slots=2, reserved=2)
+
+
+def test_client_priority_hints(local_server):
+    scheduler = PriorityScheduler(slots=2, reserved=1)
+    cc = CapeClient(local_server.api_base, scheduler=scheduler)
+    cc.login(USERNAME, PASSWORD)
+    cc.answer('How old are you?')
+    cc.get_profile()
+    with cc.priority('bulk'):
+        cc.get_profile()
+        # Calls made by the client's worker threads inherit the priority
+        cc.fetch_all_documents(page_size=1, max_concurrency=2)
+    with pytest.raises(CapeException):
+        with cc.priority('urgent'):
+            pass
+    assert scheduler.stats()['sent'] == {'interactive': 2, 'normal': 1, 'bulk': 2}
+
+
+def test_interactive_calls_skip_bulk_queue(local_server):
+    scheduler = PriorityScheduler(slots=2, reserved=1)
+    cc = CapeClient(local_server.api_base, scheduler=scheduler)
+    cc.login(USERNAME, PASSWORD)
+    # Only the first bulk call is slow, the others wait for it
+    local_server.delays = [0.5]
+
+    def bulk_work():
+        with cc.priority('bulk'):
+            cc.get_profile()
+
+    threads = [threading.Thread(target=bulk_work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiting(scheduler, 3)
+    started = time.monotonic()
+    cc.answer('How old are you?')
+    assert time.monotonic() - started < 0.25
+    assert scheduler.stats()['waiting']['bulk'] == 3
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from cape.client import AsyncCapeClient, CapeException
+from cape.client.sharding import merge_answer_items, shard_document_ids
+from .fixtures import local_server, local_cc
+from .local_server import USERNAME, PASSWORD
+
+QUESTION = 'How fast is the Cape API?'
+
+
+def seed(local_server, count=10):
+    document_ids = []
+    for i in range(count):
+        text = 'The Cape API is fast. Document %d is about the Cape API. Nothing %d here.' % (i, i)
+        document_ids.append(local_server.state.add_document({'title': 'doc%d' % i, 'text': text,
+                                                             'documentId': 'doc%d' % i}, None)['documentId'])
+    local_server.state.add_saved_reply({'question': 'How fast is the API?', 'answer': 'Very fast'}, None)
+    return document_ids
+
+
+def summary(items):
+    return [(item['sourceType'], item['sourceId'], item['answerText'], item['confidence']) for item in items]
+
+
+def test_shard_document_ids():
+    assert shard_document_ids(['a', 'b', 'c'], 2) == [['a', 'b'], ['c']]
+    with pytest.raises(CapeException):
+        shard_document_ids(['a'], 0)
+
+
+def test_merge_answer_items():
+    saved_reply = {'sourceType': 'saved_reply', 'sourceId': 'r', 'answerText': 'Yes', 'confidence': 0.9}
+    first = [saved_reply, {'sourceType': 'document', 'sourceId': 'a', 'answerText': 'A', 'confidence': 0.5}]
+    second = [dict(saved_reply), {'sourceType': 'document', 'sourceId': 'b', 'answerText': 'B', 'confidence': 0.7}]
+    assert [item['sourceId'] for item in merge_answer_items([first, second], 3, 0)] == ['r', 'b', 'a']
+    assert [item['sourceId'] for item in merge_answer_items([first, second], 1, 1)] == ['b']
+
+
+@pytest.mark.parametrize('source_type', ['all', 'document'])
+def test_sharded_answer_matches_single_request(local_server, local_cc, source_type):
+    document_ids = seed(local_server)
+    for number_of_items, offset in ((1, 0), (5, 0), (4, 7), (50, 0)):
+        expected = local_cc.answer(QUESTION, document_ids=document_ids, source_type=source_type,
+                                   number_of_items=number_of_items, offset=offset, text='The Cape API is fast.')
+        calls = len(local_server.state.calls)
+        items = local_cc.answer(QUESTION, document_ids=document_ids, source_type=source_type,
+                                number_of_items=number_of_items, offset=offset, text='The Cape API is fast.',
+                                shard_size=3, max_concurrency=2)
+        assert summary(items) == summary(expected)
+        assert local_server.state.calls[calls:] == ['answer'] * 4
+
+
+def test_small_requests_are_not_sharded(local_server, local_cc):
+    document_ids = seed(local_server, 3)
+    calls = len(local_server.state.calls)
+    local_cc.answer(QUESTION, document_ids=document_ids, shard_size=3)
+    local_cc.answer(QUESTION, shard_size=3)
+    assert local_server.state.calls[calls:] == ['answer'] * 2
+
+
+def test_async_sharded_answer(local_server, local_cc):
+    document_ids = seed(local_server)
+    expected = local_cc.answer(QUESTION, document_ids=document_ids, number_of_items=6)
+
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login(USERNAME, PASSWORD)
+            return await client.answer(QUESTION, document_ids=document_ids, number_of_items=6, shard_size=4)
+
+    loop = asyncio.new_event_loop()
+    try:
+        items = loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert summary(items) == summary(expected)
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import io
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from cape.client import AsyncCapeClient, CapeClient, CapeException
+from cape.client.streaming import MultipartStream
+from .fixtures import local_server, local_cc
+from .local_server import USERNAME, PASSWORD
+
+document_text = "Welcome to the Cape API 0.1. Hopefully it's pretty easy to use."
+document_bytes = document_text.encode('utf-8')
+document_id = hashlib.sha256(document_bytes).hexdigest()
+
+
+def stored_text(local_server, stored_id):
+    return local_server.state.documents[stored_id]['text']
+
+
+@pytest.mark.parametrize('text', [
+    document_text,
+    document_bytes,
+    bytearray(document_bytes),
+    memoryview(document_bytes),
+    io.BytesIO(document_bytes),
+    [document_bytes[:10], document_text[10:]],
+])
+def test_upload_types(local_server, local_cc, text):
+    assert local_cc.add_document("Cape API Documentation", text) == document_id
+    assert stored_text(local_server, document_id) == document_text
+
+
+def test_upload_generator(local_server, local_cc):
+    chunks = (document_bytes[i:i + 7] for i in range(0, len(document_bytes), 7))
+    upload_cb = Mock()
+    assert local_cc.add_document("Cape API Documentation", chunks, monitor_callback=upload_cb) == document_id
+    assert upload_cb.call_args[0][0].len is None
+
+
+def test_upload_non_ascii(local_server, local_cc):
+    text = 'Ünïcödé text ☃ ' * 10000
+    stored_id = local_cc.add_document("Unicode", text)
+    assert stored_id == hashlib.sha256(text.encode('utf-8')).hexdigest()
+    assert stored_text(local_server, stored_id) == text
+
+
+def test_large_file_upload(local_server, local_cc, tmpdir):
+    file_path = str(tmpdir.join('large_cape_api.txt'))
+    with open(file_path, 'w') as fh:
+        fh.write(document_text * 100000)
+    upload_cb = Mock()
+    stored_id = local_cc.add_document("Cape API Large Document", file_path=file_path, monitor_callback=upload_cb)
+    assert stored_id == hashlib.sha256((document_text * 100000).encode('utf-8')).hexdigest()
+    monitor = upload_cb.call_args[0][0]
+    assert monitor.bytes_read == monitor.len
+    assert upload_cb.call_count > 10
+
+
+def test_file_closed_on_error(local_server, tmpdir):
+    file_path = str(tmpdir.join('cape_api.txt'))
+    with open(file_path, 'w') as fh:
+        fh.write(document_text)
+    handles = []
+
+    def tracking_open(*args, **kwargs):
+        handles.append(open(*args, **kwargs))
+        return handles[-1]
+    cc = CapeClient(local_server.api_base)
+    with patch('cape.client.client.open', tracking_open, create=True):
+        with pytest.raises(CapeException):
+            cc.add_document("Cape API Documentation", file_path=file_path)
+    assert handles[0].closed
+
+
+def test_stream_length():
+    fields = {'title': 'Title', 'text': 'Ünïcödé', 'file': io.BytesIO(b'abc'), 'view': memoryview(b'de')}
+    stream = MultipartStream(fields, chunk_size=2)
+    body = b''.join(bytes(chunk) for chunk in stream)
+    assert stream.len == len(body) == stream.bytes_read
+    assert body.endswith(('--%s--\r\n' % stream.boundary).encode('utf-8'))
+
+
+def test_stream_reuses_buffer():
+    stream = MultipartStream({'text': io.BytesIO(b'x' * 10)}, chunk_size=4)
+    chunks = list(stream)
+    assert chunks[1].obj is chunks[2].obj
+
+
+def test_async_upload_types(local_server):
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login(USERNAME, PASSWORD)
+            return [await client.add_document("Cape API Documentation", text, replace=True)
+                    for text in (document_bytes, io.BytesIO(document_bytes), [document_bytes])]
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(scenario()) == [document_id] * 3
+    finally:
+        loop.close()
+
+
+def test_async_upload_reads_files_off_the_event_loop(local_server):
+    readers = set()
+
+    class RecordingFile(io.BytesIO):
+        def read(self, *args):
+            readers.add(threading.current_thread())
+            return super().read(*args)
+
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base) as client:
+            await client.login(USERNAME, PASSWORD)
+            return await client.add_document("Cape API Documentation", RecordingFile(document_bytes))
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(scenario()) == document_id
+    finally:
+        loop.close()
+    assert readers and threading.current_thread() not in readers
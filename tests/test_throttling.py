@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+import pytest
+from cape.client import AIMDLimiter, AsyncCapeClient, CapeClient, CapeTransportError, RateLimiter, RetryPolicy
+from cape.client.throttling import TokenBucket
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+
+def test_token_bucket():
+    bucket = TokenBucket(10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    # Later callers are paced in the order they arrived
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_rate_limiter_per_method():
+    limiter = RateLimiter({'answer': (10, 1)}, default_rate=100)
+    assert limiter.reserve('answer') == 0.0
+    assert limiter.reserve('answer') > 0.05
+    assert limiter.reserve('documents/get-documents') == 0.0
+    assert RateLimiter().reserve('answer') == 0.0
+
+
+def test_client_rate_limit(local_server):
+    cc = CapeClient(local_server.api_base, rate_limiter=RateLimiter({'answer': (20, 1)}))
+    cc.login(USERNAME, PASSWORD)
+    started = time.monotonic()
+    for _ in range(5):
+        cc.answer('How old are you?')
+    assert time.monotonic() - started >= 0.19
+
+
+def test_aimd_increases_while_saturated():
+    limiter = AIMDLimiter(initial_limit=2, max_limit=3)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.acquire()
+        limiter.release('answer', 0.01)
+        limiter.release('answer', 0.01)
+    assert limiter.limit == 3
+    # A limit that isn't being used doesn't grow
+    limiter = AIMDLimiter(initial_limit=4)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release('answer', 0.01)
+    assert limiter.limit == 4
+
+
+def test_aimd_decreases_once_per_overload():
+    limiter = AIMDLimiter(initial_limit=16)
+    for _ in range(8):
+        limiter.acquire()
+    time.sleep(0.02)
+    for _ in range(8):
+        limiter.release('documents/add-document', 0.02, CapeTransportError('Unavailable', 503))
+    assert limiter.stats() == {'limit': 8, 'in_flight': 0, 'decreases': 1}
+    limiter.acquire()
+    limiter.release('documents/add-document', 0.0, CapeTransportError('Unavailable', 503))
+    assert limiter.limit == 4
+
+
+def test_aimd_decreases_when_latency_rises():
+    limiter = AIMDLimiter(initial_limit=8, min_samples=5)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release('answer', 0.01)
+    # Slow uploads don't count, slow answers do
+    limiter.acquire()
+    limiter.release('documents/add-document', 0.5)
+    assert limiter.limit == 8
+    limiter.acquire()
+    limiter.release('answer', 0.05)
+    assert limiter.limit == 4
+
+
+def test_aimd_blocks_threads_and_tasks():
+    limiter = AIMDLimiter(initial_limit=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+
+    threading.Thread(target=acquire).start()
+    assert not acquired.wait(0.05)
+    limiter.release('answer', None)
+    assert acquired.wait(1)
+
+    async def scenario():
+        task = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        threading.Timer(0.01, limiter.release, args=('answer', None)).start()
+        await asyncio.wait_for(task, 1)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert limiter.in_flight == 1
+
+
+def test_client_backs_off_on_overload(local_server):
+    limiter = AIMDLimiter(initial_limit=8)
+    cc = CapeClient(local_server.api_base, retry_policy=RetryPolicy(max_attempts=2, backoff=0.0),
+                    concurrency_limiter=limiter)
+    cc.login(USERNAME, PASSWORD)
+    local_server.failures = [503]
+    cc.get_profile()
+    assert limiter.stats() == {'limit': 4, 'in_flight': 0, 'decreases': 1}
+
+
+def test_async_client_shares_limiter(local_server):
+    limiter = AIMDLimiter(initial_limit=2)
+    rate_limiter = RateLimiter(default_rate=1000)
+
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base, concurrency_limiter=limiter,
+                                   rate_limiter=rate_limiter) as client:
+            await client.login(USERNAME, PASSWORD)
+            await asyncio.gather(*[client.get_profile() for _ in range(6)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert limiter.in_flight == 0 and limiter.limit >= 2
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from cape.client import AsyncCapeClient, CapeClient, CapeException, OpenTelemetryTracer, RetryPolicy, Tracer
+from cape.client.instrumentation import REDACTED, redact_url
+from .fixtures import local_server
+from .local_server import USERNAME, PASSWORD
+
+
+class RecordingTracer(Tracer):
+
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    def call_started(self, call):
+        self.started.append(call.method)
+        call.headers['X-Request-Tag'] = call.method
+
+    def call_finished(self, call):
+        self.finished.append(call)
+
+
+def test_redact_url():
+    assert redact_url('http://cape/api/0.1/answer?token=abc') == 'http://cape/api/0.1/answer?token=' + REDACTED
+    assert redact_url('http://cape/api/0.1/user/get-profile?adminToken=abc&x=1') == \
+        'http://cape/api/0.1/user/get-profile?adminToken=%s&x=1' % REDACTED
+
+
+def test_tracer_phases(local_server):
+    tracer = RecordingTracer()
+    client = CapeClient(local_server.api_base, tracer=tracer)
+    client.login(USERNAME, PASSWORD)
+    client.get_profile()
+    assert tracer.started == ['user/login', 'user/get-profile']
+    login, profile = tracer.finished
+    assert login.parameters == {'login': USERNAME, 'password': REDACTED}
+    assert login.status_code == 200 and login.error is None
+    assert set(login.phases) == {'connect', 'encode', 'send', 'wait', 'download', 'decode'}
+    # The second call reuses the pooled connection
+    assert set(profile.phases) == {'wait', 'download', 'decode'}
+    assert all(seconds >= 0 for call in tracer.finished for seconds in call.phases.values())
+    assert sum(login.phases.values()) <= login.latency
+    assert local_server.last_headers['X-Request-Tag'] == 'user/get-profile'
+
+
+def test_tracer_errors(local_server):
+    tracer = RecordingTracer()
+    client = CapeClient(local_server.api_base, admin_token='local-admin-token',
+                        retry_policy=RetryPolicy(max_attempts=1), tracer=tracer)
+    local_server.failures.append(502)
+    with pytest.raises(CapeException):
+        client.get_profile()
+    call = tracer.finished[0]
+    assert call.status_code == 502
+    assert call.error.status_code == 502
+    assert call.url.endswith('?adminToken=' + REDACTED)
+
+
+def test_async_tracer(local_server):
+    tracer = RecordingTracer()
+
+    async def scenario():
+        async with AsyncCapeClient(local_server.api_base, tracer=tracer) as client:
+            await client.login(USERNAME, PASSWORD)
+            await client.get_profile()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    login, profile = tracer.finished
+    assert login.parameters['password'] == REDACTED
+    assert set(login.phases) == {'connect', 'encode', 'send', 'wait', 'download', 'decode'}
+    assert 'connect' not in profile.phases
+    assert local_server.last_headers['X-Request-Tag'] == 'user/get-profile'
+
+
+def test_opentelemetry_tracer(local_server):
+    pytest.importorskip('opentelemetry.sdk')
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    client = CapeClient(local_server.api_base, tracer=OpenTelemetryTracer(provider.get_tracer('test')))
+    client.login(USERNAME, PASSWORD)
+    span, = exporter.get_finished_spans()
+    assert span.name == 'cape user/login'
+    assert span.attributes['cape.parameter.password'] == REDACTED
+    assert 'cape.phase.wait' in span.attributes
+    assert 'traceparent' in local_server.last_headers
@@ -0,0 +1,174 @@
+import io
+import json
+import pytest
+from cape.client import CapeException
+from cape.client.transfer import read_records, saved_reply_record
+from .fixtures import local_server, local_cc
+
+RECORDS = [{'question': 'How old are you?', 'answers': ['18', 'Eighteen'],
+            'paraphrase_questions': ['What is your age?', 'How many years old are you?']},
+           {'question': 'What colour is the sky?', 'answer': 'Blue'},
+           {'question': 'Where do you live?', 'answers': ['In the cloud'], 'paraphrase_questions': ['Where are you?']}]
+
+
+def write_jsonl(path, records):
+    with open(str(path), 'w') as fh:
+        for record in records:
+            fh.write(json.dumps(record) + '\n')
+    return str(path)
+
+
+def replies_by_question(local_server):
+    return {reply['canonicalQuestion']: reply for reply in local_server.state.saved_replies.values()}
+
+
+def normalised(record):
+    # Paraphrase questions are added concurrently so their order isn't preserved
+    record = saved_reply_record(record)
+    return dict(record, paraphrase_questions=sorted(record['paraphrase_questions']))
+
+
+def test_saved_reply_record():
+    assert saved_reply_record({'question': 'Q', 'answers': '["A", "B"]', 'paraphrase_questions': ''}) == \
+        {'question': 'Q', 'answers': ['A', 'B'], 'paraphrase_questions': []}
+    assert saved_reply_record({'question': 'Q', 'answer': '[Not JSON'})['answers'] == ['[Not JSON']
+    with pytest.raises(CapeException):
+        saved_reply_record({'question': 'Q', 'answers': []})
+
+
+def test_read_records_csv():
+    fh = io.StringIO('question,answers,paraphrase_questions\nQ,"[""A"", ""B""]",P\n')
+    fh.name = 'replies.csv'
+    assert list(read_records(fh)) == [{'question': 'Q', 'answers': '["A", "B"]', 'paraphrase_questions': 'P'}]
+
+
+def test_import_saved_replies(local_server, local_cc, tmpdir):
+    summary = local_cc.import_saved_replies(write_jsonl(tmpdir.join('replies.jsonl'), RECORDS), workers=2)
+    assert summary == {'imported': 3, 'skipped': 0, 'resumed': 0, 'failed': []}
+    replies = replies_by_question(local_server)
+    assert [answer['answer'] for answer in replies['How old are you?']['answers']] == ['18', 'Eighteen']
+    assert sorted(question['question'] for question in replies['How old are you?']['paraphraseQuestions']) == \
+        ['How many years old are you?', 'What is your age?']
+
+    # Importing again replaces answers without duplicating paraphrases
+    updated = [dict(RECORDS[0], answers=['Nineteen']), RECORDS[1]]
+    assert local_cc.import_saved_replies(updated)['imported'] == 2
+    replies = replies_by_question(local_server)
+    assert len(replies) == 3
+    assert [answer['answer'] for answer in replies['How old are you?']['answers']] == ['Nineteen']
+    assert len(replies['How old are you?']['paraphraseQuestions']) == 2
+
+    summary = local_cc.import_saved_replies(updated, replace=False)
+    assert summary['skipped'] == 2 and summary['imported'] == 0
+
+
+def test_import_saved_replies_failures(local_server, local_cc):
+    records = [RECORDS[0], {'question': 'No answers'}, RECORDS[1]]
+    summary = local_cc.import_saved_replies(records)
+    assert summary['imported'] == 2
+    failure, = summary['failed']
+    assert failure['index'] == 1 and failure['question'] == 'No answers'
+    assert isinstance(failure['error'], CapeException)
+
+
+def test_import_saved_replies_invalid_lines(local_server, local_cc, tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    source = io.StringIO('{"question": "A?", "answer": "a"}\nnot json\n[1, 2]\n{"question": "B?", "answer": "b"}\n')
+    summary = local_cc.import_saved_replies(source, checkpoint=checkpoint)
+    assert summary['imported'] == 2
+    assert [(failure['index'], failure['question']) for failure in summary['failed']] == [(1, None), (2, None)]
+    assert all(isinstance(failure['error'], CapeException) for failure in summary['failed'])
+    assert sorted(replies_by_question(local_server)) == ['A?', 'B?']
+    with open(checkpoint) as fh:
+        assert json.load(fh) == {'records_done': 4, 'failed': [1, 2]}
+
+
+def test_import_checkpoint_written_when_reading_fails(local_server, local_cc, tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+
+    def records():
+        yield RECORDS[0]
+        raise OSError('Unable to read the records')
+
+    with pytest.raises(OSError):
+        local_cc.import_saved_replies(records(), checkpoint=checkpoint)
+    with open(checkpoint) as fh:
+        assert json.load(fh) == {'records_done': 1}
+
+
+def test_import_saved_replies_resumes(local_server, local_cc, tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    with open(checkpoint, 'w') as fh:
+        json.dump({'records_done': 2}, fh)
+    summary = local_cc.import_saved_replies(RECORDS, checkpoint=checkpoint, checkpoint_interval=1)
+    assert summary == {'imported': 1, 'skipped': 0, 'resumed': 2, 'failed': []}
+    assert list(replies_by_question(local_server)) == ['Where do you live?']
+    with open(checkpoint) as fh:
+        assert json.load(fh) == {'records_done': 3}
+    assert local_cc.import_saved_replies(RECORDS, checkpoint=checkpoint)['imported'] == 0
+
+
+def test_import_saved_replies_retries_failures(local_server, local_cc, tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    records = [RECORDS[0], {'question': 'What colour is the sky?'}, RECORDS[2]]
+    summary = local_cc.import_saved_replies(records, checkpoint=checkpoint, checkpoint_interval=1)
+    assert summary['imported'] == 2 and summary['failed'][0]['index'] == 1
+    with open(checkpoint) as fh:
+        assert json.load(fh) == {'records_done': 3, 'failed': [1]}
+    summary = local_cc.import_saved_replies(RECORDS, checkpoint=checkpoint)
+    assert summary == {'imported': 1, 'skipped': 0, 'resumed': 2, 'failed': []}
+    assert sorted(replies_by_question(local_server)) == sorted(record['question'] for record in RECORDS)
+    with open(checkpoint) as fh:
+        assert json.load(fh) == {'records_done': 3}
+
+
+def test_export_saved_replies(local_server, local_cc, tmpdir):
+    local_cc.import_saved_replies(RECORDS)
+    for name in ('replies.jsonl', 'replies.csv'):
+        path = str(tmpdir.join(name))
+        assert local_cc.export_saved_replies(path, page_size=2) == 3
+        assert sorted(map(normalised, read_records(path)), key=str) == sorted(map(normalised, RECORDS), key=str)
+
+
+TEXT = 'Cape is a question answering API. It was founded in 2017.'
+
+
+def test_import_annotations(local_server, local_cc):
+    local_server.state.add_document({'title': 'about.txt', 'text': TEXT, 'documentId': 'about'}, None)
+    calls = len(local_server.state.calls)
+    records = [{'question': 'What is Cape?', 'answer': 'a question answering API', 'document_id': 'about',
+                'start_offset': 8, 'end_offset': 32, 'paraphrase_questions': ['What does Cape do?', 'Who is Cape?']},
+               {'question': 'When was Cape founded?', 'answer': 'in 2017', 'document_id': 'about',
+                'start_offset': '49', 'end_offset': '56', 'metadata': '{"page": 1}'},
+               {'question': 'Out of range', 'answer': 'x', 'document_id': 'about', 'start_offset': 50,
+                'end_offset': 500},
+               {'question': 'Wrong answer', 'answer': 'a database', 'document_id': 'about', 'start_offset': 8,
+                'end_offset': 32},
+               {'question': 'Missing document', 'answer': 'x', 'document_id': 'missing'},
+               {'question': 'Unanchored', 'answer': 'A free form answer', 'document_id': 'about'}]
+    summary = local_cc.import_annotations(records, workers=4)
+    assert summary['imported'] == 3
+    assert [(failure['index'], failure['question']) for failure in summary['failed']] == \
+        [(2, 'Out of range'), (3, 'Wrong answer'), (4, 'Missing document')]
+    assert all(isinstance(failure['error'], CapeException) for failure in summary['failed'])
+
+    annotations = {annotation['canonicalQuestion']: annotation
+                   for annotation in local_server.state.annotations.values()}
+    assert sorted(annotations) == ['Unanchored', 'What is Cape?', 'When was Cape founded?']
+    assert len(annotations['What is Cape?']['paraphraseQuestions']) == 2
+    assert annotations['When was Cape founded?']['metadata'] == {'page': 1}
+    # Each document's text is retrieved once and invalid records are never sent
+    methods = local_server.state.calls[calls:]
+    assert methods.count('documents/get-documents') == 2
+    assert methods.count('annotations/add-annotation') == 3
+
+
+def test_import_annotations_invalid_lines(local_server, local_cc):
+    local_server.state.add_document({'title': 'about.txt', 'text': TEXT, 'documentId': 'about'}, None)
+    source = io.StringIO('{"question": "What is Cape?", "answer": "Cape", "document_id": "about"}\n'
+                         '{"question": "Truncated", \n'
+                         '{"question": "When?", "answer": "2017", "document_id": "about"}\n')
+    summary = local_cc.import_annotations(source)
+    assert summary['imported'] == 2
+    failure, = summary['failed']
+    assert failure['index'] == 1 and isinstance(failure['error'], CapeException)